@@ -1,10 +1,14 @@
 import json
 
+from ProductDetailsStore import ProductDetailsStore
+
 class AdditionalInfoCombiner:
-    def __init__(self):
+    def __init__(self, workers: int = None):
         self.v4_data = "./product_details/get_product_detail_v4_2026-02-20.json"
         self.v5_data = "./product_details/get_product_detail_v5_2026-02-20.json"
         self.v6_data = "./product_details/get_product_detail_v6_2026-02-20.json"
+        self.store_path = "./product_details/store"
+        self.workers = workers
 
     def combine(self):
         with open(self.v4_data, "r") as f:
@@ -25,16 +29,18 @@ class AdditionalInfoCombiner:
         for brand_name, details in v6.items():
             combined[brand_name] = details
 
-        with open("./product_details/combined_product_details.json", "w") as f:
-            json.dump(combined, f, indent=2)
+        # One compact shard per brand plus a manifest, instead of a single indented file.
+        store = ProductDetailsStore.write(self.store_path, combined, workers=self.workers)
+        print(f"Wrote {len(store.bank_names())} brand shards to {self.store_path}")
 
     def create_additional_info_dict(self):
-        with open("./product_details/combined_product_details.json", "r") as f:
-            combined = json.load(f)
+        # One brand in memory at a time.
+        combined = ProductDetailsStore(self.store_path)
 
         fees_by_brand: dict[str, dict[str, list]] = {}
 
-        for brand_name, products in combined.items():
+        for brand_name in combined.bank_names():
+            products = combined.load(brand_name)
             if not isinstance(products, dict):
                 continue
 
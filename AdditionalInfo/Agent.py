@@ -2,19 +2,29 @@ import string
 
 import requests
 import sys
-import os
 from dotenv import load_dotenv
 import re
 import time
 import json
 import copy
 import argparse
+import asyncio
+import hashlib
+from dataclasses import dataclass
 from pathlib import Path
 
 load_dotenv()
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, Iterator, List, Tuple, Any, Optional
 
-from openai import OpenAI
+from ExtractionCache import ExtractionCache
+from ExtractionCheckpoint import ExtractionCheckpoint
+from FeeRuleEngine import FeeRuleEngine, match_fee_type
+from FeeTextIndex import FeeTextIndex
+from LLMBackend import LLMBackend, OpenAIBackend
+from ProductDetailsStore import open_product_details
+from RateLimitScheduler import RateLimitScheduler
+from SchemaValidator import SchemaValidator
+from UsageLedger import UsageLedger
 
 
 class _TerminalProgressBar:
@@ -53,6 +63,10 @@ class _TerminalProgressBar:
             self.stream.flush()
 
 
+def output_path_for(bank_name: str, suffix: str) -> Path:
+    return Path(f"output_{bank_name.replace(' ', '_').replace('.', '_')}_{suffix}.json")
+
+
 def _format_elapsed(seconds: float) -> str:
     seconds = int(max(0, seconds))
     hours = seconds // 3600
@@ -60,6 +74,73 @@ def _format_elapsed(seconds: float) -> str:
     secs = seconds % 60
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
+
+class _RunProgress:
+    """Progress of a run_agent call: products completed plus token usage so far."""
+
+    def __init__(self, bank_name: str, total_products: int):
+        self.bar = _TerminalProgressBar(total=total_products, prefix=f"{bank_name}: ", width=30)
+        self.started_at = time.time()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def update(self, products_done: int, usages: list) -> None:
+        # Update token counters (best-effort; depends on SDK/model support).
+        for usage in usages:
+            if usage is not None:
+                self.prompt_tokens += int(getattr(usage, "prompt_tokens", 0) or 0)
+                self.completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+
+        suffix = (
+            f"tok in/out: {self.prompt_tokens}/{self.completion_tokens} | "
+            f"elapsed: {_format_elapsed(time.time() - self.started_at)}"
+        )
+        self.bar.update(products_done, suffix=suffix)
+
+    def finish(self) -> None:
+        self.bar.finish()
+
+
+class _RunState:
+    """
+    Outcomes of a run slotted by (plan, job) index.
+
+    Notices when a product's last fee finishes, so completed products can be
+    checkpointed while the rest of the run is still in flight.
+    """
+
+    def __init__(self, agent, plans: list, progress: Optional[_RunProgress] = None, checkpoint: Optional[ExtractionCheckpoint] = None):
+        self.agent = agent
+        self.plans = plans
+        self.progress = progress
+        self.checkpoint = checkpoint
+        # Fees resolved by rules start out with their outcome in place.
+        self.outcomes = [[plan.get("resolved", {}).get(j) for j in range(len(plan["jobs"]))] for plan in plans]
+        self._remaining = [len(agent._pending_jobs(plan)) for plan in plans]
+        self._products_done = 0
+        self.usage_mark = agent.usage.mark()
+
+        for plan_index, remaining in enumerate(self._remaining):
+            if remaining == 0:
+                self._product_done(plan_index)
+
+    def _product_done(self, plan_index: int) -> None:
+        self._products_done += 1
+        if self.checkpoint is not None:
+            plan = self.plans[plan_index]
+            self.checkpoint.write_product(plan["product_id"], self.agent._assemble_product(plan, self.outcomes[plan_index]))
+
+    def record(self, chunk: list, chunk_outcomes: list, usages: list) -> None:
+        for (p, j), outcome in zip(chunk, chunk_outcomes):
+            self.outcomes[p][j] = outcome
+            self._remaining[p] -= 1
+            if self._remaining[p] == 0:
+                self._product_done(p)
+
+        if self.progress is not None:
+            self.progress.update(self._products_done, usages)
+
+
 # Sentinel used when a value cannot be found explicitly in the input text.
 NOT_FOUND = "NF"
 
@@ -67,8 +148,43 @@ NOT_FOUND = "NF"
 # mode 1: test consistency by running the same call 10 times and comparing results
 # mode 2: run the full agent on a specific bank (limited to 10 products for testing)
 # mode 3: run the full agent on a specific bank (no limit, can be time consuming)
+# mode 4: offline run of every bank (or BATCH_API_BANKS) through the OpenAI Batch API (results within 24h)
+# mode 5: run the full agent on every bank (or MULTI_BANK_NAMES) in one job, sharing one rate budget
+# mode 6: golden check of the rule fast path against a bank's previous full output (no model calls)
 MODE = 3
 
+# Banks for MODE 4 (None = every bank in the combined product details file).
+BATCH_API_BANKS = None
+
+# Banks for MODE 5 (None = every bank) and how many of them are processed at once.
+MULTI_BANK_NAMES = None
+MULTI_BANK_WORKERS = 4
+
+# Extract each distinct fee text once across all banks of a MODE 4/5 run (white-label brands share boilerplate).
+DEDUP_ACROSS_BANKS = True
+
+# Maximum number of LLM calls in flight when running the AsyncAgent (MODE 3/5).
+MAX_CONCURRENT_EXTRACTIONS = 8
+
+# Pass SCHEMA natively as a strict json_schema response format (MODE 3/5) instead of as prompt text.
+STRUCTURED_OUTPUTS = False
+
+# Account rate limits the LLM scheduler keeps extraction runs under.
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 200_000
+
+# Sharded product details written by AdditionalInfoCombiner (a combined JSON file path also works).
+PRODUCT_DETAILS_PATH = "product_details/store"
+
+# On-disk cache of raw model extractions (set to None to always call the model).
+EXTRACTION_CACHE_PATH = "cache/extraction_cache.sqlite3"
+
+# Every LLM call (tokens, latency, retries) is appended here (set to None to keep it in memory only).
+USAGE_LOG_PATH = "usage/llm_calls.jsonl"
+
+# Per-bank JSONL checkpoints for MODE 3; an interrupted run resumes from its checkpoint.
+CHECKPOINT_DIR = "checkpoints"
+
 PROMPT = f"""You are an intelligent document parser. Given the following Bank and a SINGLE product's fees' name and or additional info,
 extract the information
 
@@ -340,20 +456,254 @@ SCHEMA = {
         }
 }
 
+@dataclass(frozen=True)
+class ExtractionPrompt:
+    system: str
+    version: str    # sha256 of the rendered prompt; changes whenever the prompt does
+
+
+def _build_extraction_prompt(structured: bool = False) -> ExtractionPrompt:
+    """
+    Render the extraction system prompt; called once at import time.
+
+    structured=True is the variant for strict structured outputs: the schema is
+    passed natively, so its text is left out and absent fields come back as null.
+    """
+    # Format fee type definitions for the prompt
+    fee_type_guide = "\n".join([
+        f"• {key}: {value['definition']}\n  Examples: {', '.join(value['examples'])}\n  Use when: {value['when_to_use']}"
+        for key, value in FEE_TYPE_DEFINITIONS.items()
+    ])
+    
+    if structured:
+        omit_rule = "IMPORTANT: Set any field with no value to null (the schema requires every field). "
+        schema_rules = "Your reply is constrained to the extraction JSON schema.\n\n"
+        null_rule = "- Set fields with no value to null (except within the required fee method object)\n"
+    else:
+        omit_rule = f"IMPORTANT: Omit any field with null/{NOT_FOUND} value - do not include it in the output. "
+        schema_rules = (
+            "You MUST follow this exact JSON schema:\n"
+            f"{json.dumps(SCHEMA['schema'], indent=2)}\n\n"
+        )
+        null_rule = f"- Do NOT include fields with null/{NOT_FOUND} values (except within the required fee method object)\n"
+
+    system = (
+        "Extract ONLY information explicitly stated in Additional Info. "
+        "Do NOT infer or guess. "
+        "Return ONLY valid JSON (no markdown, no explanation). "
+        f"{omit_rule}"
+        "EXCEPTION: You MUST always include feeType and feeMethodUType. "
+        f"If the fee method cannot be determined from the text, set feeMethodUType to '{NOT_FOUND}' and {'set fixedAmount/rateBased/variable to null' if structured else 'OMIT fixedAmount/rateBased/variable entirely'}. "
+        f"If a method IS determined but the amount/rate/range is not explicitly stated, use the literal string '{NOT_FOUND}' inside the required method object.\n\n"
+        f"{DATA_TYPE_DEFINITIONS}\n\n"
+        "FEE TYPE CLASSIFICATION GUIDE:\n"
+        f"{fee_type_guide}\n\n"
+        f"{schema_rules}"
+        "Key rules:\n"
+        "- The 'name' field in each fee MUST be the original name of the fee\n"
+        "- Fields MUST appear in this exact order: name, feeType, feeMethodUType, (fixedAmount/rateBased/variable), feeCap, feeCapPeriod, currency, explanation\n"
+        "- feeMethodUType determines which fee calculation method to use (only ONE of: fixedAmount, rateBased, or variable)\n"
+        f"- If feeMethodUType='{NOT_FOUND}', include NO fee method object\n"
+        "- If feeMethodUType='fixedAmount', include ONLY the fixedAmount object\n"
+        "- If feeMethodUType='rateBased', include ONLY the rateBased object\n"
+        "- If feeMethodUType='variable', include ONLY the variable object\n"
+        f"{null_rule}"
+        "- The 'explanation' field is REQUIRED (top-level and for each fee). It must briefly justify each included field using exact phrases from the Additional Info (quote them). Do not infer.\n"
+        "- Use the FEE TYPE CLASSIFICATION GUIDE above to select the most appropriate feeType"
+    )
+
+    return ExtractionPrompt(
+        system=system,
+        version=hashlib.sha256(system.encode("utf-8")).hexdigest(),
+    )
+
+
+# The system prompt never varies between calls. Building it once keeps it byte-identical
+# across requests, so it forms a stable prefix for the provider's prompt cache.
+EXTRACTION_PROMPT = _build_extraction_prompt()
+PROMPT_VERSION = EXTRACTION_PROMPT.version
+
+
+def _build_batch_extraction_prompt(base: ExtractionPrompt) -> ExtractionPrompt:
+    """Extend the single-fee prompt for multi-fee requests, keeping it as the shared prefix."""
+    system = (
+        f"{base.system}\n\n"
+        "BATCH MODE:\n"
+        "- The input contains a 'fees' array. Each item has a 'key', 'bank', 'product' and 'additional_info'.\n"
+        "- Extract every item independently, exactly as if it were the only fee in the request. Do not let one item's text influence another.\n"
+        "- Return ONLY a JSON object of the form {\"results\": [{\"key\": <key>, \"bank\": ..., \"product\": ..., \"explanation\": ..., \"extracted_fees\": [...]}]}.\n"
+        "- Each results entry MUST follow the schema above and echo its input 'key' unchanged. Return exactly one entry per input key."
+    )
+    return ExtractionPrompt(
+        system=system,
+        version=hashlib.sha256(system.encode("utf-8")).hexdigest(),
+    )
+
+
+BATCH_EXTRACTION_PROMPT = _build_batch_extraction_prompt(EXTRACTION_PROMPT)
+
+# Opt-in (Agent(structured_outputs=True)): the schema goes in response_format instead of the prompt.
+STRUCTURED_EXTRACTION_PROMPT = _build_extraction_prompt(structured=True)
+STRUCTURED_BATCH_EXTRACTION_PROMPT = _build_batch_extraction_prompt(STRUCTURED_EXTRACTION_PROMPT)
+
+
+def _strict_json_schema(schema: Any) -> Any:
+    """
+    Adapt a SCHEMA fragment to what strict structured outputs accept.
+
+    Every property becomes required (optional ones nullable), oneOf becomes
+    anyOf, string consts become single-value enums, and keywords strict mode
+    rejects (not, default) are dropped. The fee-method "exactly one object"
+    rule cannot be expressed and is left to post-processing.
+    """
+    if isinstance(schema, list):
+        return [_strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    if "const" in schema and isinstance(schema["const"], str):
+        return {"type": "string", "enum": [schema["const"]]}
+
+    adapted = {}
+    for key, value in schema.items():
+        if key in ("not", "default"):
+            continue
+        if key == "oneOf":
+            # Branches that only constrain sibling properties (the fee method shapes) carry no type.
+            branches = [branch for branch in value if "type" in branch or "const" in branch or "pattern" in branch]
+            if branches:
+                adapted["anyOf"] = _strict_json_schema(branches)
+            continue
+        if key == "properties":
+            adapted[key] = {name: _strict_json_schema(sub) for name, sub in value.items()}
+            continue
+        adapted[key] = _strict_json_schema(value)
+
+    if "properties" in adapted:
+        required = set(schema.get("required", []))
+        for name, sub in adapted["properties"].items():
+            if name not in required:
+                alternatives = sub["anyOf"] if list(sub) == ["anyOf"] else [sub]
+                adapted["properties"][name] = {"anyOf": alternatives + [{"type": "null"}]}
+        adapted["required"] = list(adapted["properties"])
+        adapted["additionalProperties"] = False
+    return adapted
+
+
+STRICT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": SCHEMA["name"], "schema": _strict_json_schema(SCHEMA["schema"]), "strict": True},
+}
+
+_STRICT_BATCH_ENTRY = copy.deepcopy(STRICT_RESPONSE_FORMAT["json_schema"]["schema"])
+_STRICT_BATCH_ENTRY["properties"] = {"key": {"type": "string"}, **_STRICT_BATCH_ENTRY["properties"]}
+_STRICT_BATCH_ENTRY["required"] = list(_STRICT_BATCH_ENTRY["properties"])
+STRICT_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": f"{SCHEMA['name']}_batch",
+        "schema": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {"results": {"type": "array", "items": _STRICT_BATCH_ENTRY}},
+            "required": ["results"],
+        },
+        "strict": True,
+    },
+}
+
+# Compiled once: every model fee is checked against the SCHEMA fee item before it is cached.
+FEE_SCHEMA = SCHEMA["schema"]["properties"]["extracted_fees"]["items"]
+FEE_VALIDATOR = SchemaValidator(FEE_SCHEMA)
+
+
+def _build_repair_prompt() -> ExtractionPrompt:
+    """Prompt for repairing one fee that failed validation, without re-running the extraction."""
+    system = (
+        "You repair ONE extracted bank fee that failed JSON schema validation. "
+        "The input has 'fee' (the fee as extracted) and 'errors' (what is wrong with it). "
+        "Fix only what the errors name and keep every other field and value unchanged. "
+        f"Do NOT invent values: where a value is unknown use '{NOT_FOUND}' if the schema allows it, otherwise omit the field. "
+        "Return ONLY a JSON object of the form {\"fee\": <the corrected fee>}. The fee MUST follow this schema:\n"
+        f"{json.dumps(FEE_SCHEMA, separators=(',', ':'))}\n\n"
+        "If the input has 'response' instead of 'fee', it is a reply that is not valid JSON: "
+        "return that same content as valid JSON, changing nothing else."
+    )
+    return ExtractionPrompt(
+        system=system,
+        version=hashlib.sha256(system.encode("utf-8")).hexdigest(),
+    )
+
+
+REPAIR_PROMPT = _build_repair_prompt()
+
+
 class Agent:
-    def __init__(self, model: str = "gpt-5.2", temperature: float = 0.7, max_tokens: int = 2048):
+    def __init__(
+        self,
+        model: str = "gpt-5.2",
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        cache_path: Optional[str] = EXTRACTION_CACHE_PATH,
+        cache_max_entries: Optional[int] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+        batch_size: Optional[int] = None,
+        batch_across_products: bool = False,
+        use_rules: bool = True,
+        repair_invalid: bool = True,
+        structured_outputs: bool = False,
+        usage_log_path: Optional[str] = USAGE_LOG_PATH,
+        backend: Optional[LLMBackend] = None,
+        dedup_across_banks: bool = False,
+    ):
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "Missing OPENAI_API_KEY environment variable. "
-                "Set it in your environment or in a .env file."
-            )
-        self.client = OpenAI(api_key=api_key)
+        self.scheduler = scheduler
+        # OpenAI unless another backend is given (e.g. LLMBackend.StubBackend to run offline).
+        # With a scheduler, retries belong to it so 429s and Retry-After are visible there.
+        if backend is None:
+            backend = OpenAIBackend(max_retries=0) if scheduler else OpenAIBackend()
+        self.backend = backend
         self._last_usage = None
+        self.usage = UsageLedger(usage_log_path)
+        # structured_outputs passes the schema natively (strict json_schema) instead of as prompt text.
+        self.structured_outputs = structured_outputs
+        if structured_outputs:
+            self.prompt = STRUCTURED_EXTRACTION_PROMPT
+            self.batch_prompt = STRUCTURED_BATCH_EXTRACTION_PROMPT
+            self.response_format = STRICT_RESPONSE_FORMAT
+            self.batch_response_format = STRICT_BATCH_RESPONSE_FORMAT
+        else:
+            self.prompt = EXTRACTION_PROMPT
+            self.batch_prompt = BATCH_EXTRACTION_PROMPT
+            self.response_format = self.batch_response_format = {"type": "json_object"}  # JSON mode
+        # batch_size > 1 sends up to that many fees per request (within one product
+        # unless batch_across_products); None/1 keeps one request per fee.
+        self.batch_size = batch_size
+        self.batch_across_products = batch_across_products
+        self.batched_requests = 0
+        self.batch_fallback_fees = 0
+        # Fees failing FEE_VALIDATOR once normalized (see _fee_errors) get one small repair request (repair_invalid) before falling back to defaults.
+        self.repair_invalid = repair_invalid
+        self.repair_prompt = REPAIR_PROMPT
+        self.schema_checked_fees = 0
+        self.schema_invalid_fees = 0
+        self.schema_repairs = 0
+        self.schema_repair_failures = 0
+        self.schema_validation_seconds = 0.0
+        self.cache = ExtractionCache(cache_path, max_entries=cache_max_entries) if cache_path else None
+        # Fees the rules fully determine never reach the model.
+        self.rules = FeeRuleEngine() if use_rules else None
+        self.rules_invalid_fees = 0
+        # dedup_across_banks extracts each distinct fee text once for every bank this agent runs.
+        self.text_index = FeeTextIndex() if dedup_across_banks else None
     
+    @property
+    def client(self):
+        """The OpenAI client behind the backend (Batch API, test_a_response); None for other backends."""
+        return getattr(self.backend, "client", None)
+
     @staticmethod
     def _strip_null_values(obj):
         """Recursively remove keys with null/None values from dictionaries."""
@@ -364,34 +714,22 @@ class Agent:
         else:
             return obj
     
-    @staticmethod
-    def _reorder_fee_fields(fee_dict):
-        """Reorder fee fields to match the required order: name, feeType, feeMethodUType, fee method object, feeCap, feeCapPeriod, currency, explanation"""
-        ordered_fee = {}
-        field_order = [
-            "name",
-            "feeType",
-            "feeMethodUType",
-            "fixedAmount",
-            "rateBased",
-            "variable",
-            "feeCap",
-            "feeCapPeriod",
-            "currency",
-            "explanation",
-        ]
-        
-        # Add fields in the specified order
-        for field in field_order:
-            if field in fee_dict:
-                ordered_fee[field] = fee_dict[field]
-        
-        # Add any remaining fields that weren't in our order list
-        for key, value in fee_dict.items():
-            if key not in ordered_fee:
-                ordered_fee[key] = value
-        
-        return ordered_fee
+    # Output order of fee fields; fields not listed follow in the order the model gave them.
+    _FEE_FIELD_ORDER = (
+        "name",
+        "feeType",
+        "feeMethodUType",
+        "fixedAmount",
+        "rateBased",
+        "variable",
+        "feeCap",
+        "feeCapPeriod",
+        "currency",
+        "explanation",
+    )
+    _FEE_METHODS = ("fixedAmount", "rateBased", "variable")
+    _FEE_TYPES = frozenset(SCHEMA["schema"]["properties"]["extracted_fees"]["items"]["properties"]["feeType"]["enum"])
+    _MISSING_EXPLANATION = "Explanation not provided by model."
 
     @staticmethod
     def normalize_rate_string(rate_str: str) -> str:
@@ -427,105 +765,81 @@ class Agent:
     @staticmethod
     def _stabilize_fee_type(fee_name: str, source_text: str) -> Optional[str]:
         """Deterministically override feeType for strong keyword matches to reduce run-to-run drift."""
-        haystack = f"{fee_name} {source_text}".lower()
-
-        # EXIT / closure / payout signals
-        if any(k in haystack for k in ["prepayment", "pay out", "payout", "paid out", "refinanc", "discharge", "termination", "close", "closure", "exit"]):
-            return "EXIT"
-
-        # Upfront / establishment signals
-        if any(k in haystack for k in ["establishment", "application", "set up", "setup", "joining"]):
-            return "UPFRONT"
-
-        # Late / missed payment signals
-        if any(k in haystack for k in ["missed payment", "late payment", "overdue", "default notice", "arrears"]):
-            return "LATE_PAYMENT"
-
-        # Dishonour / overdrawn signals
-        if any(k in haystack for k in ["dishonour", "dishonor", "overdrawn", "nsf", "bounced"]):
-            return "DISHONOR"
-
-        # Basic transaction types
-        if "cash advance" in haystack:
-            return "CASH_ADVANCE"
-        if any(k in haystack for k in ["withdrawal", "atm"]):
-            return "WITHDRAWAL"
-        if "deposit" in haystack:
-            return "DEPOSIT"
-        if any(k in haystack for k in ["enquiry", "inquiry", "balance"]):
-            return "ENQUIRY"
-        if "replacement" in haystack:
-            return "REPLACEMENT"
-
-        # Periodic signals
-        if any(k in haystack for k in ["monthly", "per month", "annual", "per year", "yearly", "quarterly"]):
-            return "PERIODIC"
-
-        return None
+        matched = match_fee_type(fee_name, source_text)
+        return matched[0] if matched is not None else None
 
     @staticmethod
-    def _ensure_fee_method_shape(fee: dict) -> None:
-        """Ensure feeMethodUType and the corresponding method object exist for consistent output."""
-        if not isinstance(fee, dict):
-            return
+    def _fee_method(fee: dict) -> Tuple[str, Optional[dict]]:
+        """
+        Resolve feeMethodUType and its method object for consistent output.
 
+        Exactly one method object matching feeMethodUType is kept, with its
+        required subfields; anything inconsistent becomes NF with no object.
+        """
         fee_method = fee.get("feeMethodUType")
 
         # Infer feeMethodUType from present method object; otherwise mark as unknown.
         if not fee_method:
-            if "fixedAmount" in fee:
-                fee_method = "fixedAmount"
-            elif "rateBased" in fee:
-                fee_method = "rateBased"
-            elif "variable" in fee:
-                fee_method = "variable"
-            else:
-                fee_method = NOT_FOUND
-            fee["feeMethodUType"] = fee_method
-
-        # Enforce exactly one method object and ensure required subfields exist.
-        if fee_method == NOT_FOUND:
-            fee.pop("fixedAmount", None)
-            fee.pop("rateBased", None)
-            fee.pop("variable", None)
-            return
+            fee_method = next((method for method in Agent._FEE_METHODS if fee.get(method) is not None), NOT_FOUND)
 
         if fee_method == "fixedAmount":
-            fee.pop("rateBased", None)
-            fee.pop("variable", None)
             fixed = fee.get("fixedAmount")
-            if not isinstance(fixed, dict):
-                fixed = {}
-                fee["fixedAmount"] = fixed
+            fixed = Agent._strip_null_values(fixed) if isinstance(fixed, dict) else {}
             amount = fixed.get("amount")
             if amount is None or (isinstance(amount, str) and not amount.strip()):
                 fixed["amount"] = NOT_FOUND
             elif isinstance(amount, (int, float)):
                 fixed["amount"] = f"{amount:.2f}"
+            return fee_method, fixed
+
+        if fee_method in ("rateBased", "variable"):
+            method_object = fee.get(fee_method)
+            # If the model chose a method but didn't include it, fall back to unknown (don't assume fixedAmount).
+            if not isinstance(method_object, dict):
+                return NOT_FOUND, None
+            method_object = Agent._strip_null_values(method_object)
+            if fee_method == "rateBased" and "rate" in method_object:
+                method_object["rate"] = Agent.normalize_rate_string(method_object["rate"])
+            return fee_method, method_object
+
+        # NF, or an invalid feeMethodUType -> unknown with no method object
+        return NOT_FOUND, None
+
+    def _normalize_fee(self, fee: dict, stable_fee_type: Optional[str]) -> dict:
+        """
+        Single pass over one model fee, building the output record directly.
 
-        elif fee_method == "rateBased":
-            fee.pop("fixedAmount", None)
-            fee.pop("variable", None)
-            # If the model chose rateBased but didn't include it, fall back to unknown (don't assume fixedAmount).
-            if "rateBased" not in fee or not isinstance(fee.get("rateBased"), dict):
-                fee["feeMethodUType"] = NOT_FOUND
-                fee.pop("rateBased", None)
-                return
-
-        elif fee_method == "variable":
-            fee.pop("fixedAmount", None)
-            fee.pop("rateBased", None)
-            if "variable" not in fee or not isinstance(fee.get("variable"), dict):
-                fee["feeMethodUType"] = NOT_FOUND
-                fee.pop("variable", None)
-                return
-
-        else:
-            # Invalid feeMethodUType -> mark unknown and remove method objects
-            fee["feeMethodUType"] = NOT_FOUND
-            fee.pop("fixedAmount", None)
-            fee.pop("rateBased", None)
-            fee.pop("variable", None)
+        Drops nulls and explanationDetail, applies the stabilized feeType (see
+        _stabilize_fee_type) or validates the model's, fixes the fee method shape
+        and rate format, and emits fields in _FEE_FIELD_ORDER.
+        """
+        fee_method, method_object = self._fee_method(fee)
+
+        fee_type = stable_fee_type or fee.get("feeType")
+        if fee_type not in self._FEE_TYPES:
+            fee_type = "OTHER"
+
+        explanation = fee.get("explanation")
+        if not isinstance(explanation, str) or not explanation.strip():
+            explanation = self._MISSING_EXPLANATION
+
+        normalized = {}
+        if fee.get("name") is not None:
+            normalized["name"] = fee["name"]
+        normalized["feeType"] = fee_type
+        normalized["feeMethodUType"] = fee_method
+        if method_object is not None:
+            normalized[fee_method] = method_object
+        for field in ("feeCap", "feeCapPeriod", "currency"):
+            if fee.get(field) is not None:
+                normalized[field] = self._strip_null_values(fee[field])
+        normalized["explanation"] = explanation
+
+        for key, value in fee.items():
+            if key not in normalized and key not in self._FEE_FIELD_ORDER and key != "explanationDetail" and value is not None:
+                normalized[key] = self._strip_null_values(value)
+
+        return normalized
 
     def test_a_response(self) :
         # test an open ai call with a sample prompt
@@ -548,174 +862,408 @@ class Agent:
     
     
     
-    def extract(self, bank: str, product: str, additional_info: str) -> dict:
-        # Format fee type definitions for the prompt
-        fee_type_guide = "\n".join([
-            f"• {key}: {value['definition']}\n  Examples: {', '.join(value['examples'])}\n  Use when: {value['when_to_use']}"
-            for key, value in FEE_TYPE_DEFINITIONS.items()
-        ])
-        
-        system_prompt = (
-            "Extract ONLY information explicitly stated in Additional Info. "
-            "Do NOT infer or guess. "
-            "Return ONLY valid JSON (no markdown, no explanation). "
-            f"IMPORTANT: Omit any field with null/{NOT_FOUND} value - do not include it in the output. "
-            "EXCEPTION: You MUST always include feeType and feeMethodUType. "
-            f"If the fee method cannot be determined from the text, set feeMethodUType to '{NOT_FOUND}' and OMIT fixedAmount/rateBased/variable entirely. "
-            f"If a method IS determined but the amount/rate/range is not explicitly stated, use the literal string '{NOT_FOUND}' inside the required method object.\n\n"
-            f"{DATA_TYPE_DEFINITIONS}\n\n"
-            "FEE TYPE CLASSIFICATION GUIDE:\n"
-            f"{fee_type_guide}\n\n"
-            "You MUST follow this exact JSON schema:\n"
-            f"{json.dumps(SCHEMA['schema'], indent=2)}\n\n"
-            "Key rules:\n"
-            "- The 'name' field in each fee MUST be the original name of the fee\n"
-            "- Fields MUST appear in this exact order: name, feeType, feeMethodUType, (fixedAmount/rateBased/variable), feeCap, feeCapPeriod, currency, explanation\n"
-            "- feeMethodUType determines which fee calculation method to use (only ONE of: fixedAmount, rateBased, or variable)\n"
-            f"- If feeMethodUType='{NOT_FOUND}', include NO fee method object\n"
-            "- If feeMethodUType='fixedAmount', include ONLY the fixedAmount object\n"
-            "- If feeMethodUType='rateBased', include ONLY the rateBased object\n"
-            "- If feeMethodUType='variable', include ONLY the variable object\n"
-            f"- Do NOT include fields with null/{NOT_FOUND} values (except within the required fee method object)\n"
-            "- The 'explanation' field is REQUIRED (top-level and for each fee). It must briefly justify each included field using exact phrases from the Additional Info (quote them). Do not infer.\n"
-            "- Use the FEE TYPE CLASSIFICATION GUIDE above to select the most appropriate feeType"
-        )
+    def _completion_request(self, system_prompt: str, payload: dict, response_format: Optional[dict] = None) -> dict:
+        """Build the chat completion kwargs shared by the sync and async clients (JSON mode unless response_format is given)."""
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            ],
+            "temperature": 0,          # determinism
+            "top_p": 1,
+            "presence_penalty": 0,
+            "frequency_penalty": 0,
+            "response_format": response_format or {"type": "json_object"},
+            "max_completion_tokens": self.max_tokens,
+        }
+
+    def _create_completion(self, request: dict, kind: str = "extract"):
+        attempts = 0
+
+        def create():
+            nonlocal attempts
+            attempts += 1
+            return self.backend.complete(request)
+
+        started_at = time.perf_counter()
+        try:
+            resp = create() if self.scheduler is None else self.scheduler.call(create, request)
+        except Exception as e:
+            self.usage.record(kind, self.model, None, time.perf_counter() - started_at, max(attempts - 1, 0), error=e)
+            raise
+
+        # Capture token usage for progress reporting and the usage ledger.
+        self._last_usage = getattr(resp, "usage", None)
+        self.usage.record(kind, self.model, self._last_usage, time.perf_counter() - started_at, attempts - 1)
+        return resp
+
+    def _cache_lookup(self, prompt: ExtractionPrompt, bank: str, additional_info: str) -> Tuple[Optional[str], Optional[dict]]:
+        """
+        Return (cache_key, cached raw extraction); both are None when caching is disabled.
+
+        Across banks (text_index) the key leaves out the bank and case, and is
+        returned even without a cache so identical texts in flight coalesce.
+        """
+        if self.text_index is not None:
+            cache_key = ExtractionCache.make_key("", FeeTextIndex.key(additional_info), self.model, prompt.version)
+            shared = self.text_index.get(additional_info)
+            if shared is not None:
+                return cache_key, shared
+            cached = self.cache.get(cache_key) if self.cache is not None else None
+            if cached is not None:
+                self.text_index.set(additional_info, cached)
+            return cache_key, cached
+
+        if self.cache is None:
+            return None, None
+
+        cache_key = ExtractionCache.make_key(bank, additional_info, self.model, prompt.version)
+        return cache_key, self.cache.get(cache_key)
+
+    def _store_extraction(self, cache_key: Optional[str], additional_info: str, raw: dict) -> None:
+        if self.text_index is not None:
+            self.text_index.set(additional_info, raw)
+        if cache_key is not None and self.cache is not None:
+            self.cache.set(cache_key, raw)
+
+    def extract(self, bank: str, product: str, additional_info: str, fee_name: Optional[str] = None) -> dict:
+        prompt = self.prompt
+
+        # Serve repeated fee text from the cache instead of paying for another round-trip.
+        cache_key, cached = self._cache_lookup(prompt, bank, additional_info)
+        if cached is not None:
+            self._last_usage = None
+            return self._postprocess_extraction(cached, additional_info, fee_name)
 
         payload = {
             "bank": bank,
             "product": product,
             "additional_info": additional_info,
         }
+        resp = self._create_completion(self._completion_request(prompt.system, payload, self.response_format))
+
+        content = resp.choices[0].message.content
+        obj = self._validate_and_repair(self._parse_or_repair(content))
+        self._store_extraction(cache_key, additional_info, obj)
+
+        return self._postprocess_extraction(obj, additional_info, fee_name)
+
+    def _invalid_fees(self, obj: Any) -> List[Tuple[int, List[str]]]:
+        """(fee index, validation errors) for every model fee that does not match FEE_SCHEMA."""
+        fees = obj.get("extracted_fees") if isinstance(obj, dict) else None
+        if not isinstance(fees, list):
+            return []
+
+        started_at = time.perf_counter()
+        invalid = []
+        for index, fee in enumerate(fees):
+            errors = self._fee_errors(fee)
+            if errors:
+                invalid.append((index, errors))
+        self.schema_validation_seconds += time.perf_counter() - started_at
+        self.schema_checked_fees += len(fees)
+        self.schema_invalid_fees += len(invalid)
+        return invalid
+
+    def _fee_errors(self, fee: Any) -> List[str]:
+        """
+        Validation errors of one model fee as it will be output, i.e. after _normalize_fee().
 
-        # Try to improve repeatability if the client supports seeding.
+        Formatting that post-processing fixes on its own (percent rates, numeric
+        amounts, a missing explanation or name) is not worth a repair call. Its
+        fallbacks that lose information still are: an unknown feeType defaulted
+        to OTHER, or a fee method or rate reduced to NF.
+        """
+        if not isinstance(fee, dict):
+            return FEE_VALIDATOR.errors(fee)
+
+        # Nulls are absent fields (strict structured outputs send them for every unset field).
+        fee = self._strip_null_values(fee)
+        normalized = self._normalize_fee(fee, None)
+        normalized.setdefault("name", "")  # Always replaced by the API fee name
+        errors = FEE_VALIDATOR.errors(normalized)
+
+        if fee.get("feeType") not in self._FEE_TYPES:
+            errors.append(f"$.feeType: {fee.get('feeType')!r} is not one of the allowed feeType values")
+        method = fee.get("feeMethodUType")
+        if method in self._FEE_METHODS and normalized["feeMethodUType"] == NOT_FOUND:
+            errors.append(f"$.{method}: required object for feeMethodUType {method!r} is missing or malformed")
+        rate = fee.get("rateBased", {}).get("rate") if isinstance(fee.get("rateBased"), dict) else None
+        if normalized["feeMethodUType"] == "rateBased" and rate not in (None, NOT_FOUND) and normalized["rateBased"].get("rate") == NOT_FOUND:
+            errors.append(f"$.rateBased.rate: {rate!r} is not a decimal rate")
+        return errors
+
+    def _repair_request(self, payload: dict) -> dict:
+        return self._completion_request(self.repair_prompt.system, payload)
+
+    def _apply_repair(self, obj: dict, index: int, content: Optional[str]) -> None:
+        """Swap in a repaired fee if it now validates; otherwise keep the original for post-processing."""
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-                ],
-                temperature=0,          # determinism
-                top_p=1,
-                presence_penalty=0,
-                frequency_penalty=0,
-                response_format={"type": "json_object"},  # JSON mode
-                max_completion_tokens=self.max_tokens,
-                seed=0,
-            )
-        except TypeError:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-                ],
-                temperature=0,          # determinism
-                top_p=1,
-                presence_penalty=0,
-                frequency_penalty=0,
-                response_format={"type": "json_object"},  # JSON mode
-                max_completion_tokens=self.max_tokens,
-            )
+            fee = json.loads(content).get("fee")
+        except (TypeError, ValueError, AttributeError):
+            fee = None
 
-            # Capture token usage for progress reporting (if available).
-            self._last_usage = getattr(resp, "usage", None)
+        if isinstance(fee, dict) and not self._fee_errors(fee):
+            obj["extracted_fees"][index] = fee
+            self.schema_repairs += 1
+        else:
+            self.schema_repair_failures += 1
 
-        content = resp.choices[0].message.content
-        obj = json.loads(content)
-        
-        # Strip null values from the result
-        obj = self._strip_null_values(obj)
+    def _validate_and_repair(self, obj: Any) -> Any:
+        """Validate each model fee and send only the offending ones, with their errors, for repair."""
+        invalid = self._invalid_fees(obj)
+        if not self.repair_invalid:
+            return obj
 
-        # Ensure required explanation fields exist (avoid silently producing invalid output).
-        if "explanation" not in obj or not isinstance(obj.get("explanation"), str) or not obj.get("explanation").strip():
-            obj["explanation"] = "Explanation not provided by model."
+        for index, errors in invalid:
+            try:
+                resp = self._create_completion(self._repair_request({"fee": obj["extracted_fees"][index], "errors": errors}), kind="repair")
+                content = resp.choices[0].message.content
+            except Exception:
+                content = None
+            self._apply_repair(obj, index, content)
+        return obj
 
-        # Drop detailed explanations if the model included them.
-        obj.pop("explanationDetail", None)
-        
-        # Normalize rates and reorder fields for each extracted fee
-        if "extracted_fees" in obj:
-            for fee in obj["extracted_fees"]:
-                if "explanation" not in fee or not isinstance(fee.get("explanation"), str) or not fee.get("explanation").strip():
-                    fee["explanation"] = "Explanation not provided by model."
-
-                # Drop detailed explanations if the model included them.
-                fee.pop("explanationDetail", None)
-
-                # Stabilize feeType for strong keyword matches.
-                fee_name = fee.get("name", "")
-                override_fee_type = self._stabilize_fee_type(fee_name=fee_name, source_text=additional_info)
-                if override_fee_type is not None:
-                    fee["feeType"] = override_fee_type
-
-                # Ensure feeType exists and is valid (fallback to OTHER).
-                if fee.get("feeType") not in SCHEMA["schema"]["properties"]["extracted_fees"]["items"]["properties"]["feeType"]["enum"]:
-                    fee["feeType"] = "OTHER"
-
-                # Ensure consistent feeMethodUType + method object.
-                self._ensure_fee_method_shape(fee)
-
-                # Normalize rate if present in rateBased method
-                if "rateBased" in fee and "rate" in fee["rateBased"]:
-                    fee["rateBased"]["rate"] = self.normalize_rate_string(fee["rateBased"]["rate"])
-                
-                # Reorder fields to match schema order
-                fee_reordered = self._reorder_fee_fields(fee)
-                # Update the fee in place with reordered fields
-                fee.clear()
-                fee.update(fee_reordered)
+    def _parse_or_repair(self, content: str) -> Any:
+        """json.loads() the model reply, asking the model to re-emit it as JSON once if it is malformed."""
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError) as e:
+            if not self.repair_invalid or not content:
+                raise
+            error = e
 
+        resp = self._create_completion(self._repair_request({"response": content, "errors": [str(error)]}), kind="repair")
+        try:
+            obj = json.loads(resp.choices[0].message.content)
+        except (TypeError, ValueError):
+            self.schema_repair_failures += 1
+            raise error
+        self.schema_repairs += 1
         return obj
-    
-    def run_agent(
+
+    def _prepare_batch(self, items: List[Tuple[str, str, str, Optional[str]]]) -> Tuple[List[Optional[dict]], List[Optional[str]], List[int]]:
+        """
+        Resolve cached batch items up front.
+
+        Returns:
+            (results, cache_keys, pending) - results holds post-processed cache hits,
+            pending lists the item indexes that still need the model.
+        """
+        results: List[Optional[dict]] = [None] * len(items)
+        cache_keys: List[Optional[str]] = [None] * len(items)
+        pending = []
+
+        for index, (bank, product, additional_info, fee_name) in enumerate(items):
+            cache_key, cached = self._cache_lookup(self.batch_prompt, bank, additional_info)
+            if cached is not None:
+                results[index] = self._postprocess_extraction(cached, additional_info, fee_name)
+                continue
+            cache_keys[index] = cache_key
+            pending.append(index)
+
+        return results, cache_keys, pending
+
+    def _batch_request(self, items: List[Tuple[str, str, str, Optional[str]]], pending: List[int]) -> dict:
+        payload = {
+            "fees": [
+                {
+                    "key": str(index),
+                    "bank": items[index][0],
+                    "product": items[index][1],
+                    "additional_info": items[index][2],
+                }
+                for index in pending
+            ]
+        }
+        return self._completion_request(self.batch_prompt.system, payload, self.batch_response_format)
+
+    def _split_batch_response(self, content: Optional[str], pending: List[int]) -> Dict[int, dict]:
+        """
+        Split a keyed batch response back into raw per-fee extractions, by item index.
+
+        Entries that are missing, duplicated or malformed are left out so the
+        caller falls back to a single-fee extract() for just those fees.
+        """
+        try:
+            obj = json.loads(content)
+            entries = obj.get("results")
+        except (TypeError, ValueError, AttributeError):
+            entries = None
+
+        raw_by_key = {}
+        if isinstance(entries, list):
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                fees = entry.get("extracted_fees")
+                if not isinstance(fees, list) or not all(isinstance(fee, dict) for fee in fees):
+                    continue
+                key = str(entry.get("key"))
+                # A key answered twice is ambiguous; drop it and re-extract individually.
+                raw_by_key[key] = None if key in raw_by_key else {k: v for k, v in entry.items() if k != "key"}
+
+        raw_by_index = {}
+        for index in pending:
+            raw = raw_by_key.get(str(index))
+            if raw is None:
+                self.batch_fallback_fees += 1
+                continue
+            raw_by_index[index] = raw
+        return raw_by_index
+
+    def _accept_batch_item(
         self,
-        bank_name: str,
-        json_path: str = "product_details/combined_product_details.json",
-        max_products: int = None,
-        show_progress: bool = False,
-    ) -> dict:
+        items: List[Tuple[str, str, str, Optional[str]]],
+        results: List[Optional[dict]],
+        cache_keys: List[Optional[str]],
+        index: int,
+        raw: dict,
+    ) -> None:
+        self._store_extraction(cache_keys[index], items[index][2], raw)
+        results[index] = self._postprocess_extraction(raw, items[index][2], items[index][3])
+
+    def extract_batch(self, items: List[Tuple[str, str, str, Optional[str]]]) -> List[Optional[dict]]:
         """
-        Run the agent over all products for a specific bank.
-        
+        Extract several fees in one request.
+
         Args:
-            bank_name: Name of the bank to process
-            json_path: Path to the combined product details JSON file
-            max_products: Maximum number of products to process (None = all products)
-            
+            items: (bank, product, additional_info, API fee name or None) per fee
+
         Returns:
-            Dictionary with extracted fee information for all products
+            Post-processed extraction per item (same shape as extract()), or None
+            where the batched response did not validate and extract() should be used.
         """
-        # Load the JSON file
-        data_path = Path(json_path)
-        if not data_path.exists():
-            raise FileNotFoundError(f"File not found: {json_path}")
-        
-        with open(data_path, 'r', encoding='utf-8') as f:
-            all_data = json.load(f)
+        results, cache_keys, pending = self._prepare_batch(items)
+        self._last_usage = None
+        if not pending:
+            return results
+
+        self.batched_requests += 1
+        try:
+            resp = self._create_completion(self._batch_request(items, pending), kind="batch")
+            self._last_usage = getattr(resp, "usage", None)
+            content = resp.choices[0].message.content
+        except Exception:
+            content = None
+
+        for index, raw in self._split_batch_response(content, pending).items():
+            self._accept_batch_item(items, results, cache_keys, index, self._validate_and_repair(raw))
+        return results
+
+    @staticmethod
+    def _pending_jobs(plan: dict) -> List[int]:
+        """Job indexes of a plan that still need the model (not carried forward or resolved by rules)."""
+        settled = plan.get("carried", {}).keys() | plan.get("resolved", {}).keys()
+        return [j for j in range(len(plan["jobs"])) if j not in settled]
+
+    def _chunk_jobs(self, plans: List[dict]) -> List[List[Tuple[int, int]]]:
+        """Group (plan index, job index) pairs into the requests a run will make."""
+        refs_by_plan = [[(p, j) for j in self._pending_jobs(plan)] for p, plan in enumerate(plans)]
+        size = self.batch_size or 1
+        if size <= 1:
+            return [[ref] for refs in refs_by_plan for ref in refs]
+
+        groups = [[ref for refs in refs_by_plan for ref in refs]] if self.batch_across_products else refs_by_plan
+        return [group[i:i + size] for group in groups for i in range(0, len(group), size)]
+
+    @staticmethod
+    def _chunk_items(plans: List[dict], chunk: List[Tuple[int, int]]) -> List[Tuple[str, str, str, Optional[str]]]:
+        return [
+            (plans[p]["brand_name"], plans[p]["product_name"], plans[p]["jobs"][j][1], plans[p]["jobs"][j][0])
+            for p, j in chunk
+        ]
+
+    @staticmethod
+    def _chunk_fees(plans: List[dict], chunk: List[Tuple[int, int]]) -> List[List[str]]:
+        """[product_id, fee name] per job, for attributing LLM usage."""
+        return [[plans[p]["product_id"], plans[p]["jobs"][j][0]] for p, j in chunk]
+
+    def _run_chunk(self, plans: List[dict], chunk: List[Tuple[int, int]]) -> Tuple[List[Any], List[Any]]:
+        """
+        Extract one chunk of jobs.
+
+        Returns:
+            (outcomes, usages) - one outcome per job (extraction dict or the Exception
+            raised), plus the usage of every request made.
+        """
+        items = self._chunk_items(plans, chunk)
+        fees = self._chunk_fees(plans, chunk)
+        usages = []
+
+        if len(items) > 1:
+            with self.usage.scope(fees=fees):
+                outcomes = self.extract_batch(items)
+            usages.append(self._last_usage)
+        else:
+            outcomes = [None]
+
+        # Per-fee fallback for anything the batch did not resolve (and for single jobs).
+        for index, (bank, product, additional_info, fee_name) in enumerate(items):
+            if outcomes[index] is not None:
+                continue
+            try:
+                with self.usage.scope(fees=fees[index:index + 1]):
+                    outcomes[index] = self.extract(bank=bank, product=product, additional_info=additional_info, fee_name=fee_name)
+                usages.append(self._last_usage)
+            except Exception as e:
+                outcomes[index] = e
+
+        return outcomes, usages
+
+    def _postprocess_extraction(self, obj: dict, additional_info: str, fee_name: Optional[str] = None) -> dict:
+        """
+        Normalize a raw model response; every fee goes through _normalize_fee() exactly once.
+
+        feeType is stabilized on the API fee name first (once for the source fee),
+        then on each fee's model name, before the model's own feeType is kept.
+        """
+        obj = {
+            key: value if key == "extracted_fees" else self._strip_null_values(value)
+            for key, value in obj.items()
+            if value is not None and key != "explanationDetail"
+        }
+
+        # Ensure required explanation fields exist (avoid silently producing invalid output).
+        if not isinstance(obj.get("explanation"), str) or not obj["explanation"].strip():
+            obj["explanation"] = self._MISSING_EXPLANATION
+
+        fees = obj.get("extracted_fees")
+        if isinstance(fees, list):
+            stable_fee_type = self._stabilize_fee_type(fee_name=fee_name, source_text=additional_info) if fee_name is not None else None
+            obj["extracted_fees"] = [
+                self._normalize_fee(
+                    fee,
+                    stable_fee_type or self._stabilize_fee_type(fee_name=fee.get("name") or "", source_text=additional_info),
+                )
+                for fee in fees
+            ]
+        elif fees is not None:
+            obj["extracted_fees"] = self._strip_null_values(fees)
+
+        return obj
+    
+    @staticmethod
+    def _load_bank_data(bank_name: str, json_path: str) -> dict:
+        # Read only this bank: its shard in the store, or its bytes in a combined JSON file
+        details = open_product_details(json_path)
         
         # Find the bank
-        if bank_name not in all_data:
-            available_banks = list(all_data.keys())[:10]
+        if bank_name not in details:
+            available_banks = details.bank_names()[:10]
             raise ValueError(f"Bank '{bank_name}' not found. Available banks (first 10): {available_banks}")
         
-        bank_data = all_data[bank_name]
-
-        # Progress bar counts product entries visited (not just products with fees).
-        progress_total = len(bank_data)
-        if max_products is not None:
-            progress_total = min(progress_total, int(max_products))
-        progress = _TerminalProgressBar(
-            total=progress_total,
-            prefix=f"{bank_name}: ",
-            width=30,
-        ) if show_progress else None
-
-        started_at = time.time()
-        prompt_tokens_total = 0
-        completion_tokens_total = 0
-
-        results = {
+        return details.load(bank_name)
+
+    @staticmethod
+    def _iter_banks(json_path: str, bank_names: Optional[List[str]] = None) -> Iterator[Tuple[str, dict]]:
+        """Yield (bank_name, bank_data) one bank at a time (None = every bank)."""
+        return open_product_details(json_path).iter_banks(bank_names)
+
+    @staticmethod
+    def _new_results(bank_name: str) -> dict:
+        return {
             "bank": bank_name,
             "products": [],
             "summary": {
@@ -727,22 +1275,37 @@ class Agent:
                 "duplicate_fees_skipped_within_product": 0
             }
         }
-        
-        # Process each product
-        products_processed = 0
-        products_seen = 0
+
+    # CDR fee fields that change what a fee costs; any change re-extracts the fee.
+    _FEE_HASH_FIELDS = ("name", "additionalInfo", "amount", "balanceRate", "transactionRate", "accruedRate", "accrualFrequency", "currency")
+
+    @staticmethod
+    def _fee_hash(product_id: str, fee: dict) -> str:
+        material = json.dumps(
+            [product_id] + [fee.get(field) for field in Agent._FEE_HASH_FIELDS],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _plan_products(bank_name: str, bank_data: dict, summary: dict, max_products: int = None) -> List[dict]:
+        """
+        Decide which fees of a bank need extracting, without calling the model.
+
+        Updates the summary counters and applies per-product fee-name dedup, so the
+        sequential and concurrent engines share exactly the same work list.
+
+        Returns:
+            One plan per product with fees, in input order:
+            {"product_id", "product_name", "brand_name", "jobs": [(fee_name, additional_info), ...],
+             "fee_hashes": [content hash per job], "source_fees": [CDR fee object per job]}
+        """
+        plans = []
+
         for product_id, product_info in bank_data.items():
             # Check if we've hit the max_products limit
-            if max_products is not None and products_processed >= max_products:
+            if max_products is not None and len(plans) >= max_products:
                 break
-
-            products_seen += 1
-            if progress is not None:
-                suffix = (
-                    f"tok in/out: {prompt_tokens_total}/{completion_tokens_total} | "
-                    f"elapsed: {_format_elapsed(time.time() - started_at)}"
-                )
-                progress.update(products_seen, suffix=suffix)
                 
             if not isinstance(product_info, dict):
                 continue
@@ -754,32 +1317,28 @@ class Agent:
             brand_name = data.get('brandName', bank_name)
             fees = data.get('fees', [])
             
-            results["summary"]["total_products"] += 1
+            summary["total_products"] += 1
             
             if not fees:
                 continue
                 
-            results["summary"]["products_with_fees"] += 1
-            
-            product_result = {
-                "product_id": product_id,
-                "product_name": product_name,
-                "extracted_fees": []
-            }
+            summary["products_with_fees"] += 1
+
+            jobs = []
+            fee_hashes = []
+            source_fees = []
             
             # Track fee names within this product to prevent duplicates
             seen_fee_names = set()
             
-            # Process each fee
             for fee in fees:
                 if not isinstance(fee, dict):
                     continue
                     
-                results["summary"]["total_fees_processed"] += 1
+                summary["total_fees_processed"] += 1
                 
                 # Get additional info, fallback to fee name if empty
                 additional_info = fee.get('additionalInfo', '').strip()
-                using_name_only = False
                 
                 if not additional_info:
                     # If no additional info, use the fee name as context
@@ -787,107 +1346,642 @@ class Agent:
                     if not additional_info:
                         # Skip if both additional info and name are empty
                         continue
-                    using_name_only = True
-                    results["summary"]["total_fees_using_name_only"] += 1
+                    summary["total_fees_using_name_only"] += 1
                 else:
-                    results["summary"]["total_fees_with_additional_info"] += 1
+                    summary["total_fees_with_additional_info"] += 1
                 
                 # Get the original fee name
                 fee_name = fee.get('name', 'Unknown')
                 
                 # Skip if this fee name already exists in the current product
                 if fee_name in seen_fee_names:
-                    results["summary"]["duplicate_fees_skipped_within_product"] += 1
+                    summary["duplicate_fees_skipped_within_product"] += 1
                     continue
-                
-                # Run the extraction
-                try:
-                    extracted = self.extract(
-                        bank=brand_name,
-                        product=product_name,
-                        additional_info=additional_info
-                    )
-
-                    # Update token counters (best-effort; depends on SDK/model support).
-                    usage = getattr(self, "_last_usage", None)
-                    if usage is not None:
-                        prompt_tokens_total += int(getattr(usage, "prompt_tokens", 0) or 0)
-                        completion_tokens_total += int(getattr(usage, "completion_tokens", 0) or 0)
-                        if progress is not None:
-                            suffix = (
-                                f"tok in/out: {prompt_tokens_total}/{completion_tokens_total} | "
-                                f"elapsed: {_format_elapsed(time.time() - started_at)}"
-                            )
-                            progress.update(products_seen, suffix=suffix)
-
-                    # Extract fees from the nested structure and flatten
-                    if "extracted_fees" in extracted and isinstance(extracted["extracted_fees"], list):
-                        if len(extracted["extracted_fees"]) > 0:
-                            for extracted_fee in extracted["extracted_fees"]:
-                                # Override the 'name' field with the original fee name from API
-                                extracted_fee["name"] = fee_name
-                                # Ensure required explanation exists
-                                if "explanation" not in extracted_fee or not isinstance(extracted_fee.get("explanation"), str) or not extracted_fee.get("explanation").strip():
-                                    extracted_fee["explanation"] = "Explanation not provided by model."
-
-                                # Drop detailed explanations if the model included them.
-                                extracted_fee.pop("explanationDetail", None)
-
-                                # Stabilize/validate feeType and ensure fee method fields exist
-                                override_fee_type = self._stabilize_fee_type(fee_name=fee_name, source_text=additional_info)
-                                if override_fee_type is not None:
-                                    extracted_fee["feeType"] = override_fee_type
-                                if extracted_fee.get("feeType") not in SCHEMA["schema"]["properties"]["extracted_fees"]["items"]["properties"]["feeType"]["enum"]:
-                                    extracted_fee["feeType"] = "OTHER"
-                                self._ensure_fee_method_shape(extracted_fee)
-
-                                # Reorder fields to match required order
-                                ordered_fee = self._reorder_fee_fields(extracted_fee)
-                                product_result["extracted_fees"].append(ordered_fee)
-                            # Mark this fee name as seen for this product AFTER successful extraction
-                            seen_fee_names.add(fee_name)
-                        else:
-                            # If AI returned empty array, still add fee with just the name
-                            product_result["extracted_fees"].append({
-                                "name": fee_name,
-                                "feeType": "OTHER",
-                                "feeMethodUType": NOT_FOUND,
-                                "explanation": "Model returned no extracted fees; recorded fee name only."
-                            })
-                            seen_fee_names.add(fee_name)
+
+                jobs.append((fee_name, additional_info))
+                fee_hashes.append(Agent._fee_hash(product_id, fee))
+                source_fees.append(fee)
+                seen_fee_names.add(fee_name)
+
+            plans.append({
+                "product_id": product_id,
+                "product_name": product_name,
+                "brand_name": brand_name,
+                "jobs": jobs,
+                "fee_hashes": fee_hashes,
+                "source_fees": source_fees,
+            })
+
+        return plans
+
+    def _flatten_extracted(self, fee_name: str, additional_info: str, extracted: dict) -> List[dict]:
+        """Turn one post-processed extract() response into the output fee records for a single source fee."""
+        # Extract fees from the nested structure and flatten
+        if "extracted_fees" in extracted and isinstance(extracted["extracted_fees"], list):
+            if len(extracted["extracted_fees"]) > 0:
+                fee_records = []
+                for extracted_fee in extracted["extracted_fees"]:
+                    # Override the 'name' field with the original fee name from API (name is always first)
+                    if "name" in extracted_fee:
+                        extracted_fee["name"] = fee_name
                     else:
-                        # If extracted_fees key is missing, still add fee with just the name
-                        product_result["extracted_fees"].append({
-                            "name": fee_name,
-                            "feeType": "OTHER",
-                            "feeMethodUType": NOT_FOUND,
-                            "explanation": "Model response missing extracted_fees; recorded fee name only."
-                        })
-                        seen_fee_names.add(fee_name)
-                except Exception as e:
-                    # On error, still record the fee with error info
-                    product_result["extracted_fees"].append({
-                        "name": fee_name,
-                        "feeType": "OTHER",
-                        "feeMethodUType": NOT_FOUND,
-                        "explanation": "Extraction failed; recorded error details.",
-                        "error": str(e),
-                        "original_additional_info": additional_info
-                    })
-                    seen_fee_names.add(fee_name)
-            
-            # Only add product if it has extracted fees
-            if product_result["extracted_fees"]:
+                        extracted_fee = {"name": fee_name, **extracted_fee}
+
+                    fee_records.append(extracted_fee)
+                return fee_records
+
+            # If AI returned empty array, still add fee with just the name
+            return [{
+                "name": fee_name,
+                "feeType": "OTHER",
+                "feeMethodUType": NOT_FOUND,
+                "explanation": "Model returned no extracted fees; recorded fee name only."
+            }]
+
+        # If extracted_fees key is missing, still add fee with just the name
+        return [{
+            "name": fee_name,
+            "feeType": "OTHER",
+            "feeMethodUType": NOT_FOUND,
+            "explanation": "Model response missing extracted_fees; recorded fee name only."
+        }]
+
+    @staticmethod
+    def _error_fee(fee_name: str, additional_info: str, error: Exception) -> dict:
+        # On error, still record the fee with error info
+        return {
+            "name": fee_name,
+            "feeType": "OTHER",
+            "feeMethodUType": NOT_FOUND,
+            "explanation": "Extraction failed; recorded error details.",
+            "error": str(error),
+            "original_additional_info": additional_info
+        }
+
+    def _run_counters(self) -> dict:
+        """Snapshot of cumulative cache/scheduler counters; a run reports the difference."""
+        return {
+            "extraction_cache_hits": self.cache.hits if self.cache is not None else 0,
+            "extraction_cache_misses": self.cache.misses if self.cache is not None else 0,
+            "llm_retries": self.scheduler.retries if self.scheduler is not None else 0,
+            "llm_rate_limited": self.scheduler.throttled if self.scheduler is not None else 0,
+            "batched_requests": self.batched_requests,
+            "batch_fallback_fees": self.batch_fallback_fees,
+            "schema_checked_fees": self.schema_checked_fees,
+            "schema_invalid_fees": self.schema_invalid_fees,
+            "schema_repairs": self.schema_repairs,
+            "schema_repair_failures": self.schema_repair_failures,
+            "schema_validation_us": int(self.schema_validation_seconds * 1_000_000),
+            "fee_text_index_hits": self.text_index.served if self.text_index is not None else 0,
+        }
+
+    def _record_run_counters(self, results: dict, counters_before: dict) -> None:
+        for key, value in self._run_counters().items():
+            results["summary"][key] = value - counters_before[key]
+
+    def _assemble_product(self, plan: dict, plan_outcomes: List[Any]) -> Optional[dict]:
+        """Flatten one product's job outcomes into its output record (None if it has no fees)."""
+        product_result = {
+            "product_id": plan["product_id"],
+            "product_name": plan["product_name"],
+            "extracted_fees": []
+        }
+
+        carried = plan.get("carried", {})
+        for j, ((fee_name, additional_info), outcome) in enumerate(zip(plan["jobs"], plan_outcomes)):
+            if j in carried:
+                product_result["extracted_fees"].extend(carried[j])
+                continue
+            if isinstance(outcome, Exception):
+                product_result["extracted_fees"].append(self._error_fee(fee_name, additional_info, outcome))
+                continue
+            try:
+                product_result["extracted_fees"].extend(
+                    self._flatten_extracted(fee_name, additional_info, outcome)
+                )
+            except Exception as e:
+                product_result["extracted_fees"].append(self._error_fee(fee_name, additional_info, e))
+
+        # Only add product if it has extracted fees
+        return product_result if product_result["extracted_fees"] else None
+
+    def _assemble_products(self, results: dict, plans: List[dict], outcomes: List[List[Any]]) -> None:
+        """Flatten per-job outcomes into results["products"], in plan order."""
+        for plan, plan_outcomes in zip(plans, outcomes):
+            product_result = self._assemble_product(plan, plan_outcomes)
+            if product_result is not None:
                 results["products"].append(product_result)
-            
-            # Increment products processed counter
-            products_processed += 1
 
-        if progress is not None:
-            progress.finish()
+    def _fee_hashes(self, plans: List[dict]) -> dict:
+        """The content hashes a later run diffs against, tied to the prompt and model that produced the output."""
+        return {
+            "prompt_version": self.prompt.version,
+            "model": self.model,
+            "products": {
+                plan["product_id"]: {fee_name: fee_hash for (fee_name, _), fee_hash in zip(plan["jobs"], plan["fee_hashes"])}
+                for plan in plans
+            },
+        }
+
+    @staticmethod
+    def _load_previous(bank_name: str, previous_path: Optional[str]) -> Optional[dict]:
+        """Load an earlier output file (or checkpoint) of this bank, if there is one."""
+        if previous_path is None or not Path(previous_path).exists():
+            return None
+        if str(previous_path).endswith(".jsonl"):
+            return ExtractionCheckpoint(previous_path, bank_name).finalize()
+        with open(previous_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _carry_forward(self, results: dict, plans: List[dict], previous: dict) -> None:
+        """
+        Diff the planned fees against a previous run and reuse the unchanged ones.
+
+        A fee is identified by (product_id, fee name). Its previous records are
+        carried forward (plan["carried"]) only when its content hash matches, the
+        previous run used the same prompt and model, and none of its records
+        failed; every other fee is extracted again.
+        """
+        summary = results["summary"]
+        counts = {"fees_added": 0, "fees_changed": 0, "fees_unchanged": 0, "fees_removed": 0, "fees_carried_forward": 0}
+
+        previous_hashes = previous.get("fee_hashes") or {}
+        same_extractor = (
+            previous_hashes.get("prompt_version") == self.prompt.version
+            and previous_hashes.get("model") == self.model
+        )
+        previous_products = previous_hashes.get("products", {})
+
+        # Every record of a source fee carries that fee's name.
+        previous_records: Dict[str, Dict[str, List[dict]]] = {}
+        for product in previous.get("products", []):
+            records_by_name = previous_records.setdefault(product["product_id"], {})
+            for record in product.get("extracted_fees", []):
+                records_by_name.setdefault(record.get("name"), []).append(record)
+
+        current = set()
+        for plan in plans:
+            old_hashes = previous_products.get(plan["product_id"], {})
+            old_records = previous_records.get(plan["product_id"], {})
+            carried = {}
+
+            for j, ((fee_name, _), fee_hash) in enumerate(zip(plan["jobs"], plan["fee_hashes"])):
+                current.add((plan["product_id"], fee_name))
+                if fee_name not in old_hashes:
+                    counts["fees_added"] += 1
+                    continue
+                if old_hashes[fee_name] != fee_hash:
+                    counts["fees_changed"] += 1
+                    continue
+
+                counts["fees_unchanged"] += 1
+                records = old_records.get(fee_name)
+                if same_extractor and records and not any("error" in record for record in records):
+                    carried[j] = records
+                    counts["fees_carried_forward"] += 1
+
+            if carried:
+                plan["carried"] = carried
+
+        counts["fees_removed"] = sum(
+            1
+            for product_id, fee_hashes in previous_products.items()
+            for fee_name in fee_hashes
+            if (product_id, fee_name) not in current
+        )
+        summary.update(counts)
+
+    def _rule_extraction(self, plan: dict, j: int) -> Optional[dict]:
+        """
+        Raw extraction of one job from the rule engine, or None if it needs the model.
+
+        Rule output copies CDR amount and rate fields as published, so it passes
+        the same schema check as model output; a malformed value goes to extract().
+        """
+        if self.rules is None:
+            return None
+        fee_name, additional_info = plan["jobs"][j]
+        raw = self.rules.resolve(plan["brand_name"], plan["product_name"], fee_name, additional_info, plan["source_fees"][j])
+        if raw is None:
+            return None
+        if any(self._fee_errors(fee) for fee in raw["extracted_fees"]):
+            self.rules_invalid_fees += 1
+            return None
+        return raw
+
+    def _apply_rules(self, results: dict, plans: List[dict]) -> None:
+        """Resolve every job the rules fully determine (plan["resolved"]) and count the short-circuit."""
+        summary = results["summary"]
+        considered = 0
+        resolved_count = 0
+        invalid_before = self.rules_invalid_fees
+
+        for plan in plans:
+            resolved = {}
+            for j in self._pending_jobs(plan):
+                considered += 1
+                raw = self._rule_extraction(plan, j)
+                if raw is not None:
+                    resolved[j] = self._postprocess_extraction(raw, plan["jobs"][j][1], plan["jobs"][j][0])
+            if resolved:
+                plan["resolved"] = resolved
+                resolved_count += len(resolved)
+
+        summary["fees_resolved_by_rules"] = resolved_count
+        summary["rules_invalid_fees"] = self.rules_invalid_fees - invalid_before
+        summary["rules_short_circuit_pct"] = round(100 * resolved_count / considered, 1) if considered else 0.0
+
+    def check_rules(self, bank_name: str, previous_path: str, json_path: str = PRODUCT_DETAILS_PATH) -> dict:
+        """
+        Golden check: compare what the rules resolve for a bank with an earlier model run.
+
+        Returns:
+            FeeRuleEngine.compare() report plus the bank's short-circuit counters
+        """
+        results = self._new_results(bank_name)
+        plans = self._plan_products(bank_name, self._load_bank_data(bank_name, json_path), results["summary"])
+        self._apply_rules(results, plans)
+
+        resolved_records = {
+            plan["product_id"]: {
+                plan["jobs"][j][0]: self._flatten_extracted(plan["jobs"][j][0], plan["jobs"][j][1], outcome)
+                for j, outcome in plan["resolved"].items()
+            }
+            for plan in plans
+            if "resolved" in plan
+        }
+        with open(previous_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+        report = FeeRuleEngine.compare(resolved_records, previous)
+        report["fees_resolved_by_rules"] = results["summary"]["fees_resolved_by_rules"]
+        report["rules_invalid_fees"] = results["summary"]["rules_invalid_fees"]
+        report["rules_short_circuit_pct"] = results["summary"]["rules_short_circuit_pct"]
+        return report
+
+    def _plan_run(
+        self,
+        bank_name: str,
+        bank_data: dict,
+        max_products: Optional[int],
+        checkpoint_path: Optional[str],
+        resume: bool,
+        previous_path: Optional[str],
+    ) -> Tuple[dict, List[dict], Optional[ExtractionCheckpoint]]:
+        """Plan a bank run shared by both engines: (results, plans left to run, checkpoint)."""
+        results = self._new_results(bank_name)
+        plans = self._plan_products(bank_name, bank_data, results["summary"], max_products)
+        results["fee_hashes"] = self._fee_hashes(plans)
+
+        previous = self._load_previous(bank_name, previous_path)
+        if previous is not None:
+            self._carry_forward(results, plans, previous)
+        self._apply_rules(results, plans)
+
+        checkpoint, plans = self._open_checkpoint(bank_name, results, plans, checkpoint_path, resume)
+        if self.text_index is not None:
+            for plan in plans:
+                for j in self._pending_jobs(plan):
+                    self.text_index.add(bank_name, plan["jobs"][j][1])
+        return results, plans, checkpoint
+
+    @staticmethod
+    def _open_checkpoint(
+        bank_name: str,
+        results: dict,
+        plans: List[dict],
+        checkpoint_path: Optional[str],
+        resume: bool,
+    ) -> Tuple[Optional[ExtractionCheckpoint], List[dict]]:
+        """Start a checkpoint session and return it with the plans still left to run."""
+        if checkpoint_path is None:
+            return None, plans
+
+        checkpoint = ExtractionCheckpoint(checkpoint_path, bank_name)
+        done = checkpoint.completed_product_ids() if resume else set()
+        checkpoint.start(results["summary"], [plan["product_id"] for plan in plans], resume, metadata={"fee_hashes": results["fee_hashes"]})
+
+        if done:
+            print(f"Resuming {bank_name}: {len(done)} products already in {checkpoint_path}")
+        return checkpoint, [plan for plan in plans if plan["product_id"] not in done]
+
+    def _finish_run(self, results: dict, state: _RunState, counters_before: dict) -> dict:
+        if state.progress is not None:
+            state.progress.finish()
+        if self.cache is not None:
+            self.cache.flush()
+
+        usage = self.usage.summarize(results["bank"], since=state.usage_mark)
+
+        if state.checkpoint is None:
+            self._assemble_products(results, state.plans, state.outcomes)
+            self._record_run_counters(results, counters_before)
+            results["summary"].update(usage)
+            return results
+
+        # Products were written as they completed; earlier sessions contribute theirs too.
+        counters_after = self._run_counters()
+        counters = {key: counters_after[key] - counters_before[key] for key in counters_after}
+        counters.update(usage)
+        state.checkpoint.finish(counters)
+        return state.checkpoint.finalize()
+
+    def run_agent(
+        self,
+        bank_name: str,
+        json_path: str = PRODUCT_DETAILS_PATH,
+        max_products: int = None,
+        show_progress: bool = False,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = False,
+        previous_path: Optional[str] = None,
+    ) -> dict:
+        """
+        Run the agent over all products for a specific bank.
         
-        return results
-    
+        Args:
+            bank_name: Name of the bank to process
+            json_path: Product details store directory (or combined JSON file)
+            max_products: Maximum number of products to process (None = all products)
+            checkpoint_path: JSONL file each completed product is appended to
+            resume: Skip products already in the checkpoint instead of starting over
+            previous_path: Earlier output (or checkpoint) of this bank; unchanged fees are carried forward
+            
+        Returns:
+            Dictionary with extracted fee information for all products
+        """
+        bank_data = self._load_bank_data(bank_name, json_path)
+        return self._run_bank(bank_name, bank_data, max_products, show_progress, checkpoint_path, resume, previous_path)
+
+    def _run_bank(
+        self,
+        bank_name: str,
+        bank_data: dict,
+        max_products: int = None,
+        show_progress: bool = False,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = False,
+        previous_path: Optional[str] = None,
+    ) -> dict:
+        """run_agent() on bank data that is already loaded."""
+        results, plans, checkpoint = self._plan_run(bank_name, bank_data, max_products, checkpoint_path, resume, previous_path)
+        progress = _RunProgress(bank_name, len(plans)) if show_progress else None
+        counters_before = self._run_counters()
+        state = _RunState(self, plans, progress, checkpoint)
+
+        try:
+            with self.usage.scope(bank=bank_name):
+                for chunk in self._chunk_jobs(plans):
+                    chunk_outcomes, usages = self._run_chunk(plans, chunk)
+                    state.record(chunk, chunk_outcomes, usages)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        return self._finish_run(results, state, counters_before)
+
+
+class AsyncAgent(Agent):
+    """
+    Agent that runs many extractions concurrently on the backend's async client.
+
+    Work is planned exactly as in Agent.run_agent, so product order, fee order,
+    per-product dedup and summary counters are identical to a sequential run.
+    """
+    _DEFAULT_MAX_CONCURRENCY = 8
+
+    def __init__(
+        self,
+        *args,
+        max_concurrency: Optional[int] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+        **kwargs,
+    ):
+        max_concurrency = max_concurrency or self._DEFAULT_MAX_CONCURRENCY
+        # Parallel runs are where 429s happen, so always schedule them.
+        if scheduler is None:
+            scheduler = RateLimitScheduler(
+                requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                max_concurrency=max_concurrency,
+            )
+        super().__init__(*args, scheduler=scheduler, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _create_completion_async(self, request: dict, kind: str = "extract"):
+        attempts = 0
+
+        async def create():
+            nonlocal attempts
+            attempts += 1
+            return await self.backend.complete_async(request)
+
+        started_at = time.perf_counter()
+        try:
+            resp = await self.scheduler.run(create, request)
+        except Exception as e:
+            self.usage.record(kind, self.model, None, time.perf_counter() - started_at, max(attempts - 1, 0), error=e)
+            raise
+
+        self.usage.record(kind, self.model, getattr(resp, "usage", None), time.perf_counter() - started_at, attempts - 1)
+        return resp
+
+    async def _validate_and_repair_async(self, obj: Any) -> Any:
+        """Async counterpart of _validate_and_repair(); repairs of one response run concurrently."""
+        invalid = self._invalid_fees(obj)
+        if not self.repair_invalid or not invalid:
+            return obj
+
+        async def repair(index: int, errors: List[str]) -> Optional[str]:
+            try:
+                resp = await self._create_completion_async(self._repair_request({"fee": obj["extracted_fees"][index], "errors": errors}), kind="repair")
+                return resp.choices[0].message.content
+            except Exception:
+                return None
+
+        contents = await asyncio.gather(*[repair(index, errors) for index, errors in invalid])
+        for (index, _), content in zip(invalid, contents):
+            self._apply_repair(obj, index, content)
+        return obj
+
+    async def _parse_or_repair_async(self, content: str) -> Any:
+        """Async counterpart of _parse_or_repair()."""
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError) as e:
+            if not self.repair_invalid or not content:
+                raise
+            error = e
+
+        resp = await self._create_completion_async(self._repair_request({"response": content, "errors": [str(error)]}), kind="repair")
+        try:
+            obj = json.loads(resp.choices[0].message.content)
+        except (TypeError, ValueError):
+            self.schema_repair_failures += 1
+            raise error
+        self.schema_repairs += 1
+        return obj
+
+    async def extract_async(self, bank: str, product: str, additional_info: str, fee_name: Optional[str] = None) -> Tuple[dict, Any]:
+        """
+        Async counterpart of extract().
+
+        Returns:
+            (extraction, usage) - usage is returned rather than stored on the
+            instance because many calls are in flight at once.
+        """
+        prompt = self.prompt
+
+        cache_key, cached = self._cache_lookup(prompt, bank, additional_info)
+        if cached is not None:
+            return self._postprocess_extraction(cached, additional_info, fee_name), None
+
+        # Identical text already in flight: wait for that call rather than racing it to the cache.
+        future = None
+        if cache_key is not None:
+            pending = self._inflight.get(cache_key)
+            if pending is not None:
+                obj = await pending
+                return self._postprocess_extraction(copy.deepcopy(obj), additional_info, fee_name), None
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[cache_key] = future
+
+        payload = {
+            "bank": bank,
+            "product": product,
+            "additional_info": additional_info,
+        }
+
+        try:
+            resp = await self._create_completion_async(self._completion_request(prompt.system, payload, self.response_format))
+            obj = await self._validate_and_repair_async(await self._parse_or_repair_async(resp.choices[0].message.content))
+        except Exception as e:
+            if future is not None:
+                future.set_exception(e)
+                future.exception()  # Mark retrieved; waiters (if any) still receive it.
+            raise
+        finally:
+            if cache_key is not None:
+                self._inflight.pop(cache_key, None)
+
+        self._store_extraction(cache_key, additional_info, obj)
+        if future is not None:
+            future.set_result(copy.deepcopy(obj))
+
+        return self._postprocess_extraction(obj, additional_info, fee_name), getattr(resp, "usage", None)
+
+    async def extract_batch_async(self, items: List[Tuple[str, str, str, Optional[str]]]) -> Tuple[List[Optional[dict]], Any]:
+        """Async counterpart of extract_batch(); returns (per-item extractions, usage)."""
+        results, cache_keys, pending = self._prepare_batch(items)
+        if not pending:
+            return results, None
+
+        self.batched_requests += 1
+        usage = None
+        try:
+            resp = await self._create_completion_async(self._batch_request(items, pending), kind="batch")
+            usage = getattr(resp, "usage", None)
+            content = resp.choices[0].message.content
+        except Exception:
+            content = None
+
+        for index, raw in self._split_batch_response(content, pending).items():
+            self._accept_batch_item(items, results, cache_keys, index, await self._validate_and_repair_async(raw))
+        return results, usage
+
+    async def _run_chunk_async(self, plans: List[dict], chunk: List[Tuple[int, int]]) -> Tuple[List[Any], List[Any]]:
+        """Async counterpart of _run_chunk()."""
+        items = self._chunk_items(plans, chunk)
+        fees = self._chunk_fees(plans, chunk)
+        usages = []
+
+        if len(items) > 1:
+            with self.usage.scope(fees=fees):
+                outcomes, usage = await self.extract_batch_async(items)
+            usages.append(usage)
+        else:
+            outcomes = [None]
+
+        for index, (bank, product, additional_info, fee_name) in enumerate(items):
+            if outcomes[index] is not None:
+                continue
+            try:
+                with self.usage.scope(fees=fees[index:index + 1]):
+                    outcomes[index], usage = await self.extract_async(bank=bank, product=product, additional_info=additional_info, fee_name=fee_name)
+                usages.append(usage)
+            except Exception as e:
+                outcomes[index] = e
+
+        return outcomes, usages
+
+    async def run_agent_async(
+        self,
+        bank_name: str,
+        json_path: str = PRODUCT_DETAILS_PATH,
+        max_products: int = None,
+        show_progress: bool = False,
+        max_concurrency: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = False,
+        previous_path: Optional[str] = None,
+    ) -> dict:
+        """
+        Concurrent version of run_agent() with at most max_concurrency LLM calls in flight.
+
+        Args:
+            bank_name: Name of the bank to process
+            json_path: Product details store directory (or combined JSON file)
+            max_products: Maximum number of products to process (None = all products)
+            show_progress: Render a progress bar of completed products
+            max_concurrency: Overrides the instance's in-flight limit for this run
+            checkpoint_path: JSONL file each completed product is appended to
+            resume: Skip products already in the checkpoint instead of starting over
+            previous_path: Earlier output (or checkpoint) of this bank; unchanged fees are carried forward
+
+        Returns:
+            Dictionary with extracted fee information for all products
+        """
+        bank_data = self._load_bank_data(bank_name, json_path)
+        return await self._run_bank_async(
+            bank_name, bank_data, max_products, show_progress, max_concurrency, checkpoint_path, resume, previous_path
+        )
+
+    async def _run_bank_async(
+        self,
+        bank_name: str,
+        bank_data: dict,
+        max_products: int = None,
+        show_progress: bool = False,
+        max_concurrency: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = False,
+        previous_path: Optional[str] = None,
+    ) -> dict:
+        """run_agent_async() on bank data that is already loaded."""
+        results, plans, checkpoint = self._plan_run(bank_name, bank_data, max_products, checkpoint_path, resume, previous_path)
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        progress = _RunProgress(bank_name, len(plans)) if show_progress else None
+        counters_before = self._run_counters()
+        state = _RunState(self, plans, progress, checkpoint)
+
+        async def run_chunk(chunk: List[Tuple[int, int]]) -> None:
+            async with semaphore:
+                chunk_outcomes, usages = await self._run_chunk_async(plans, chunk)
+            state.record(chunk, chunk_outcomes, usages)
+
+        try:
+            # Tasks copy the context when created, so every chunk's calls are attributed to this bank.
+            with self.usage.scope(bank=bank_name):
+                await asyncio.gather(*[run_chunk(chunk) for chunk in self._chunk_jobs(plans)])
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        # Outcomes are slotted by (plan, job) index, so assembly order matches the sequential run.
+        return self._finish_run(results, state, counters_before)
+
+
 
 def main():
 
@@ -963,7 +2057,7 @@ def main():
                     print(f"    {json.dumps(fee, indent=6)}")
         
         # Save to file
-        output_path = Path(f"output_{bank_name.replace(' ', '_').replace('.', '_')}_test10.json")
+        output_path = output_path_for(bank_name, "test10")
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
         print(f"\n{'='*60}")
@@ -972,11 +2066,20 @@ def main():
     
     elif MODE == 3:
         # Full run_agent for a specific bank (NO LIMIT - processes all products)
-        agent = Agent(temperature=0)
+        agent = AsyncAgent(temperature=0, max_concurrency=MAX_CONCURRENT_EXTRACTIONS, structured_outputs=STRUCTURED_OUTPUTS)
         bank_name = "Westpac" 
         
+        # Re-running after a crash or Ctrl-C picks up from the checkpoint instead of starting over.
+        checkpoint_path = Path(CHECKPOINT_DIR) / f"{output_path_for(bank_name, 'full').stem}.jsonl"
+        
         print(f"Processing bank: {bank_name} (ALL PRODUCTS - this may take a while)")
-        results = agent.run_agent(bank_name, show_progress=True)  # No max_products limit
+        results = asyncio.run(agent.run_agent_async(
+            bank_name,
+            show_progress=True,
+            checkpoint_path=str(checkpoint_path),
+            resume=True,
+            previous_path=str(output_path_for(bank_name, "full")),  # Only new/changed fees since the last run
+        ))  # No max_products limit
         
         # Print summary
         print(f"\n{'='*60}")
@@ -1001,13 +2104,68 @@ def main():
                     print(f"    {json.dumps(fee, indent=6)}")
         
         # Save to file
-        output_path = Path(f"output_{bank_name.replace(' ', '_').replace('.', '_')}_full.json")
+        output_path = output_path_for(bank_name, "full")
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
         print(f"\n{'='*60}")
         print(f"Full results saved to: {output_path}")
+        
+        # Tokens, latency and retries per fee, most expensive first.
+        usage_path = agent.usage.write_csv(output_path.with_suffix(".usage.csv"), bank_name)
+        print(f"LLM usage per fee saved to: {usage_path}")
+        
+        # The output file now holds everything the checkpoint did.
+        checkpoint_path.unlink(missing_ok=True)
+        
         print(f"Processed {results['summary']['total_products']} products total")
 
+    elif MODE == 4:
+        # Nightly/offline re-extraction: latency doesn't matter, cost and rate limits do.
+        from BatchApiRunner import BatchApiRunner
+
+        agent = Agent(temperature=0, dedup_across_banks=DEDUP_ACROSS_BANKS)
+        runner = BatchApiRunner(agent)
+        all_results = runner.run(PRODUCT_DETAILS_PATH, bank_names=BATCH_API_BANKS)
+
+        print(f"\n{'='*60}")
+        print("SUMMARY")
+        print(f"{'='*60}")
+        for bank_name, results in all_results.items():
+            print(f"{bank_name}: {json.dumps(results['summary'])}")
+
+    elif MODE == 5:
+        # Full refresh of every bank: one load of the combined file, one shared LLM budget.
+        from MultiBankRunner import MultiBankRunner
+
+        agent = AsyncAgent(
+            temperature=0,
+            max_concurrency=MAX_CONCURRENT_EXTRACTIONS,
+            structured_outputs=STRUCTURED_OUTPUTS,
+            dedup_across_banks=DEDUP_ACROSS_BANKS,
+        )
+        runner = MultiBankRunner(agent, workers=MULTI_BANK_WORKERS)
+        aggregate = runner.run(PRODUCT_DETAILS_PATH, bank_names=MULTI_BANK_NAMES)
+
+        print(f"\n{'='*60}")
+        print("SUMMARY")
+        print(f"{'='*60}")
+        print(json.dumps(aggregate["totals"], indent=2))
+        if "fee_text_dedup" in aggregate:
+            print(json.dumps(aggregate["fee_text_dedup"], indent=2))
+        for bank_name, error in aggregate["failures"].items():
+            print(f"FAILED {bank_name}: {error}")
+
+    elif MODE == 6:
+        # Rules must agree with what the model produced for the fees they short-circuit.
+        agent = Agent(temperature=0)
+        bank_name = "Westpac"
+        report = agent.check_rules(bank_name, str(output_path_for(bank_name, "full")))
+
+        print(f"Rules resolve {report['fees_resolved_by_rules']} fees ({report['rules_short_circuit_pct']}% of the bank)")
+        print(f"Matched previous model output on {report['matched']}/{report['compared']} ({report['match_pct']}%)")
+        for mismatch in report["mismatches"]:
+            print(f"  MISMATCH {mismatch['product_id']} / {mismatch['name']}: rules={mismatch['rules']} model={mismatch['model']}")
+
 
 if __name__ == "__main__":
     main()
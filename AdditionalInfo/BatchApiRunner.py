@@ -0,0 +1,237 @@
+import copy
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from Agent import Agent, output_path_for
+
+
+class BatchApiRunner:
+    """
+    Offline extraction through the OpenAI Batch API.
+
+    Every pending extract() request for one or more banks is written to a JSONL
+    batch file, submitted, polled until the batch finishes, and merged back
+    through the same post-processing and flattening as Agent.run_agent. Fee text
+    already in the extraction cache is resolved locally, and identical requests
+    are only sent once (across banks too, with Agent(dedup_across_banks=True)).
+    A manifest next to the batch file lets a later process collect a batch it
+    did not submit.
+    """
+    _POLL_INTERVAL = 60
+    _TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+    _ENDPOINT = "/v1/chat/completions"
+
+    def __init__(self, agent: Agent, work_dir: str = "batch_runs", client: Any = None, poll_interval: Optional[float] = None):
+        self.agent = agent
+        # Point `client` at a stand-in server (base_url) to replay canned batches offline.
+        self.client = client or agent.client
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval or self._POLL_INTERVAL
+
+    def prepare(self, json_path: str, bank_names: Optional[List[str]] = None, run_name: Optional[str] = None) -> Path:
+        """
+        Plan every bank and write the batch input file plus its manifest.
+
+        Returns:
+            Path to the manifest JSON.
+        """
+        run_name = run_name or time.strftime("%Y%m%dT%H%M%S")
+        input_path = self.work_dir / f"{run_name}.jsonl"
+        manifest_path = self.work_dir / f"{run_name}.manifest.json"
+
+        banks = {}
+        requests = {}   # custom_id -> cache key (or None)
+        lines_written = 0
+
+        with open(input_path, "w", encoding="utf-8") as f:
+            for bank_name, bank_data in self.agent._iter_banks(json_path, bank_names):
+                results = self.agent._new_results(bank_name)
+                plans = self.agent._plan_products(bank_name, bank_data, results["summary"])
+                results["fee_hashes"] = self.agent._fee_hashes(plans)
+                job_requests = []
+                resolved_by_rules = 0
+                invalid_before = self.agent.rules_invalid_fees
+
+                for plan in plans:
+                    plan_requests = []
+                    for j, (_, additional_info) in enumerate(plan["jobs"]):
+                        bank = plan["brand_name"]
+                        resolved = self.agent._rule_extraction(plan, j)
+                        if resolved is not None:
+                            # Post-processed at collect time exactly like a cached response.
+                            plan_requests.append({"cached": resolved})
+                            resolved_by_rules += 1
+                            continue
+
+                        if self.agent.text_index is not None:
+                            self.agent.text_index.add(bank_name, additional_info)
+                        cache_key, cached = self.agent._cache_lookup(self.agent.prompt, bank, additional_info)
+
+                        if cached is not None:
+                            plan_requests.append({"cached": cached})
+                            continue
+
+                        # Identical requests share one batch line (keyed by cache key when caching is on).
+                        custom_id = cache_key or f"req-{lines_written}"
+                        if custom_id not in requests:
+                            payload = {
+                                "bank": bank,
+                                "product": plan["product_name"],
+                                "additional_info": additional_info,
+                            }
+                            body = {**self.agent._completion_request(self.agent.prompt.system, payload, self.agent.response_format), "seed": 0}
+                            line = {"custom_id": custom_id, "method": "POST", "url": self._ENDPOINT, "body": body}
+                            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                            requests[custom_id] = cache_key
+                            lines_written += 1
+                        plan_requests.append({"custom_id": custom_id})
+                    job_requests.append(plan_requests)
+
+                total_jobs = sum(len(plan["jobs"]) for plan in plans)
+                results["summary"]["fees_resolved_by_rules"] = resolved_by_rules
+                results["summary"]["rules_invalid_fees"] = self.agent.rules_invalid_fees - invalid_before
+                results["summary"]["rules_short_circuit_pct"] = round(100 * resolved_by_rules / total_jobs, 1) if total_jobs else 0.0
+
+                banks[bank_name] = {"results": results, "plans": plans, "requests": job_requests}
+
+        manifest = {
+            "input_file": str(input_path),
+            "prompt_version": self.agent.prompt.version,
+            "model": self.agent.model,
+            "requests": requests,
+            "banks": banks,
+            "batch_id": None,
+        }
+        if self.agent.text_index is not None:
+            manifest["fee_text_dedup"] = self.agent.text_index.stats()
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        print(f"Wrote {lines_written} batch requests for {len(banks)} banks to {input_path}")
+        if "fee_text_dedup" in manifest:
+            print(f"Fee text dedup across banks: {manifest['fee_text_dedup']}")
+        return manifest_path
+
+    def submit(self, manifest_path: Path) -> str:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if not manifest["requests"]:
+            print("Nothing to submit: every request was served from the cache")
+            return ""
+
+        with open(manifest["input_file"], "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self._ENDPOINT,
+            completion_window="24h",
+            metadata={"prompt_version": manifest["prompt_version"]},
+        )
+
+        manifest["batch_id"] = batch.id
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        print(f"Submitted batch {batch.id} ({len(manifest['requests'])} requests)")
+        return batch.id
+
+    def wait(self, batch_id: str) -> Any:
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            print(
+                f"Batch {batch_id}: {batch.status}"
+                + (f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else "")
+            )
+            if batch.status in self._TERMINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    def _read_file(self, file_id: Optional[str]) -> List[dict]:
+        if not file_id:
+            return []
+        text = self.client.files.content(file_id).text
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def collect(self, manifest_path: Path, batch: Any = None) -> Dict[str, dict]:
+        """
+        Merge batch output back into per-bank results shaped like run_agent's.
+
+        Returns:
+            {bank_name: results}
+        """
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if batch is None and manifest["batch_id"]:
+            batch = self.client.batches.retrieve(manifest["batch_id"])
+
+        outcomes_by_id: Dict[str, Any] = {}
+        if batch is not None:
+            for line in self._read_file(getattr(batch, "output_file_id", None)) + self._read_file(getattr(batch, "error_file_id", None)):
+                custom_id = line.get("custom_id")
+                response = line.get("response") or {}
+                try:
+                    if line.get("error") or response.get("status_code") != 200:
+                        raise RuntimeError(f"Batch request failed: {line.get('error') or response.get('body')}")
+                    raw = json.loads(response["body"]["choices"][0]["message"]["content"])
+                except Exception as e:
+                    outcomes_by_id[custom_id] = e
+                    continue
+
+                # Offline runs repair invalid fees too; only the offending fees go back to the model.
+                raw = self.agent._validate_and_repair(raw)
+                cache_key = manifest["requests"].get(custom_id)
+                if cache_key and self.agent.cache is not None:
+                    self.agent.cache.set(cache_key, raw)
+                outcomes_by_id[custom_id] = raw
+
+        all_results = {}
+        for bank_name, bank in manifest["banks"].items():
+            results, plans = bank["results"], bank["plans"]
+            outcomes = []
+            failures = 0
+
+            for plan, plan_requests in zip(plans, bank["requests"]):
+                plan_outcomes = []
+                for (fee_name, additional_info), request in zip(plan["jobs"], plan_requests):
+                    raw = request.get("cached")
+                    if raw is None:
+                        raw = outcomes_by_id.get(request["custom_id"], RuntimeError("No result returned for batch request"))
+                    if isinstance(raw, Exception):
+                        failures += 1
+                        plan_outcomes.append(raw)
+                        continue
+                    try:
+                        plan_outcomes.append(self.agent._postprocess_extraction(copy.deepcopy(raw), additional_info, fee_name))
+                    except Exception as e:
+                        failures += 1
+                        plan_outcomes.append(e)
+                outcomes.append(plan_outcomes)
+
+            self.agent._assemble_products(results, plans, outcomes)
+            results["summary"]["batch_api_requests"] = sum(1 for plan_requests in bank["requests"] for r in plan_requests if "custom_id" in r)
+            results["summary"]["batch_api_failures"] = failures
+            all_results[bank_name] = results
+
+        return all_results
+
+    def run(self, json_path: str, bank_names: Optional[List[str]] = None, write_outputs: bool = True) -> Dict[str, dict]:
+        manifest_path = self.prepare(json_path, bank_names)
+        batch_id = self.submit(manifest_path)
+        batch = self.wait(batch_id) if batch_id else None
+        all_results = self.collect(manifest_path, batch)
+
+        if write_outputs:
+            for bank_name, results in all_results.items():
+                output_path = output_path_for(bank_name, "full")
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(results, f, indent=2, ensure_ascii=False)
+                print(f"Full results saved to: {output_path}")
+
+        return all_results
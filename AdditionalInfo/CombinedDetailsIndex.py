@@ -0,0 +1,159 @@
+import json
+import mmap
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# A JSON string (escapes included) or a bracket; everything else is skipped in C by the regex engine.
+_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]', re.DOTALL)
+_WHITESPACE = (b" ", b"\t", b"\r", b"\n")
+
+
+class CombinedDetailsIndex:
+    """
+    Byte-offset index of the banks in combined_product_details.json.
+
+    The combined file holds every bank's v4/v5/v6 detail responses; parsing all
+    of it to read one bank costs memory proportional to the whole register. The
+    index records where each top-level bank's value starts and ends, so a bank
+    is read and parsed on its own and peak memory follows the largest bank.
+
+    Building the index is one scan of the file through mmap. It is saved next to
+    the file (<file>.index.json) keyed on size and mtime, and rebuilt whenever
+    the combined file is rewritten.
+    """
+    _INDEX_VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f"File not found: {path}")
+        self.index_path = self.path.with_name(self.path.name + ".index.json")
+        self._banks: Dict[str, dict] = self._load_or_build()
+
+    def _file_key(self) -> dict:
+        stat = self.path.stat()
+        return {"version": self._INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _load_or_build(self) -> Dict[str, dict]:
+        file_key = self._file_key()
+
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("file") == file_key:
+                    return saved["banks"]
+            except (OSError, ValueError, KeyError):
+                pass  # Unreadable or stale index; rebuild it below.
+
+        banks = self._scan()
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump({"file": file_key, "banks": banks}, f, ensure_ascii=False)
+        except OSError:
+            pass  # Read-only location: the in-memory index still works for this process.
+        return banks
+
+    def _scan(self) -> Dict[str, dict]:
+        """Find the byte range of every top-level value without parsing the values."""
+        banks: Dict[str, dict] = {}
+        if self.path.stat().st_size == 0:
+            raise ValueError(f"Empty JSON file: {self.path}")
+
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            first_byte = self._skip_whitespace(data, 0)
+            if data[first_byte:first_byte + 1] != b"{":
+                raise ValueError(f"Expected a JSON object of banks in {self.path}")
+
+            depth = 0
+            key: Optional[str] = None
+            value_start = 0
+
+            for match in _TOKEN.finditer(data):
+                token = match.group()
+                first = token[:1]
+
+                if first == b'"':
+                    if depth == 1:
+                        if key is None:
+                            key = json.loads(token.decode("utf-8"))
+                            value_start = self._skip_to_value(data, match.end())
+                            if data[value_start:value_start + 1] not in (b'"', b"{", b"["):
+                                # Scalar value (number/true/false/null): no tokens inside it.
+                                banks[key] = self._span(data, value_start, self._scalar_end(data, value_start))
+                                key = None
+                        else:
+                            # String value of a top-level key.
+                            banks[key] = self._span(data, value_start, match.end())
+                            key = None
+                    continue
+
+                if first in (b"{", b"["):
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 1 and key is not None:
+                        banks[key] = self._span(data, value_start, match.end())
+                        key = None
+
+            if depth != 0:
+                raise ValueError(f"Unbalanced JSON in {self.path}")
+
+        return banks
+
+    @staticmethod
+    def _skip_whitespace(data: mmap.mmap, position: int) -> int:
+        while data[position:position + 1] in _WHITESPACE:
+            position += 1
+        return position
+
+    @classmethod
+    def _skip_to_value(cls, data: mmap.mmap, key_end: int) -> int:
+        colon = data.find(b":", key_end)
+        if colon < 0:
+            raise ValueError("Malformed JSON: key without a value")
+        return cls._skip_whitespace(data, colon + 1)
+
+    @staticmethod
+    def _scalar_end(data: mmap.mmap, start: int) -> int:
+        end = start
+        while data[end:end + 1] not in (b",", b"}", b""):
+            end += 1
+        while end > start and data[end - 1:end] in _WHITESPACE:
+            end -= 1
+        return end
+
+    @staticmethod
+    def _span(data: mmap.mmap, start: int, end: int) -> dict:
+        return {"start": start, "end": end, "object": data[start:start + 1] == b"{"}
+
+    def bank_names(self, objects_only: bool = False) -> List[str]:
+        return [name for name, span in self._banks.items() if span["object"] or not objects_only]
+
+    def __contains__(self, bank_name: str) -> bool:
+        return bank_name in self._banks
+
+    def load(self, bank_name: str):
+        """Read and parse a single bank's value."""
+        span = self._banks[bank_name]
+        with open(self.path, "rb") as f:
+            f.seek(span["start"])
+            raw = f.read(span["end"] - span["start"])
+        return json.loads(raw)
+
+    def iter_banks(self, bank_names: Optional[List[str]] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Yield (bank_name, data) one bank at a time, in file order.
+
+        With bank_names=None, banks whose value is not an object are skipped.
+        """
+        if bank_names is None:
+            bank_names = self.bank_names(objects_only=True)
+        else:
+            missing = [name for name in bank_names if name not in self._banks]
+            if missing:
+                raise ValueError(f"Banks not found: {missing}")
+
+        for bank_name in bank_names:
+            yield bank_name, self.load(bank_name)
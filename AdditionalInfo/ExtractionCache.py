@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so cosmetic differences in the source text share a cache entry."""
+    return " ".join((text or "").split())
+
+
+class ExtractionCache:
+    """
+    Persistent, size-bounded LRU cache for raw model extractions.
+
+    Entries are content-addressed: the key is a hash of the bank, the normalized
+    input text, the model name and the prompt fingerprint, so changing any of them
+    misses instead of serving stale output. Values are the parsed model JSON
+    before post-processing, which keeps post-processing changes cache-safe.
+
+    Hits update last_used in memory; the touches are written in one transaction
+    by flush(), before an eviction, or once _TOUCH_FLUSH_SIZE are pending.
+    """
+    _DEFAULT_MAX_ENTRIES = 50_000
+    _TOUCH_FLUSH_SIZE = 1_000
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries or self._DEFAULT_MAX_ENTRIES
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._touched: dict[str, float] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(bank: str, additional_info: str, model: str, prompt_version: str) -> str:
+        """
+        Build the content address for an extraction.
+
+        The product name is deliberately left out so the same fee text repeated
+        across a bank's products resolves to one entry.
+        """
+        material = json.dumps(
+            [bank, normalize_text(additional_info), model, prompt_version],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            # Touch the entry so eviction is least-recently-used, not least-recently-written.
+            self._touched[key] = time.time()
+            if len(self._touched) >= self._TOUCH_FLUSH_SIZE:
+                self._write_touches()
+                self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._touched.pop(key, None)
+            exists = self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            if not exists:
+                self._size += 1
+
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._write_touches()
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._size -= overflow
+                self.evictions += overflow
+
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self._size,
+        }
+
+    def flush(self) -> None:
+        """Write pending last_used touches."""
+        with self._lock:
+            if self._touched:
+                self._write_touches()
+                self._conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def _write_touches(self) -> None:
+        self._conn.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()],
+        )
+        self._touched.clear()
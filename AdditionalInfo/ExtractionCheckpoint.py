@@ -0,0 +1,129 @@
+import json
+from pathlib import Path
+from typing import Optional
+
+
+class ExtractionCheckpoint:
+    """
+    Append-only JSONL checkpoint for one bank's extraction run.
+
+    Line types:
+        {"type": "run_started", "bank", "summary", "product_order", "metadata"}
+            planning counters, product order and extra top-level output keys
+        {"type": "product", "product_id", "result"}
+            a completed product (result None if it produced no fees)
+        {"type": "run_finished", "counters"}
+            runtime counters of one session
+
+    Lines are flushed as they are written, so a crash or Ctrl-C loses at most the
+    products still in flight. finalize() rebuilds the run_agent output shape from
+    the file alone.
+    """
+
+    def __init__(self, path: str, bank_name: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.bank_name = bank_name
+        self._file = None
+
+    def _read_lines(self) -> list:
+        if not self.path.exists():
+            return []
+
+        lines = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    lines.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line torn by an interrupted write; every other line is intact.
+                    continue
+        return lines
+
+    def completed_product_ids(self) -> set:
+        return {line["product_id"] for line in self._read_lines() if line.get("type") == "product"}
+
+    def start(self, summary: dict, product_order: list, resume: bool, metadata: Optional[dict] = None) -> None:
+        if not resume and self.path.exists():
+            self.path.unlink()
+        elif self.path.exists() and self.path.stat().st_size > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, 2)
+                torn = f.read(1) != b"\n"
+            if torn:
+                # Keep the new session's lines off the torn one.
+                self._write_raw("\n")
+
+        self._write({
+            "type": "run_started",
+            "bank": self.bank_name,
+            "summary": summary,
+            "product_order": product_order,
+            "metadata": metadata or {},
+        })
+
+    def write_product(self, product_id: str, result: Optional[dict]) -> None:
+        self._write({"type": "product", "product_id": product_id, "result": result})
+
+    def finish(self, counters: dict) -> None:
+        self._write({"type": "run_finished", "counters": counters})
+        self.close()
+
+    def _write(self, line: dict) -> None:
+        self._write_raw(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def _write_raw(self, text: str) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(text)
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def _add_counters(cls, totals: dict, counters: dict) -> None:
+        """Sum one session's counters into totals; nested dicts (usage per product) are summed key by key."""
+        for key, value in counters.items():
+            if isinstance(value, dict):
+                cls._add_counters(totals.setdefault(key, {}), value)
+            else:
+                total = totals.get(key, 0) + value
+                totals[key] = round(total, 1) if isinstance(total, float) else total
+
+    def finalize(self) -> dict:
+        """Assemble {"bank", "products", "summary"} from the checkpoint, in product order."""
+        summary = {}
+        product_order = []
+        metadata = {}
+        results_by_id = {}
+        counters = {}
+
+        for line in self._read_lines():
+            line_type = line.get("type")
+            if line_type == "run_started":
+                # Planning is deterministic, so the latest session's counters describe the whole bank.
+                summary = dict(line["summary"])
+                product_order = line["product_order"]
+                metadata = line.get("metadata", {})
+            elif line_type == "product":
+                results_by_id[line["product_id"]] = line["result"]
+            elif line_type == "run_finished":
+                self._add_counters(counters, line["counters"])
+
+        summary.update(counters)
+        return {
+            "bank": self.bank_name,
+            "products": [
+                results_by_id[product_id]
+                for product_id in product_order
+                if results_by_id.get(product_id)
+            ],
+            "summary": summary,
+            **metadata,
+        }
@@ -0,0 +1,167 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+
+# Keyword rules for feeType, highest priority first. A rule wins when any of its
+# keywords occurs anywhere in the lowercased "fee name + source text".
+FEE_TYPE_RULES = (
+    # EXIT / closure / payout signals
+    ("exit", "EXIT", ("prepayment", "pay out", "payout", "paid out", "refinanc", "discharge", "termination", "close", "closure", "exit")),
+    # Upfront / establishment signals
+    ("upfront", "UPFRONT", ("establishment", "application", "set up", "setup", "joining")),
+    # Late / missed payment signals
+    ("late_payment", "LATE_PAYMENT", ("missed payment", "late payment", "overdue", "default notice", "arrears")),
+    # Dishonour / overdrawn signals
+    ("dishonour", "DISHONOR", ("dishonour", "dishonor", "overdrawn", "nsf", "bounced")),
+    # Basic transaction types
+    ("cash_advance", "CASH_ADVANCE", ("cash advance",)),
+    ("withdrawal", "WITHDRAWAL", ("withdrawal", "atm")),
+    ("deposit", "DEPOSIT", ("deposit",)),
+    ("enquiry", "ENQUIRY", ("enquiry", "inquiry", "balance")),
+    ("replacement", "REPLACEMENT", ("replacement",)),
+    # Periodic signals
+    ("periodic", "PERIODIC", ("monthly", "per month", "annual", "per year", "yearly", "quarterly")),
+)
+
+# Flattened once, in priority order: the first keyword found decides. Plain substring
+# tests beat a single regex alternation here (CPython's re tries every alternative
+# at every offset), and repeated fee text is served from the memo.
+_KEYWORD_RULES = tuple(
+    (keyword, fee_type, f"{rule_id}:{keyword}")
+    for rule_id, fee_type, keywords in FEE_TYPE_RULES
+    for keyword in keywords
+)
+
+
+@lru_cache(maxsize=16384)
+def match_fee_type(fee_name: str, source_text: str) -> Optional[Tuple[str, str]]:
+    """
+    Apply FEE_TYPE_RULES to a fee.
+
+    Returns:
+        (feeType, rule id) for the highest-priority matching rule, e.g.
+        ("EXIT", "exit:pay out"), or None when no keyword matches
+    """
+    haystack = f"{fee_name} {source_text}".lower()
+    for keyword, fee_type, rule_id in _KEYWORD_RULES:
+        if keyword in haystack:
+            return fee_type, rule_id
+    return None
+
+
+class FeeRuleEngine:
+    """
+    Resolve fees whose extraction is fully determined without the model.
+
+    A fee is resolved when it has no additionalInfo (the model would only see
+    its name), a keyword rule fixes its feeType, and its structured CDR pricing
+    fields determine the fee method: none of them means NF, exactly one of
+    amount / balanceRate / transactionRate / accruedRate gives fixedAmount or
+    rateBased. Anything else is ambiguous free text and goes to extract().
+
+    The result has the same shape as a raw model response, so it is
+    post-processed and flattened exactly like one.
+    """
+    _RATE_FIELDS = {
+        "balanceRate": "BALANCE",
+        "transactionRate": "TRANSACTION",
+        "accruedRate": "INTEREST_ACCRUED",
+    }
+    _DIGIT = re.compile(r"\d")
+
+    @staticmethod
+    def _present(fee: dict, field: str) -> bool:
+        value = fee.get(field)
+        return isinstance(value, str) and bool(value.strip())
+
+    def resolve(self, bank: str, product: str, fee_name: str, additional_info: str, fee: dict) -> Optional[dict]:
+        """Return the extraction for this fee, or None if the model is needed."""
+        if self._present(fee, "additionalInfo"):
+            return None
+        # Numbers in the name ("2 free ATM withdrawals") are for the model to read.
+        if self._DIGIT.search(additional_info):
+            return None
+
+        matched = match_fee_type(fee_name, additional_info)
+        if matched is None:
+            return None
+        fee_type, rule_id = matched
+
+        pricing = [field for field in ("amount", *self._RATE_FIELDS) if self._present(fee, field)]
+        if len(pricing) > 1:
+            return None
+
+        extracted = {"name": fee_name, "feeType": fee_type}
+        if not pricing:
+            extracted["feeMethodUType"] = "NF"
+            explanation = f"Fee name \"{fee_name}\" determines the fee type (rule {rule_id}); no amount or rate is stated."
+        elif pricing[0] == "amount":
+            extracted["feeMethodUType"] = "fixedAmount"
+            extracted["fixedAmount"] = {"amount": fee["amount"].strip()}
+            explanation = f"Fee name \"{fee_name}\" determines the fee type (rule {rule_id}); amount from the CDR amount field."
+        else:
+            field = pricing[0]
+            extracted["feeMethodUType"] = "rateBased"
+            extracted["rateBased"] = {"rateType": self._RATE_FIELDS[field], "rate": fee[field].strip()}
+            if self._present(fee, "accrualFrequency"):
+                extracted["rateBased"]["accrualFrequency"] = fee["accrualFrequency"].strip()
+            explanation = f"Fee name \"{fee_name}\" determines the fee type (rule {rule_id}); rate from the CDR {field} field."
+
+        if self._present(fee, "currency"):
+            extracted["currency"] = fee["currency"].strip()
+        extracted["explanation"] = explanation
+
+        return {
+            "bank": bank,
+            "product": product,
+            "explanation": "Resolved by rules without calling the model.",
+            "extracted_fees": [extracted],
+        }
+
+    @staticmethod
+    def compare(resolved_records: Dict[str, Dict[str, List[dict]]], previous: dict) -> dict:
+        """
+        Golden check of rule output against an earlier model run of the same bank.
+
+        Args:
+            resolved_records: {product_id: {fee_name: records produced by the rules}}
+            previous: An earlier run_agent output of the bank
+
+        Returns:
+            {"compared", "matched", "match_pct", "mismatches": [...]} on feeType,
+            feeMethodUType and the fee method object
+        """
+        previous_records: Dict[str, Dict[str, List[dict]]] = {}
+        for product in previous.get("products", []):
+            records_by_name = previous_records.setdefault(product["product_id"], {})
+            for record in product.get("extracted_fees", []):
+                records_by_name.setdefault(record.get("name"), []).append(record)
+
+        def key(record: dict) -> tuple:
+            method = record.get("feeMethodUType")
+            return record.get("feeType"), method, record.get(method)
+
+        compared = 0
+        mismatches = []
+        for product_id, records_by_name in resolved_records.items():
+            for fee_name, records in records_by_name.items():
+                old = previous_records.get(product_id, {}).get(fee_name)
+                if not old or any("error" in record for record in old):
+                    continue
+                compared += 1
+                if [key(record) for record in records] != [key(record) for record in old]:
+                    mismatches.append({
+                        "product_id": product_id,
+                        "name": fee_name,
+                        "rules": [key(record) for record in records],
+                        "model": [key(record) for record in old],
+                    })
+
+        matched = compared - len(mismatches)
+        return {
+            "compared": compared,
+            "matched": matched,
+            "match_pct": round(100 * matched / compared, 1) if compared else None,
+            "mismatches": mismatches,
+        }
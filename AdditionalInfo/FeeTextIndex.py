@@ -0,0 +1,65 @@
+import copy
+import threading
+from typing import Any, Dict, Optional
+
+from ExtractionCache import normalize_text
+
+
+class FeeTextIndex:
+    """
+    Distinct fee texts across banks, and the one extraction each of them gets.
+
+    White-label brands on a shared platform repeat the same boilerplate fee
+    text, so a multi-bank run keys extractions on the text alone: whitespace
+    collapsed and case-folded, without the bank. Every fee sent to the model
+    is registered with add(); the first extraction of a text is stored with
+    set() and copies are served to every later (bank, product, fee) using it.
+    Extractions are raw model JSON, so each occurrence is still post-processed
+    against its own text and keeps its own fee name.
+    """
+
+    def __init__(self):
+        self._occurrences: Dict[str, int] = {}
+        self._first_bank: Dict[str, str] = {}
+        self._cross_bank: set = set()
+        self._extractions: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.served = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return normalize_text(text).casefold()
+
+    def add(self, bank_name: str, text: str) -> None:
+        """Register one fee occurrence of this text."""
+        key = self.key(text)
+        with self._lock:
+            self._occurrences[key] = self._occurrences.get(key, 0) + 1
+            first_bank = self._first_bank.setdefault(key, bank_name)
+            if first_bank != bank_name:
+                self._cross_bank.add(key)
+
+    def get(self, text: str) -> Optional[Any]:
+        """A copy of the text's canonical extraction, or None if it has not been extracted yet."""
+        with self._lock:
+            raw = self._extractions.get(self.key(text))
+            if raw is None:
+                return None
+            self.served += 1
+        return copy.deepcopy(raw)
+
+    def set(self, text: str, raw: Any) -> None:
+        with self._lock:
+            self._extractions.setdefault(self.key(text), copy.deepcopy(raw))
+
+    def stats(self) -> dict:
+        with self._lock:
+            distinct = len(self._occurrences)
+            occurrences = sum(self._occurrences.values())
+            return {
+                "distinct_fee_texts": distinct,
+                "fee_text_occurrences": occurrences,
+                "cross_bank_fee_texts": len(self._cross_bank),
+                "fee_text_dedup_ratio": round(occurrences / distinct, 2) if distinct else None,
+                "fees_served_from_index": self.served,
+            }
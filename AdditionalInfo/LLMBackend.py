@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Protocol
+
+from FeeRuleEngine import match_fee_type
+
+
+class LLMBackend(Protocol):
+    """
+    What Agent needs from an LLM: chat completions, blocking and async.
+
+    `request` is the kwargs of a chat completion (model, messages,
+    response_format, ...). The response is shaped like the OpenAI SDK's:
+    `response.choices[0].message.content` and `response.usage` with
+    prompt_tokens / completion_tokens / total_tokens. Errors worth retrying
+    carry a `status_code` (and optionally `response.headers` with
+    Retry-After), which is all RateLimitScheduler looks at.
+    """
+
+    def complete(self, request: dict) -> Any:
+        ...
+
+    async def complete_async(self, request: dict) -> Any:
+        ...
+
+
+def request_key(request: dict) -> str:
+    """Stable key of a chat completion request, for recording and replaying responses."""
+    identity = {field: request.get(field) for field in ("model", "messages", "response_format")}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class OpenAIBackend:
+    """
+    Chat completions on the OpenAI API.
+
+    max_retries is passed to the SDK clients; use 0 when a RateLimitScheduler
+    does the retrying. With a record_path, every response is appended to a
+    JSONL file that StubBackend can replay offline.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, max_retries: Optional[int] = None, record_path: Optional[str] = None):
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError(
+                "Missing OPENAI_API_KEY environment variable. "
+                "Set it in your environment or in a .env file."
+            )
+        from openai import OpenAI
+
+        self.api_key = api_key
+        self.max_retries = max_retries
+        retry_kwargs = {} if max_retries is None else {"max_retries": max_retries}
+        self.client = OpenAI(api_key=api_key, **retry_kwargs)
+        self._async_client = None
+        self.record_path = Path(record_path) if record_path else None
+        if self.record_path is not None:
+            self.record_path.parent.mkdir(parents=True, exist_ok=True)
+        self._record_lock = threading.Lock()
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+
+            retry_kwargs = {} if self.max_retries is None else {"max_retries": self.max_retries}
+            self._async_client = AsyncOpenAI(api_key=self.api_key, **retry_kwargs)
+        return self._async_client
+
+    def complete(self, request: dict) -> Any:
+        # Try to improve repeatability if the client supports seeding.
+        try:
+            response = self.client.chat.completions.create(**request, seed=0)
+        except TypeError:
+            response = self.client.chat.completions.create(**request)
+        self._record(request, response)
+        return response
+
+    async def complete_async(self, request: dict) -> Any:
+        try:
+            response = await self.async_client.chat.completions.create(**request, seed=0)
+        except TypeError:
+            response = await self.async_client.chat.completions.create(**request)
+        self._record(request, response)
+        return response
+
+    def _record(self, request: dict, response: Any) -> None:
+        if self.record_path is None:
+            return
+        usage = getattr(response, "usage", None)
+        line = {
+            "key": request_key(request),
+            "content": response.choices[0].message.content,
+            "usage": {
+                "prompt_tokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+                "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+            },
+        }
+        with self._record_lock:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+class StubBackendError(Exception):
+    """An injected API failure, shaped like an SDK error so the scheduler retries it."""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Injected error (status {status_code})")
+        self.status_code = status_code
+        headers = {"retry-after-ms": str(int(retry_after * 1000))} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class StubBackend:
+    """
+    Offline backend: replays recorded responses or synthesizes schema-valid ones.
+
+    Responses recorded by OpenAIBackend(record_path=...) are served for
+    identical requests. Anything else gets a deterministic extraction built
+    from the fee text: feeType from the keyword rules (OTHER when none match),
+    a "$" amount as fixedAmount, a "%" as a transaction rate, otherwise NF.
+    Single-fee, batch and repair requests are all answered in the shape the
+    prompt asks for, and token usage is estimated at 4 characters per token.
+
+    Each call sleeps `latency` seconds plus up to `latency_jitter` more. With
+    probability `error_rate` it raises StubBackendError(error_status) instead,
+    and with probability `malformed_rate` it returns truncated JSON, so the
+    scheduler's retries and the repair path can be exercised too. Draws come
+    from one seeded generator, so a sequential run is reproducible.
+    """
+    _CHARS_PER_TOKEN = 4
+    _AMOUNT = re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)")
+    _PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s?%")
+
+    def __init__(
+        self,
+        replay_path: Optional[str] = None,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        error_retry_after: Optional[float] = 0.01,
+        malformed_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.recorded: Dict[str, dict] = {}
+        if replay_path:
+            with open(replay_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recorded[entry["key"]] = entry
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_retry_after = error_retry_after
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.replayed = 0
+        self.injected_errors = 0
+        self.malformed = 0
+
+    def complete(self, request: dict) -> Any:
+        delay, response = self._respond(request)
+        if delay:
+            time.sleep(delay)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def complete_async(self, request: dict) -> Any:
+        delay, response = self._respond(request)
+        if delay:
+            await asyncio.sleep(delay)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def _respond(self, request: dict) -> tuple:
+        """(seconds to wait, response or exception to raise) for one call."""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.injected_errors += 1
+                return delay, StubBackendError(self.error_status, self.error_retry_after)
+            malformed = bool(self.malformed_rate) and self._rng.random() < self.malformed_rate
+
+        recorded = self.recorded.get(request_key(request))
+        if recorded is not None:
+            with self._lock:
+                self.replayed += 1
+            usage = recorded.get("usage", {})
+            return delay, self._response(recorded["content"], usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+        content = json.dumps(self._synthesize(json.loads(request["messages"][-1]["content"])), ensure_ascii=False)
+        if malformed:
+            with self._lock:
+                self.malformed += 1
+            content = content[: len(content) // 2]
+
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+        return delay, self._response(content, prompt_chars // self._CHARS_PER_TOKEN + 1, len(content) // self._CHARS_PER_TOKEN + 1)
+
+    @staticmethod
+    def _response(content: str, prompt_tokens: int, completion_tokens: int) -> Any:
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+            ),
+        )
+
+    def _synthesize(self, payload: dict) -> dict:
+        if "errors" in payload:
+            # Repair request: either one fee to fix or a reply that was not valid JSON.
+            if "fee" in payload:
+                fee = payload["fee"] if isinstance(payload["fee"], dict) else {}
+                return {"fee": self._fee(str(fee.get("name", "")), str(fee.get("explanation", "")))}
+            return self._extraction({"bank": "", "product": "", "additional_info": ""})
+        if "fees" in payload:
+            return {"results": [dict(self._extraction(item), key=item.get("key")) for item in payload["fees"]]}
+        return self._extraction(payload)
+
+    def _extraction(self, item: dict) -> dict:
+        additional_info = str(item.get("additional_info", ""))
+        return {
+            "bank": str(item.get("bank", "")),
+            "product": str(item.get("product", "")),
+            "explanation": "Synthesized by StubBackend.",
+            "extracted_fees": [self._fee(additional_info[:80], additional_info)],
+        }
+
+    def _fee(self, name: str, text: str) -> dict:
+        matched = match_fee_type(name, text)
+        fee = {"name": name or "Fee", "feeType": matched[0] if matched else "OTHER"}
+
+        amount = self._AMOUNT.search(text)
+        percent = self._PERCENT.search(text)
+        if amount is not None:
+            fee["feeMethodUType"] = "fixedAmount"
+            fee["fixedAmount"] = {"amount": f"{float(amount.group(1).replace(',', '')):.2f}"}
+            fee["explanation"] = f"Quoted \"{amount.group(0)}\"."
+        elif percent is not None:
+            fee["feeMethodUType"] = "rateBased"
+            # Fixed-point like Agent.normalize_rate_string; "g" would give exponents such as "1e-05".
+            rate = f"{float(percent.group(1)) / 100:.10f}".rstrip("0").rstrip(".")
+            fee["rateBased"] = {"rateType": "TRANSACTION", "rate": rate}
+            fee["explanation"] = f"Quoted \"{percent.group(0)}\"."
+        else:
+            fee["feeMethodUType"] = "NF"
+            fee["explanation"] = "No amount or rate is stated."
+        return fee
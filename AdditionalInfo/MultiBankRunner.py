@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from Agent import AsyncAgent, CHECKPOINT_DIR, output_path_for
+from ProductDetailsStore import open_product_details
+from UsageLedger import UsageLedger
+
+
+class MultiBankRunner:
+    """
+    Extract every bank (or a subset) of the combined product details in one job.
+
+    Banks are handed out to async workers that share a single AsyncAgent, so
+    every bank draws on the same LLM rate budget (the agent's
+    RateLimitScheduler) and the same extraction cache. A worker reads its bank
+    from the product details store when it picks the bank up, so only the
+    banks in flight are held in memory. Each bank is written to its own output
+    file as soon as it finishes, through a checkpoint so an interrupted job
+    resumes where it stopped, and a failed bank is reported in the aggregate
+    summary instead of stopping the others. Fees unchanged since a bank's
+    previous output are carried forward, not re-extracted. With an agent built
+    with dedup_across_banks, fee text repeated across banks is extracted once
+    and the aggregate reports the dedup ratio.
+
+    Banks run concurrently, so the cache/scheduler counters in each bank's summary
+    can include calls made for other banks; the aggregate summary reports the
+    job-wide counters exactly. LLM usage is attributed per bank exactly, and
+    each bank's per-fee usage is written next to its output as a CSV.
+    """
+    _PLANNING_COUNTERS = (
+        "total_products",
+        "products_with_fees",
+        "total_fees_processed",
+        "total_fees_with_additional_info",
+        "total_fees_using_name_only",
+        "duplicate_fees_skipped_within_product",
+        "fees_added",
+        "fees_changed",
+        "fees_unchanged",
+        "fees_removed",
+        "fees_carried_forward",
+        "fees_resolved_by_rules",
+        "rules_invalid_fees",
+    )
+
+    def __init__(
+        self,
+        agent: AsyncAgent,
+        workers: int = 4,
+        output_dir: str = ".",
+        checkpoint_dir: Optional[str] = CHECKPOINT_DIR,
+    ):
+        self.agent = agent
+        self.workers = max(int(workers), 1)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else None
+
+    def _output_path(self, bank_name: str) -> Path:
+        return self.output_dir / output_path_for(bank_name, "full")
+
+    def _checkpoint_path(self, bank_name: str) -> Optional[Path]:
+        if self.checkpoint_dir is None:
+            return None
+        return self.checkpoint_dir / f"{output_path_for(bank_name, 'full').stem}.jsonl"
+
+    async def _run_one(self, details, bank_name: str, usage_mark: int) -> dict:
+        bank_data = await asyncio.to_thread(details.load, bank_name)
+        checkpoint_path = self._checkpoint_path(bank_name)
+        output_path = self._output_path(bank_name)
+        results = await self.agent._run_bank_async(
+            bank_name,
+            bank_data,
+            checkpoint_path=str(checkpoint_path) if checkpoint_path else None,
+            resume=True,
+            previous_path=str(output_path),
+        )
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        if checkpoint_path is not None:
+            checkpoint_path.unlink(missing_ok=True)
+        self.agent.usage.write_csv(output_path.with_suffix(".usage.csv"), bank_name, since=usage_mark)
+
+        # The per-product breakdown stays in the bank's own output; the aggregate keeps the totals.
+        return {key: value for key, value in results["summary"].items() if key != "usage_by_product"}
+
+    async def run_async(self, json_path: str, bank_names: Optional[List[str]] = None) -> dict:
+        """
+        Process the banks with `workers` banks in flight at a time.
+
+        Returns:
+            The aggregate summary (also written to output_all_banks_summary.json)
+        """
+        started_at = time.time()
+        details = open_product_details(json_path)
+        if bank_names is None:
+            banks = details.bank_names(objects_only=True)
+        else:
+            missing = [name for name in bank_names if name not in details]
+            if missing:
+                raise ValueError(f"Banks not found: {missing}")
+            banks = list(bank_names)
+        counters_before = self.agent._run_counters()
+        usage_mark = self.agent.usage.mark()
+
+        total = len(banks)
+        queue: asyncio.Queue = asyncio.Queue()
+        for bank_name in banks:
+            queue.put_nowait(bank_name)
+
+        bank_summaries: Dict[str, dict] = {}
+        failures: Dict[str, str] = {}
+
+        async def worker() -> None:
+            while True:
+                try:
+                    bank_name = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    bank_summaries[bank_name] = await self._run_one(details, bank_name, usage_mark)
+                    status = "done"
+                except Exception as e:
+                    failures[bank_name] = str(e)
+                    status = f"failed: {e}"
+                print(f"[{len(bank_summaries) + len(failures)}/{total}] {bank_name} {status}")
+
+        await asyncio.gather(*[worker() for _ in range(min(self.workers, total) or 1)])
+
+        counters_after = self.agent._run_counters()
+        totals = {
+            key: sum(summary.get(key, 0) for summary in bank_summaries.values())
+            for key in self._PLANNING_COUNTERS
+        }
+        totals.update({key: counters_after[key] - counters_before[key] for key in counters_after})
+        usage = self.agent.usage.summarize(since=usage_mark)
+        totals.update({key: usage[key] for key in UsageLedger.TOTAL_FIELDS})
+
+        aggregate = {
+            "banks_processed": len(bank_summaries),
+            "banks_failed": len(failures),
+            "elapsed_seconds": round(time.time() - started_at, 1),
+            "totals": totals,
+            "failures": failures,
+            "banks": {name: bank_summaries[name] for name in sorted(bank_summaries)},
+        }
+        if self.agent.text_index is not None:
+            aggregate["fee_text_dedup"] = self.agent.text_index.stats()
+
+        summary_path = self.output_dir / "output_all_banks_summary.json"
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(aggregate, f, indent=2, ensure_ascii=False)
+        print(f"Aggregate summary saved to: {summary_path}")
+
+        return aggregate
+
+    def run(self, json_path: str, bank_names: Optional[List[str]] = None) -> dict:
+        return asyncio.run(self.run_async(json_path, bank_names))
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Mapping, Optional, Tuple, Union
+
+from CombinedDetailsIndex import CombinedDetailsIndex
+
+
+def _shard_name(brand_name: str) -> str:
+    # Brand names contain slashes, dashes and non-ASCII; the hash keeps similar names apart.
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", brand_name).strip("_")[:60] or "brand"
+    return f"{slug}-{hashlib.sha1(brand_name.encode('utf-8')).hexdigest()[:8]}.json"
+
+
+def _count_fees(products) -> int:
+    if not isinstance(products, dict):
+        return 0
+
+    fees = 0
+    for record in products.values():
+        if not isinstance(record, dict):
+            continue
+        body = record.get("body")
+        data = body.get("data") if isinstance(body, dict) else None
+        product_fees = data.get("fees") if isinstance(data, dict) else None
+        if isinstance(product_fees, list):
+            fees += len(product_fees)
+        elif product_fees is not None:
+            fees += 1
+    return fees
+
+
+def _write_atomic(path: Path, raw: bytes) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(raw)
+    os.replace(tmp_path, path)
+
+
+class ProductDetailsStore:
+    """
+    Sharded product details: one compact JSON file per brand plus a manifest.
+
+    manifest.json maps each brand to {"shard", "products", "fees", "sha256",
+    "object"} in the order the combiner produced them, so a brand is read by
+    opening its shard alone and brands can be rebuilt or processed
+    independently. Shards whose content hash is unchanged are left untouched
+    on rewrite.
+    """
+    MANIFEST = "manifest.json"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        manifest_path = self.root / self.MANIFEST
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"Product details store not found: {manifest_path}")
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+    @classmethod
+    def write(cls, root: str, banks: Mapping[str, object], workers: Optional[int] = None) -> "ProductDetailsStore":
+        """
+        Write every brand's shard (in parallel) and then the manifest.
+
+        Args:
+            root: Store directory
+            banks: {brand_name: products}
+            workers: Threads serialising and writing shards (None = executor default)
+        """
+        root_path = Path(root)
+        root_path.mkdir(parents=True, exist_ok=True)
+
+        previous = {}
+        if (root_path / cls.MANIFEST).exists():
+            previous = cls(root).manifest["banks"]
+
+        def write_shard(brand_name: str) -> Tuple[str, dict]:
+            products = banks[brand_name]
+            raw = json.dumps(products, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            entry = {
+                "shard": _shard_name(brand_name),
+                "products": len(products) if isinstance(products, dict) else 0,
+                "fees": _count_fees(products),
+                "sha256": hashlib.sha256(raw).hexdigest(),
+                "object": isinstance(products, dict),
+            }
+
+            shard_path = root_path / entry["shard"]
+            if previous.get(brand_name, {}).get("sha256") != entry["sha256"] or not shard_path.exists():
+                _write_atomic(shard_path, raw)
+            return brand_name, entry
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = dict(executor.map(write_shard, list(banks)))
+
+        # Shards of brands that are no longer in the register.
+        current_shards = {entry["shard"] for entry in entries.values()}
+        for entry in previous.values():
+            if entry["shard"] not in current_shards:
+                (root_path / entry["shard"]).unlink(missing_ok=True)
+
+        manifest = {"banks": entries}
+        _write_atomic(root_path / cls.MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+        return cls(root)
+
+    def bank_names(self, objects_only: bool = False) -> List[str]:
+        return [name for name, entry in self.manifest["banks"].items() if entry["object"] or not objects_only]
+
+    def __contains__(self, bank_name: str) -> bool:
+        return bank_name in self.manifest["banks"]
+
+    def entry(self, bank_name: str) -> dict:
+        return self.manifest["banks"][bank_name]
+
+    def load(self, bank_name: str):
+        with open(self.root / self.entry(bank_name)["shard"], "rb") as f:
+            return json.loads(f.read())
+
+    def iter_banks(self, bank_names: Optional[List[str]] = None) -> Iterator[Tuple[str, dict]]:
+        """Yield (bank_name, data) one brand at a time, in manifest order."""
+        if bank_names is None:
+            bank_names = self.bank_names(objects_only=True)
+        else:
+            missing = [name for name in bank_names if name not in self]
+            if missing:
+                raise ValueError(f"Banks not found: {missing}")
+
+        for bank_name in bank_names:
+            yield bank_name, self.load(bank_name)
+
+
+def open_product_details(path: str) -> Union[ProductDetailsStore, CombinedDetailsIndex]:
+    """Open a sharded store directory, or fall back to indexing a combined JSON file."""
+    if Path(path).is_dir():
+        return ProductDetailsStore(path)
+    return CombinedDetailsIndex(path)
@@ -0,0 +1,264 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+# HTTP statuses worth retrying: throttling plus transient server errors.
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Read Retry-After (or OpenAI's retry-after-ms) from an SDK exception, if present."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    return None
+
+
+class RateLimitScheduler:
+    """
+    Admission control for LLM calls against requests/min and tokens/min budgets.
+
+    Each call is admitted only when the sliding one-minute windows have room for
+    its estimated tokens and the adaptive concurrency limit allows another call
+    in flight. The concurrency limit follows AIMD: it grows by one per window of
+    successful calls and halves on a 429, and Retry-After pauses admissions.
+    Usage reported by the API replaces the estimate once the call returns.
+    """
+    _WINDOW = 60.0
+    _POLL_INTERVAL = 0.05
+    _DEFAULT_COMPLETION_TOKENS = 256
+    _CHARS_PER_TOKEN = 4.0
+
+    def __init__(
+        self,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200_000,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        max_retries: int = 6,
+        max_wait: float = 60.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.min_concurrency = max(min(int(min_concurrency), self.max_concurrency), 1)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+
+        self.concurrency_limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._requests: deque = deque()     # admission timestamps
+        self._tokens: deque = deque()       # [timestamp, tokens] reservations
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+        # Calibrates the chars -> tokens estimate against real usage.
+        self._chars_per_token = self._CHARS_PER_TOKEN
+        self._avg_completion_tokens = float(self._DEFAULT_COMPLETION_TOKENS)
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    # Estimation
+
+    def estimate_tokens(self, request: dict) -> int:
+        """Pre-estimate the tokens a chat completion request will consume."""
+        chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+        prompt_estimate = chars / self._chars_per_token
+        completion_estimate = min(self._avg_completion_tokens, request.get("max_completion_tokens") or self._avg_completion_tokens)
+        return int(prompt_estimate + completion_estimate) + 1
+
+    def _calibrate(self, request: Optional[dict], usage: Any) -> None:
+        prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        # Exponentially weighted so the estimate tracks the current prompt mix.
+        self._avg_completion_tokens = 0.9 * self._avg_completion_tokens + 0.1 * completion_tokens
+        if request is not None and prompt_tokens > 0:
+            chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+            if chars > 0:
+                self._chars_per_token = 0.9 * self._chars_per_token + 0.1 * (chars / prompt_tokens)
+
+    # Admission
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self._WINDOW
+        while self._requests and self._requests[0] <= cutoff:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= cutoff:
+            self._tokens_in_window -= self._tokens.popleft()[1]
+
+    def _try_admit(self, estimated_tokens: int) -> tuple:
+        """Return (reservation, 0) when admitted, else (None, seconds to wait)."""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+
+            if now < self._blocked_until:
+                return None, self._blocked_until - now
+
+            if self._in_flight >= max(int(self.concurrency_limit), self.min_concurrency):
+                return None, self._POLL_INTERVAL
+
+            if len(self._requests) >= self.requests_per_minute:
+                return None, self._requests[0] + self._WINDOW - now
+
+            # A single request larger than the whole budget is admitted on an empty window.
+            if self._tokens and self._tokens_in_window + estimated_tokens > self.tokens_per_minute:
+                return None, self._tokens[0][0] + self._WINDOW - now
+
+            reservation = [now, estimated_tokens]
+            self._requests.append(now)
+            self._tokens.append(reservation)
+            self._tokens_in_window += estimated_tokens
+            self._in_flight += 1
+            self.requests += 1
+            return reservation, 0.0
+
+    def _release(self, reservation: list, actual_tokens: Optional[int]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            # Only reservations still inside the window count towards the budget.
+            if actual_tokens is not None and reservation[0] > time.monotonic() - self._WINDOW:
+                self._tokens_in_window += actual_tokens - reservation[1]
+                reservation[1] = actual_tokens
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def _on_throttled(self, wait: float) -> None:
+        with self._lock:
+            self.throttled += 1
+            self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + wait)
+
+    def _backoff(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Return how long to wait before retrying, or None if the error is not retryable."""
+        status = _status_code(exc)
+        if status not in RETRYABLE_STATUS_CODES:
+            return None
+
+        wait = _retry_after_seconds(exc)
+        if wait is None:
+            wait = 2 ** attempt + random.uniform(0, 1) # Exponential backoff with jitter
+        wait = min(wait, self.max_wait)
+
+        if status == 429:
+            self._on_throttled(wait)
+        return wait
+
+    @staticmethod
+    def _usage_tokens(response: Any) -> Optional[int]:
+        usage = getattr(response, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        return int(total) if total is not None else None
+
+    # Entry points
+
+    async def run(self, call: Callable[[], Awaitable[Any]], request: Optional[dict] = None, estimated_tokens: Optional[int] = None) -> Any:
+        """
+        Run an async LLM call under the budgets, retrying throttled/transient failures.
+
+        Args:
+            call: Zero-argument coroutine factory performing the request.
+            request: The request kwargs, used to estimate tokens and calibrate.
+            estimated_tokens: Explicit estimate (overrides the request-based one).
+        """
+        estimated_tokens = estimated_tokens or (self.estimate_tokens(request) if request else self._DEFAULT_COMPLETION_TOKENS)
+
+        attempt = 0
+        while True:
+            reservation, wait = self._try_admit(estimated_tokens)
+            while reservation is None:
+                await asyncio.sleep(wait)
+                reservation, wait = self._try_admit(estimated_tokens)
+
+            try:
+                response = await call()
+            except Exception as e:
+                self._release(reservation, None)
+                attempt += 1
+                wait = self._backoff(e, attempt) if attempt <= self.max_retries else None
+                if wait is None:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(wait)
+                continue
+
+            self._release(reservation, self._usage_tokens(response))
+            self._calibrate(request, getattr(response, "usage", None))
+            self._on_success()
+            return response
+
+    def call(self, call: Callable[[], Any], request: Optional[dict] = None, estimated_tokens: Optional[int] = None) -> Any:
+        """Blocking counterpart of run() for the sequential Agent."""
+        estimated_tokens = estimated_tokens or (self.estimate_tokens(request) if request else self._DEFAULT_COMPLETION_TOKENS)
+
+        attempt = 0
+        while True:
+            reservation, wait = self._try_admit(estimated_tokens)
+            while reservation is None:
+                time.sleep(wait)
+                reservation, wait = self._try_admit(estimated_tokens)
+
+            try:
+                response = call()
+            except Exception as e:
+                self._release(reservation, None)
+                attempt += 1
+                wait = self._backoff(e, attempt) if attempt <= self.max_retries else None
+                if wait is None:
+                    raise
+                self.retries += 1
+                time.sleep(wait)
+                continue
+
+            self._release(reservation, self._usage_tokens(response))
+            self._calibrate(request, getattr(response, "usage", None))
+            self._on_success()
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+        }
@@ -0,0 +1,151 @@
+import re
+from typing import Any, Callable, List
+
+# A compiled check appends "<path>: <problem>" messages and returns nothing.
+_Check = Callable[[Any, str, List[str]], None]
+
+_TYPES = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+}
+
+
+class SchemaValidator:
+    """
+    JSON Schema validator compiled once into nested checks.
+
+    Covers the keywords SCHEMA uses: type, properties, required,
+    additionalProperties: false, items, enum, const, pattern (compiled once),
+    oneOf, anyOf and not. Annotations such as default are ignored.
+    """
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self._check = self._compile(schema)
+
+    def errors(self, value: Any, path: str = "$") -> List[str]:
+        """Every validation error, as "<json path>: <problem>" (empty when valid)."""
+        errors: List[str] = []
+        self._check(value, path, errors)
+        return errors
+
+    def is_valid(self, value: Any) -> bool:
+        return not self.errors(value)
+
+    @classmethod
+    def _compile(cls, schema: dict) -> _Check:
+        checks: List[_Check] = []
+
+        if "type" in schema:
+            expected = schema["type"]
+            is_type = _TYPES[expected]
+
+            def check_type(value, path, errors):
+                if not is_type(value):
+                    errors.append(f"{path}: expected {expected}, got {type(value).__name__}")
+            checks.append(check_type)
+
+        if "const" in schema:
+            const = schema["const"]
+
+            def check_const(value, path, errors):
+                if value != const:
+                    errors.append(f"{path}: must be {const!r}")
+            checks.append(check_const)
+
+        if "enum" in schema:
+            allowed = schema["enum"]
+            allowed_set = set(allowed)
+
+            def check_enum(value, path, errors):
+                if not isinstance(value, str) or value not in allowed_set:
+                    errors.append(f"{path}: {value!r} is not one of {allowed}")
+            checks.append(check_enum)
+
+        if "pattern" in schema:
+            pattern = re.compile(schema["pattern"])
+
+            def check_pattern(value, path, errors):
+                if isinstance(value, str) and not pattern.search(value):
+                    errors.append(f"{path}: {value!r} does not match {pattern.pattern}")
+            checks.append(check_pattern)
+
+        if "required" in schema:
+            required = schema["required"]
+
+            def check_required(value, path, errors):
+                if isinstance(value, dict):
+                    for key in required:
+                        if key not in value:
+                            errors.append(f"{path}: missing required field '{key}'")
+            checks.append(check_required)
+
+        if "properties" in schema:
+            properties = {key: cls._compile(sub) for key, sub in schema["properties"].items()}
+            closed = schema.get("additionalProperties") is False
+
+            def check_properties(value, path, errors):
+                if not isinstance(value, dict):
+                    return
+                for key, item in value.items():
+                    check = properties.get(key)
+                    if check is not None:
+                        check(item, f"{path}.{key}", errors)
+                    elif closed:
+                        errors.append(f"{path}: unexpected field '{key}'")
+            checks.append(check_properties)
+
+        if "items" in schema:
+            check_item = cls._compile(schema["items"])
+
+            def check_items(value, path, errors):
+                if isinstance(value, list):
+                    for index, item in enumerate(value):
+                        check_item(item, f"{path}[{index}]", errors)
+            checks.append(check_items)
+
+        if "oneOf" in schema:
+            branches = [cls._compile(sub) for sub in schema["oneOf"]]
+
+            def check_one_of(value, path, errors):
+                branch_errors = [cls._run(branch, value, path) for branch in branches]
+                matches = sum(1 for found in branch_errors if not found)
+                if matches == 0:
+                    # Say why each alternative failed, so the message is actionable on its own.
+                    reasons = " | ".join(found[0].split(": ", 1)[-1] for found in branch_errors)
+                    errors.append(f"{path}: matches none of {len(branches)} alternatives ({reasons})")
+                elif matches > 1:
+                    errors.append(f"{path}: matches {matches} of {len(branches)} alternatives, expected exactly one")
+            checks.append(check_one_of)
+
+        if "anyOf" in schema:
+            branches = [cls._compile(sub) for sub in schema["anyOf"]]
+
+            def check_any_of(value, path, errors):
+                if all(cls._run(branch, value, path) for branch in branches):
+                    errors.append(f"{path}: must match at least one of {len(branches)} alternatives")
+            checks.append(check_any_of)
+
+        if "not" in schema:
+            negated = cls._compile(schema["not"])
+
+            def check_not(value, path, errors):
+                if not cls._run(negated, value, path):
+                    errors.append(f"{path}: matches a disallowed shape")
+            checks.append(check_not)
+
+        def check(value, path, errors):
+            for sub_check in checks:
+                sub_check(value, path, errors)
+
+        return check
+
+    @staticmethod
+    def _run(check: _Check, value: Any, path: str) -> List[str]:
+        errors: List[str] = []
+        check(value, path, errors)
+        return errors
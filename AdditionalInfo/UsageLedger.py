@@ -0,0 +1,147 @@
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# What the LLM calls made in the current context are for: {"bank", "fees": [[product_id, fee_name], ...]}.
+# Each asyncio task gets its own copy, so concurrent chunks attribute their calls independently.
+_scope: ContextVar[dict] = ContextVar("usage_scope", default={})
+
+
+class UsageLedger:
+    """
+    Record of every LLM call: tokens (prompt, completion, cached), latency and retries.
+
+    Calls are attributed to the bank and fees in scope when they were made. A
+    call covering several fees (a batched request) is split evenly across them
+    when aggregating per fee or product. With a log_path, each call is also
+    appended to a JSONL file as it completes.
+    """
+    TOTAL_FIELDS = (
+        "llm_calls",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached_tokens",
+        "llm_latency_ms",
+        "llm_call_retries",
+        "llm_call_errors",
+    )
+
+    def __init__(self, log_path: Optional[str] = None):
+        self.log_path = Path(log_path) if log_path else None
+        if self.log_path is not None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.records: List[dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def scope(self, **fields) -> Iterator[None]:
+        """Attribute calls made inside the block to these fields (merged into the enclosing scope)."""
+        token = _scope.set({**_scope.get(), **fields})
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    def record(self, kind: str, model: str, usage: Any, latency: float, retries: int, error: Optional[Exception] = None) -> None:
+        scope = _scope.get()
+        details = getattr(usage, "prompt_tokens_details", None)
+        entry = {
+            "ts": round(time.time(), 3),
+            "bank": scope.get("bank"),
+            "fees": scope.get("fees", []),
+            "kind": kind,
+            "model": model,
+            "prompt_tokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+            "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+            "cached_tokens": int(getattr(details, "cached_tokens", 0) or 0),
+            "latency_ms": round(latency * 1000, 1),
+            "retries": retries,
+            "error": str(error) if error is not None else None,
+        }
+
+        with self._lock:
+            self.records.append(entry)
+            if self.log_path is not None:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def mark(self) -> int:
+        """Position to aggregate from, so a run only counts its own calls."""
+        return len(self.records)
+
+    def _records(self, bank: Optional[str], since: int) -> List[dict]:
+        with self._lock:
+            records = self.records[since:]
+        return [entry for entry in records if bank is None or entry["bank"] == bank]
+
+    @staticmethod
+    def _add(totals: dict, entry: dict, share: float = 1) -> None:
+        totals["llm_calls"] += share
+        totals["prompt_tokens"] += entry["prompt_tokens"] * share
+        totals["completion_tokens"] += entry["completion_tokens"] * share
+        totals["cached_tokens"] += entry["cached_tokens"] * share
+        totals["llm_latency_ms"] += entry["latency_ms"] * share
+        totals["llm_call_retries"] += entry["retries"] * share
+        totals["llm_call_errors"] += (1 if entry["error"] else 0) * share
+
+    @classmethod
+    def _new_totals(cls) -> dict:
+        return {field: 0 for field in cls.TOTAL_FIELDS}
+
+    @staticmethod
+    def _rounded(totals: dict) -> dict:
+        return {key: round(value, 1) if isinstance(value, float) else value for key, value in totals.items()}
+
+    def _by_fee(self, bank: Optional[str], since: int) -> Dict[tuple, dict]:
+        by_fee: Dict[tuple, dict] = {}
+        for entry in self._records(bank, since):
+            fees = entry["fees"] or [[None, None]]
+            share = 1 / len(fees)
+            for product_id, fee_name in fees:
+                totals = by_fee.setdefault((entry["bank"], product_id, fee_name), self._new_totals())
+                self._add(totals, entry, share)
+        return by_fee
+
+    def summarize(self, bank: Optional[str] = None, since: int = 0) -> dict:
+        """
+        Totals of the calls since `since` (one bank, or all), plus a per-product breakdown.
+
+        Returns:
+            {<TOTAL_FIELDS>..., "usage_by_product": {product_id: {<TOTAL_FIELDS>...}}}
+        """
+        totals = self._new_totals()
+        for entry in self._records(bank, since):
+            self._add(totals, entry)
+
+        by_product: Dict[str, dict] = {}
+        for (_, product_id, _), fee_totals in self._by_fee(bank, since).items():
+            if product_id is None:
+                continue
+            product_totals = by_product.setdefault(product_id, self._new_totals())
+            for field in self.TOTAL_FIELDS:
+                product_totals[field] += fee_totals[field]
+
+        summary = self._rounded(totals)
+        summary["usage_by_product"] = {product_id: self._rounded(t) for product_id, t in by_product.items()}
+        return summary
+
+    def write_csv(self, path: str, bank: Optional[str] = None, since: int = 0) -> Path:
+        """Per-fee usage (bank, product_id, fee name, totals) as a CSV sidecar, most expensive first."""
+        rows = [
+            {"bank": key[0], "product_id": key[1], "fee": key[2], **self._rounded(totals)}
+            for key, totals in self._by_fee(bank, since).items()
+        ]
+        rows.sort(key=lambda row: row["prompt_tokens"] + row["completion_tokens"], reverse=True)
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["bank", "product_id", "fee", *self.TOTAL_FIELDS])
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
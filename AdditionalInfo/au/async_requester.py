@@ -4,7 +4,8 @@ import logging
 import random
 import time
 from datetime import datetime
-from typing import Any, Optional, TypedDict, Union
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Mapping, Optional, TypedDict, Union
 from urllib.parse import urlencode
 
 import aiohttp
@@ -12,7 +13,9 @@ import async_timeout
 from django.utils import timezone
 from proxy_service.proxy_service import ProxyService
 
+from .host_scheduler import HostScheduler, HostSlot
 from .logging import setup_logger
+from .response_cache import HttpResponseCache
 
 PROXY_LIMIT_COUNTRY_CODES = ["AU"]
 PROXY_MAX_ATTEMPTS = 10
@@ -30,9 +33,19 @@ class HttpResponse(TypedDict):
     body: Optional[Union[str, list, dict]]
 
 
+@asynccontextmanager
+async def _unscheduled_slot() -> AsyncIterator[HostSlot]:
+    yield HostSlot()
+
+
 class AsyncRequester:
     """
     Asynchronous HTTP requester with retry and backoff logic.
+
+    With a HostScheduler, every attempt waits for a slot on its data holder's
+    host, so per-host concurrency and spacing apply to retries too. With an
+    HttpResponseCache, requests are conditional on the cached validators and a
+    304 is returned as a 200 with the cached body.
     """
     _DEFAULT_MAX_RETRIES = 3
     _DEFAULT_MAX_WAIT = 60
@@ -46,12 +59,16 @@ class AsyncRequester:
         max_wait: Optional[int] = None,
         request_timeout: Optional[int] = None,
         sensitive_headers: Optional[set[str]] = None,
+        scheduler: Optional[HostScheduler] = None,
+        cache: Optional[HttpResponseCache] = None,
     ):
         self.logger = logger or setup_logger()
         self.max_retries = max_retries or self._DEFAULT_MAX_RETRIES
         self.max_wait = max_wait or self._DEFAULT_MAX_WAIT
         self.request_timeout = request_timeout or self._DEFAULT_REQUEST_TIMEOUT
         self.sensitive_headers = sensitive_headers or self._DEFAULT_SENSITIVE_HEADERS
+        self.scheduler = scheduler
+        self.cache = cache
         self.successful_proxies: list[str] = []
         self.proxies: list[str] = [p.get("http") for p in ProxyService().get_proxy_list(PROXY_LIMIT_COUNTRY_CODES)]
         if not self.proxies:
@@ -87,6 +104,11 @@ class AsyncRequester:
         exception = None
         body = None
 
+        # Conditional request when a validated response is cached; headers reported are the caller's.
+        cache_key = self.cache.key(url, params, headers) if self.cache else None
+        cached = self.cache.lookup(cache_key) if self.cache else None
+        request_headers = {**(headers or {}), **HttpResponseCache.conditional_headers(cached)} if cached else headers
+
         # Temporary workaround for TMBG APIs
         max_retries = 10 if url.startswith("https://ob.tmbl.com.au/") else self.max_retries
 
@@ -117,46 +139,70 @@ class AsyncRequester:
                     body = None
 
                 wait = None
-                requested_at = timezone.now()
-                start_time = time.perf_counter()
 
-                # Fetch and load the response
-                async with async_timeout.timeout(self.request_timeout):
-                    response = await session.get(url, params=params, headers=headers, proxy=proxy)
-                    content_type = response.headers.get("Content-Type", "").lower()
-                    body = None
+                async with self._host_slot(url) as slot:
+                    # Timed from when the host admits the request, not from when it was queued.
+                    requested_at = timezone.now()
+                    start_time = time.perf_counter()
 
-                    if response.status == 403:
-                        # Potentially blocked, retry with Proxy Service if there are proxies available
-                        if not use_proxy and len(self.proxies) > 0:
-                            use_proxy = True
-                            self.logger.warning(f"{log_info}: Potentially blocked by provider, trying again with proxy service")
-                            proxies_to_try = set(self.proxies)
-                            max_retries = min(max(5, max_retries), 1 + len(proxies_to_try))
-                        elif proxy is not None:
-                            proxies_to_try.remove(proxy)
-                    elif response.status == 200 and proxy is not None and proxy not in self.successful_proxies:
-                        self.successful_proxies.append(proxy)
+                    # Fetch and load the response
+                    async with async_timeout.timeout(self.request_timeout):
+                        response = await session.get(url, params=params, headers=request_headers, proxy=proxy)
+                        content_type = response.headers.get("Content-Type", "").lower()
+                        body = None
 
-                    try:
-                        if "application/json" in content_type:
-                            body = await response.json()
-                        else:
-                            self.logger.warning(f"{log_info}: Unexpected Content-Type '{content_type}'")
-                            body = await response.text()
-                    except (aiohttp.ContentTypeError, json.JSONDecodeError) as e:
-                        self.logger.warning(f"{log_info}: [{type(e).__name__}] Failed to decode body based on Content-Type '{content_type}'")
-                        exception = e
-                        if "application/json" in content_type:
-                            try:
+                        if response.status == 403:
+                            # Potentially blocked, retry with Proxy Service if there are proxies available
+                            if not use_proxy and len(self.proxies) > 0:
+                                use_proxy = True
+                                self.logger.warning(f"{log_info}: Potentially blocked by provider, trying again with proxy service")
+                                proxies_to_try = set(self.proxies)
+                                max_retries = min(max(5, max_retries), 1 + len(proxies_to_try))
+                            elif proxy is not None:
+                                proxies_to_try.remove(proxy)
+                        elif response.status == 200 and proxy is not None and proxy not in self.successful_proxies:
+                            self.successful_proxies.append(proxy)
+
+                        try:
+                            if response.status == 304 and cached is not None:
+                                pass # Not modified: answered from the cache below
+                            elif "application/json" in content_type:
+                                body = await response.json()
+                            else:
+                                self.logger.warning(f"{log_info}: Unexpected Content-Type '{content_type}'")
                                 body = await response.text()
-                            except Exception:
-                                pass
+                        except (aiohttp.ContentTypeError, json.JSONDecodeError) as e:
+                            self.logger.warning(f"{log_info}: [{type(e).__name__}] Failed to decode body based on Content-Type '{content_type}'")
+                            exception = e
+                            if "application/json" in content_type:
+                                try:
+                                    body = await response.text()
+                                except Exception:
+                                    pass
+
+                    # Let the host's scheduler learn from this attempt (throttling, Retry-After).
+                    slot.status = response.status
+                    slot.retry_after = self._retry_after_seconds(response.headers)
 
                 response_time = time.perf_counter() - start_time
                 response_headers = dict(response.headers)
                 status_code = response.status
 
+                if status_code == 304 and cached is not None:
+                    revalidated = self.cache.revalidate(cache_key, response_headers)
+                    if revalidated is None:
+                        # Stored body is missing or unreadable: request again without validators, as a miss.
+                        self.logger.warning(f"{log_info}: Not modified, but the cached response could not be read; requesting it again")
+                        cached = None
+                        request_headers = headers
+                        attempt -= 1
+                        continue
+                    response_headers, body = revalidated
+                    status_code = 200
+                    self.logger.debug(f"{log_info}: Not modified, served from cache")
+                elif status_code == 200 and self.cache is not None and exception is None:
+                    self.cache.store(cache_key, response_headers, body, len(await response.read()))
+
                 # Handle successful response
                 if status_code == 200:
                     self.logger.debug(f"{log_info}: Request succeeded with status {status_code} in {response_time:.2f}s")
@@ -165,12 +211,9 @@ class AsyncRequester:
                 # Handle non-200 responses
                 self.logger.warning(f"{log_info}: Request failed with status {status_code}")
                 if status_code in {429, 503}:
-                    retry_after = response.headers.get("Retry-After")
-                    if retry_after:
-                        try:
-                            wait = float(retry_after)
-                        except ValueError:
-                            self.logger.warning(f"{log_info}: Invalid Retry-After value '{retry_after}'")
+                    wait = slot.retry_after
+                    if wait is None and response.headers.get("Retry-After"):
+                        self.logger.warning(f"{log_info}: Invalid Retry-After value '{response.headers.get('Retry-After')}'")
 
             except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                 self.logger.warning(f"{log_info}: [{type(e).__name__}] Failed to make request")
@@ -199,5 +242,20 @@ class AsyncRequester:
             "body": body,
         }
 
+    def _host_slot(self, url: str) -> AsyncContextManager[HostSlot]:
+        if self.scheduler is None:
+            return _unscheduled_slot()
+        return self.scheduler.slot(url)
+
+    @staticmethod
+    def _retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+        retry_after = headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            return None
+
     def _sanitise_headers(self, headers: dict[str, str]) -> dict[str, str]:
         return {k: v for k, v in headers.items() if k.lower() not in self.sensitive_headers}
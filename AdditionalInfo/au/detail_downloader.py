@@ -5,18 +5,24 @@ from datetime import datetime, timedelta
 from typing import Any
 
 import aiohttp
+from utils.fs import get_root_dir
 
 from . import db
 from .async_requester import HttpResponse, AsyncRequester
 from .config import COMMON_HEADERS, INDUSTRY_CONFIG
+from .host_scheduler import HostScheduler
 from .master_saver_mixin import MasterSaverMixin
 from .registry import Registry
+from .response_cache import HttpResponseCache
 from .slack_update_mixin import SlackUpdateMixin
 from .utils import JsonHttpResponse, serialise_http_response, is_empty_detail_response
+from .version_negotiator import VersionNegotiator
 
 
 class DetailDownloader(MasterSaverMixin, SlackUpdateMixin):
-    _MAX_CONCURRENCY = 100 # TODO: Set limit per data holder (i.e. per base URI)
+    _MAX_CONCURRENCY = 100
+    _HOST_CONCURRENCY = 4 # Starting limit per data holder (i.e. per base URI host); adapts to throttling
+    _MAX_HOST_CONCURRENCY = 16
     _PARAMS = None
     _HEADERS = {
         **COMMON_HEADERS
@@ -44,12 +50,17 @@ class DetailDownloader(MasterSaverMixin, SlackUpdateMixin):
 
         try:
             start_time = time.time()
-            self.semaphore = asyncio.Semaphore(self._MAX_CONCURRENCY)
-            self.requester = AsyncRequester(self.logger)
+            self.scheduler = HostScheduler(self._MAX_CONCURRENCY, self._HOST_CONCURRENCY, self._MAX_HOST_CONCURRENCY)
+            self.cache = HttpResponseCache(get_root_dir() / "temp" / "http_cache" / self.industry)
+            self.requester = AsyncRequester(self.logger, scheduler=self.scheduler, cache=self.cache)
+            self.versions = VersionNegotiator(self.registry, self.api_name, self.api_versions, self.logger)
 
             endpoints = self._endpoints_from_registry()
             master = await self._fetch_detail_data(endpoints)
 
+            self.versions.commit()
+            self.scheduler.log_stats(self.logger)
+            self.cache.log_stats(self.logger)
             self._save_master(master)
             self._send_slack_update(True)
             self.logger.info(f"...{__class__.__name__} finished ({time.time() - start_time:0.2f} seconds)")
@@ -96,21 +107,37 @@ class DetailDownloader(MasterSaverMixin, SlackUpdateMixin):
         api_responses = []
         master = {}
 
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-            for api_version in api_versions:
-                headers = {**self._HEADERS, "x-v": api_version}
-                tasks = []
-
-                for url in endpoints:
-                    brand_name = endpoints[url]["brand_name"]
-                    prepend_to_log = f"{api_name} v{api_version} | {brand_name} | "
-                    tasks.append(
-                        self._bounded_get_request(session, url, params=self._PARAMS, headers=headers, prepend_to_log=prepend_to_log)
-                    )
+        # Only versions the brand is not known to reject (see VersionNegotiator)
+        brand_versions = {}
+        jobs = []
+        for api_version in api_versions:
+            for url in endpoints:
+                brand_id = endpoints[url]["brand_id"]
+                if brand_id not in brand_versions:
+                    brand_versions[brand_id] = self.versions.versions_for(brand_id)
+                if api_version in brand_versions[brand_id]:
+                    jobs.append((api_version, url))
+                else:
+                    self.versions.skip()
+
+        # Every (version, endpoint) request is queued at once, so the slowest responses of one
+        # version no longer hold back the next; the host scheduler bounds what is in flight.
+        # Slots are laid out in registry order first, so the master files keep their layout
+        # whatever order the responses arrive in.
+        for api_version, url in jobs:
+            brand_name = endpoints[url]["brand_name"]
+            detail_id = endpoints[url]["detail_id"]
+            master.setdefault(api_name, {}).setdefault(f"v{api_version}", {}).setdefault(brand_name, {})[detail_id] = None
 
-                responses = await asyncio.gather(*tasks)
-
-                for response in responses:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
+            tasks = [
+                asyncio.create_task(self._versioned_get_request(session, url, api_version, endpoints[url]["brand_name"]))
+                for api_version, url in jobs
+            ]
+
+            try:
+                for task in asyncio.as_completed(tasks):
+                    api_version, response = await task
                     url = response["url"]
                     status_code = response["statusCode"]
 
@@ -121,9 +148,10 @@ class DetailDownloader(MasterSaverMixin, SlackUpdateMixin):
                     category = endpoints[url]["category"]
 
                     entry = serialise_http_response(response)
-                    master.setdefault(api_name, {}).setdefault(f"v{api_version}", {}).setdefault(brand_name, {})[detail_id] = entry
+                    master[api_name][f"v{api_version}"][brand_name][detail_id] = entry
 
                     self._update_detail_registry(brand_id, detail_id, entry)
+                    self.versions.observe(brand_id, api_version, entry)
 
                     # TODO: decouple and update API responses from master JSON after downloader runs
                     if self.update_api_response_table:
@@ -141,15 +169,25 @@ class DetailDownloader(MasterSaverMixin, SlackUpdateMixin):
                         )
                         if api_response:
                             api_responses.append(api_response)
+            finally:
+                # Nothing left running on the session if a response fails to process.
+                for task in tasks:
+                    task.cancel()
 
         if self.update_api_response_table:
             await db.bulk_create_api_responses(api_responses)
 
         return master
 
+    async def _versioned_get_request(self, session: aiohttp.ClientSession, url: str, api_version: str, brand_name: str) -> tuple[str, HttpResponse]:
+        headers = {**self._HEADERS, "x-v": api_version}
+        prepend_to_log = f"{self.api_name} v{api_version} | {brand_name} | "
+        response = await self._bounded_get_request(session, url, params=self._PARAMS, headers=headers, prepend_to_log=prepend_to_log)
+        return api_version, response
+
     async def _bounded_get_request(self, session: aiohttp.ClientSession, url: str, params: dict[str, Any], headers: dict[str, str], prepend_to_log: str) -> HttpResponse:
-        async with self.semaphore:
-            return await self.requester.get_request(session, url, params=params, headers=headers, prepend_to_log=prepend_to_log)
+        # Bounded per host by self.scheduler, on every attempt the requester makes.
+        return await self.requester.get_request(session, url, params=params, headers=headers, prepend_to_log=prepend_to_log)
 
     def _update_detail_registry(self, brand_id: str, detail_id: str, entry: JsonHttpResponse) -> None:
         status_code = entry["statusCode"]
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+from urllib.parse import urlparse
+
+# Statuses meaning the data holder wants us to slow down (403 is how several CDR gateways throttle).
+THROTTLE_STATUS_CODES = {403, 429, 503}
+
+
+@dataclass
+class HostSlot:
+    """Outcome of one request made under a HostScheduler slot, filled in by the caller."""
+    status: Optional[int] = None
+    retry_after: Optional[float] = None
+    failed: bool = False
+
+
+@dataclass
+class _HostState:
+    limit: float
+    interval: float
+    in_flight: int = 0
+    next_start: float = 0.0
+    blocked_until: float = 0.0
+    waiters: deque = field(default_factory=deque)
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=20))  # True = error
+    requests: int = 0
+    throttled: int = 0
+    errors: int = 0
+
+
+class HostScheduler:
+    """
+    Per-data-holder (per host) admission control for the downloaders.
+
+    Each host gets its own concurrency limit and minimum spacing between
+    request starts, learned from its responses: the limit grows by one per
+    window of successes and halves when the host throttles (403/429/503) or
+    half of its recent requests fail, the spacing doubles on throttling and
+    decays back on success, and Retry-After pauses the host. Free global slots
+    are handed to hosts round-robin, so one large bank's hundreds of detail
+    requests cannot starve the small brands queued behind them.
+    """
+    _DEFAULT_MAX_CONCURRENCY = 100
+    _DEFAULT_HOST_CONCURRENCY = 4
+    _DEFAULT_MAX_HOST_CONCURRENCY = 16
+    _MIN_THROTTLED_INTERVAL = 0.25
+    _MAX_INTERVAL = 10.0
+    _MAX_RETRY_AFTER = 60.0
+    _ERROR_RATE_THRESHOLD = 0.5
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        host_concurrency: Optional[int] = None,
+        max_host_concurrency: Optional[int] = None,
+        min_interval: float = 0.0,
+    ):
+        self.max_concurrency = max_concurrency or self._DEFAULT_MAX_CONCURRENCY
+        self.host_concurrency = host_concurrency or self._DEFAULT_HOST_CONCURRENCY
+        self.max_host_concurrency = max(max_host_concurrency or self._DEFAULT_MAX_HOST_CONCURRENCY, self.host_concurrency)
+        self.min_interval = min_interval
+
+        self._hosts: dict[str, _HostState] = {}
+        self._order: deque[str] = deque()  # round-robin rotation of hosts
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[HostSlot]:
+        """
+        Wait for a slot on the URL's host, hold it for one request, then learn from the outcome.
+
+        Set status (and retry_after) on the yielded HostSlot, or failed for
+        connection errors and timeouts; an exception leaving the block counts as failed.
+        """
+        host = self.host_of(url)
+        await self._acquire(host)
+        outcome = HostSlot()
+        try:
+            yield outcome
+        except BaseException:
+            outcome.failed = True
+            raise
+        finally:
+            self._release(host, outcome)
+
+    async def _acquire(self, host: str) -> None:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(limit=float(self.host_concurrency), interval=self.min_interval)
+            self._order.append(host)
+
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(host, HostSlot(failed=True))  # Granted just as we were cancelled.
+            elif waiter in state.waiters:
+                state.waiters.remove(waiter)
+            raise
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting hosts, one per host per pass, in round-robin order."""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        next_wake = None
+
+        granted = True
+        while granted and self._in_flight < self.max_concurrency:
+            granted = False
+            for _ in range(len(self._order)):
+                if self._in_flight >= self.max_concurrency:
+                    break
+                host = self._order[0]
+                self._order.rotate(-1)
+                state = self._hosts[host]
+                if not state.waiters or state.in_flight >= max(int(state.limit), 1):
+                    continue
+
+                ready_at = max(state.blocked_until, state.next_start)
+                if ready_at > now:
+                    next_wake = ready_at if next_wake is None else min(next_wake, ready_at)
+                    continue
+
+                waiter = state.waiters.popleft()
+                if waiter.cancelled():
+                    continue
+                waiter.set_result(None)
+                state.in_flight += 1
+                state.requests += 1
+                state.next_start = now + state.interval
+                self._in_flight += 1
+                granted = True
+
+        # Wake up for the earliest host that is only waiting on its spacing or Retry-After.
+        if next_wake is not None and (self._timer is None or next_wake < self._timer_at):
+            if self._timer is not None:
+                self._timer.cancel()
+
+            def wake() -> None:
+                self._timer = None
+                self._dispatch()
+            self._timer = loop.call_later(max(next_wake - now, 0.0), wake)
+            self._timer_at = next_wake
+
+    def _release(self, host: str, outcome: HostSlot) -> None:
+        state = self._hosts[host]
+        state.in_flight -= 1
+        self._in_flight -= 1
+        now = time.monotonic()
+
+        if outcome.status in THROTTLE_STATUS_CODES:
+            state.throttled += 1
+            state.limit = max(state.limit / 2, 1.0)
+            state.interval = min(max(state.interval * 2, self._MIN_THROTTLED_INTERVAL), self._MAX_INTERVAL)
+            if outcome.retry_after:
+                state.blocked_until = max(state.blocked_until, now + min(outcome.retry_after, self._MAX_RETRY_AFTER))
+            state.outcomes.append(True)
+        else:
+            error = outcome.failed or (outcome.status is not None and outcome.status >= 500)
+            state.outcomes.append(error)
+            if error:
+                state.errors += 1
+                if len(state.outcomes) >= 5 and sum(state.outcomes) / len(state.outcomes) >= self._ERROR_RATE_THRESHOLD:
+                    state.limit = max(state.limit / 2, 1.0)
+                    state.outcomes.clear()
+            else:
+                state.limit = min(state.limit + 1 / state.limit, float(self.max_host_concurrency))
+                # Decay back to the configured spacing once the host has recovered.
+                state.interval = state.interval * 0.9 if state.interval * 0.9 > self.min_interval + 0.01 else self.min_interval
+
+        self._dispatch()
+
+    def stats(self) -> dict[str, dict]:
+        """Per host: requests, throttled, errors and the learned concurrency limit and spacing."""
+        return {
+            host: {
+                "requests": state.requests,
+                "throttled": state.throttled,
+                "errors": state.errors,
+                "concurrency_limit": round(state.limit, 2),
+                "interval_seconds": round(state.interval, 3),
+            }
+            for host, state in self._hosts.items()
+        }
+
+    def log_stats(self, logger: logging.Logger) -> None:
+        """One summary line, plus a line per host that throttled or failed requests."""
+        stats = self.stats()
+        logger.info(f"Host scheduler: {sum(s['requests'] for s in stats.values())} requests across {len(stats)} hosts")
+        for host, host_stats in stats.items():
+            if host_stats["throttled"] or host_stats["errors"]:
+                logger.info(f"Host scheduler | {host} | {host_stats}")
@@ -17,6 +17,7 @@ class SummaryData:
     brandNameOverride: Optional[str] = None
     baseUriOverride: Optional[str] = None
     last200Response: Optional[str] = None
+    unsupportedVersions: Optional[dict[str, dict[str, str]]] = None # {api name: {x-v: last probed}}, see VersionNegotiator
     skip: bool = False
 
 
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import pathlib
+from typing import Any, Optional, Union
+
+from utils.fs import check_exists, read_json_file, write_json_file
+
+
+class HttpResponseCache:
+    """
+    Local cache of JSON responses and their validators, for conditional GETs.
+
+    Entries are keyed by URL, query params and x-v, and stored one JSON file
+    each under `path`. A 200 response with an ETag or Last-Modified is stored;
+    the next request for the same key sends If-None-Match / If-Modified-Since,
+    and AsyncRequester answers a 304 from the stored body, so downloaders
+    still see a 200 with the full body. Only the validators are held in
+    memory; a body is read back from disk when its 304 is answered.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._validators: dict[str, Optional[dict[str, Optional[str]]]] = {}
+
+        self.revalidated = 0
+        self.stored = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key(url: str, params: Optional[dict[str, Any]], headers: Optional[dict[str, str]]) -> str:
+        api_version = {k.lower(): v for k, v in (headers or {}).items()}.get("x-v")
+        identity = {"url": url, "params": {k: str(v) for k, v in (params or {}).items()}, "x-v": api_version}
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[dict[str, Optional[str]]]:
+        """The cached validators ({"etag", "lastModified"}) for this key, or None if nothing is cached."""
+        if key not in self._validators:
+            entry = self._read(key) if check_exists(self._file(key)) else None
+            self._validators[key] = self._validators_of(entry) if entry is not None else None
+        return self._validators[key]
+
+    @staticmethod
+    def conditional_headers(validators: Optional[dict[str, Optional[str]]]) -> dict[str, str]:
+        if validators is None:
+            return {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("lastModified"):
+            headers["If-Modified-Since"] = validators["lastModified"]
+        return headers
+
+    def store(self, key: str, response_headers: dict[str, str], body: Any, size: int) -> None:
+        """Keep a 200 response that carries a validator; anything else cannot be revalidated."""
+        headers = {k.lower(): v for k, v in response_headers.items()}
+        if not (headers.get("etag") or headers.get("last-modified")) or not isinstance(body, (dict, list)):
+            return
+
+        entry = {
+            "etag": headers.get("etag"),
+            "lastModified": headers.get("last-modified"),
+            "responseHeaders": response_headers,
+            "body": body,
+            "size": size,
+        }
+        self._validators[key] = self._validators_of(entry)
+        self._write(key, entry)
+        self.stored += 1
+
+    def revalidate(self, key: str, not_modified_headers: dict[str, str]) -> Optional[tuple[dict[str, str], Any]]:
+        """
+        Headers and body to answer a 304 with: the stored ones, updated by the 304's headers.
+
+        None if the stored entry can no longer be read; its validators are dropped,
+        so the caller can request the URL again as a cache miss.
+        """
+        entry = self._read(key)
+        if entry is None:
+            self._validators[key] = None
+            return None
+        self.revalidated += 1
+        self.bytes_saved += entry.get("size") or 0
+
+        headers = {k.lower(): v for k, v in not_modified_headers.items()}
+        if headers.get("etag") not in (None, entry["etag"]) or headers.get("last-modified") not in (None, entry["lastModified"]):
+            entry["etag"] = headers.get("etag") or entry["etag"]
+            entry["lastModified"] = headers.get("last-modified") or entry["lastModified"]
+            self._validators[key] = self._validators_of(entry)
+            self._write(key, entry)
+
+        return {**entry["responseHeaders"], **not_modified_headers}, entry["body"]
+
+    def log_stats(self, logger: logging.Logger) -> None:
+        logger.info(f"HTTP cache: {self.revalidated} responses not modified ({self.bytes_saved / 1e6:0.1f} MB not downloaded), {self.stored} stored")
+
+    @staticmethod
+    def _validators_of(entry: dict) -> dict[str, Optional[str]]:
+        return {"etag": entry.get("etag"), "lastModified": entry.get("lastModified")}
+
+    def _read(self, key: str) -> Optional[dict]:
+        try:
+            entry = read_json_file(self._file(key))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or not all(field in entry for field in ("etag", "lastModified", "responseHeaders", "body")):
+            return None
+        return entry
+
+    def _file(self, key: str) -> pathlib.Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def _write(self, key: str, entry: dict) -> None:
+        file = self._file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        write_json_file(file, entry)
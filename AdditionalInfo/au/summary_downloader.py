@@ -5,18 +5,25 @@ from datetime import datetime, timedelta
 from typing import Any
 
 import aiohttp
+from utils.fs import get_root_dir
 
 from . import db
 from .async_requester import HttpResponse, AsyncRequester
 from .config import COMMON_HEADERS, INDUSTRY_CONFIG
+from .host_scheduler import HostScheduler
 from .master_saver_mixin import MasterSaverMixin
 from .registry import BankingDetailData, EnergyDetailData, Registry
+from .response_cache import HttpResponseCache
 from .slack_update_mixin import SlackUpdateMixin
-from .utils import JsonHttpResponse, serialise_http_response, is_empty_summary_response
+from .utils import JsonHttpResponse, serialise_http_response, split_url_query_params, is_empty_summary_response
+from .version_negotiator import VersionNegotiator
 
 
 class SummaryDownloader(MasterSaverMixin, SlackUpdateMixin):
-    _MAX_CONCURRENCY = 100 # TODO: Set limit per data holder (i.e. per base URI)
+    _MAX_CONCURRENCY = 100
+    _HOST_CONCURRENCY = 4 # Starting limit per data holder (i.e. per base URI host); adapts to throttling
+    _MAX_HOST_CONCURRENCY = 16
+    _MAX_LINKED_PAGES = 200 # Stop following links.next (used when meta.totalPages is missing) after this many pages
     _PARAMS = {
         "effective": "ALL",
         "page": 1,
@@ -49,12 +56,17 @@ class SummaryDownloader(MasterSaverMixin, SlackUpdateMixin):
 
         try:
             start_time = time.time()
-            self.semaphore = asyncio.Semaphore(self._MAX_CONCURRENCY)
-            self.requester = AsyncRequester(self.logger)
+            self.scheduler = HostScheduler(self._MAX_CONCURRENCY, self._HOST_CONCURRENCY, self._MAX_HOST_CONCURRENCY)
+            self.cache = HttpResponseCache(get_root_dir() / "temp" / "http_cache" / self.industry)
+            self.requester = AsyncRequester(self.logger, scheduler=self.scheduler, cache=self.cache)
+            self.versions = VersionNegotiator(self.registry, self.api_name, self.api_versions, self.logger)
 
             endpoints = self._endpoints_from_registry()
             master = await self._fetch_summary_data(endpoints)
 
+            self.versions.commit()
+            self.scheduler.log_stats(self.logger)
+            self.cache.log_stats(self.logger)
             self._save_master(master)
             self._send_slack_update(True)
             self.logger.info(f"...{__class__.__name__} finished ({time.time() - start_time:0.2f} seconds)")
@@ -90,96 +102,133 @@ class SummaryDownloader(MasterSaverMixin, SlackUpdateMixin):
         api_responses = []
         master = {}
 
+        # Only versions the brand is not known to reject (see VersionNegotiator)
+        brand_versions = {}
+        jobs = []
+        for api_version in api_versions:
+            for url in endpoints:
+                brand_id = endpoints[url]["brand_id"]
+                if brand_id not in brand_versions:
+                    brand_versions[brand_id] = self.versions.versions_for(brand_id)
+                if api_version in brand_versions[brand_id]:
+                    jobs.append((api_version, url))
+                else:
+                    self.versions.skip()
+
+        # Every (version, brand) first page is queued at once, and each brand's later pages are
+        # queued as soon as its first page says how many there are, so the pages of all brands
+        # and versions share the host scheduler instead of one brand's pages at a time.
+        # Brands are laid out in registry order first, so the master files keep their layout
+        # whatever order the responses arrive in; pages are placed by page number.
+        for api_version, url in jobs:
+            master.setdefault(api_name, {}).setdefault(f"v{api_version}", {})[endpoints[url]["brand_name"]] = []
+
+        # Jobs whose follow-up pages were all requested from page 1's meta.totalPages
+        planned_jobs: set[tuple[str, str]] = set()
+
         async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-            for api_version in api_versions:
-                headers = {**self._HEADERS, "x-v": api_version}
-                tasks = []
-
-                for url in endpoints:
-                    brand_name = endpoints[url]["brand_name"]
-                    prepend_to_log = f"{api_name} v{api_version} | {brand_name} | "
-                    tasks.append(
-                        self._bounded_get_request(session, url, params=self._PARAMS, headers=headers, prepend_to_log=prepend_to_log)
-                    )
+            pending = {
+                asyncio.create_task(self._page_request(session, url, api_version, endpoints[url]["brand_name"], 1, self._PARAMS))
+                for api_version, url in jobs
+            }
 
-                responses = await asyncio.gather(*tasks)
-
-                for response in responses:
-                    url = response["url"]
-                    status_code = response["statusCode"]
-
-                    brand_id = endpoints[url]["brand_id"]
-                    brand_name = endpoints[url]["brand_name"]
-
-                    entry = serialise_http_response(response)
-                    master.setdefault(api_name, {}).setdefault(f"v{api_version}", {}).setdefault(brand_name, []).append(entry)
-
-                    self._update_summary_registry(brand_id, entry)
-                    self._update_detail_registry(brand_id, entry)
-
-                    # TODO: decouple and update API responses from master JSON after downloader runs
-                    if self.update_api_response_table:
-                        api_response = await db.create_api_response_object(
-                            url=entry["url"],
-                            brand_id=brand_id,
-                            brand_name=brand_name,
-                            status_code=status_code,
-                            is_empty=is_empty_summary_response(response["body"], self.summary_key) if status_code == 200 else False,
-                            api_name=api_name,
-                            api_version=f"v{api_version}",
-                            requested_at=response["requestedAt"],
-                        )
-                        if api_response:
-                            api_responses.append(api_response)
-
-                    if status_code != 200:
-                        continue
-
-                    prepend_to_log = f"{api_name} v{api_version} | {brand_name} | "
-
-                    try:
-                        total_pages = int(response["body"]["meta"]["totalPages"])
-                    except Exception as e:
-                        self.logger.error(f"{prepend_to_log}{url} | Failed to extract totalPages: {e}")
-                        total_pages = 1
-
-                    if total_pages > 1:
-                        page_tasks = [
-                            self._bounded_get_request(session, url, params={**self._PARAMS, "page": p}, headers=headers, prepend_to_log=prepend_to_log)
-                            for p in range(2, total_pages + 1)
-                        ]
-                        page_responses = await asyncio.gather(*page_tasks)
-
-                        for page_response in page_responses:
-                            page_status_code = page_response["statusCode"]
-
-                            page_entry = serialise_http_response(page_response)
-                            master[api_name][f"v{api_version}"][brand_name].append(page_entry)
-
-                            self._update_detail_registry(brand_id, page_entry)
-
-                            # TODO: decouple and update API responses from master JSON after downloader runs
-                            page_api_response = await db.create_api_response_object(
-                                url=page_entry["url"],
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                    for task in done:
+                        api_version, url, page, response = task.result()
+                        status_code = response["statusCode"]
+
+                        brand_id = endpoints[url]["brand_id"]
+                        brand_name = endpoints[url]["brand_name"]
+
+                        entry = serialise_http_response(response)
+                        pages = master[api_name][f"v{api_version}"][brand_name]
+                        pages.extend([None] * (page - len(pages)))
+                        pages[page - 1] = entry
+
+                        if page == 1:
+                            self._update_summary_registry(brand_id, entry)
+                            self.versions.observe(brand_id, api_version, entry)
+                        self._update_detail_registry(brand_id, entry)
+
+                        # TODO: decouple and update API responses from master JSON after downloader runs
+                        if self.update_api_response_table:
+                            api_response = await db.create_api_response_object(
+                                url=entry["url"],
                                 brand_id=brand_id,
                                 brand_name=brand_name,
-                                status_code=page_status_code,
-                                is_empty=is_empty_summary_response(page_response["body"], self.summary_key) if page_status_code == 200 else False,
+                                status_code=status_code,
+                                is_empty=is_empty_summary_response(response["body"], self.summary_key) if status_code == 200 else False,
                                 api_name=api_name,
                                 api_version=f"v{api_version}",
-                                requested_at=page_response["requestedAt"],
+                                requested_at=response["requestedAt"],
                             )
-                            if page_api_response:
-                                api_responses.append(page_api_response)
+                            if api_response:
+                                api_responses.append(api_response)
+
+                        if status_code != 200:
+                            continue
+
+                        for next_page, params in self._next_pages(api_version, brand_name, url, page, response, planned_jobs):
+                            pending.add(asyncio.create_task(self._page_request(session, url, api_version, brand_name, next_page, params)))
+            finally:
+                # Nothing left running on the session if a response fails to process.
+                for task in pending:
+                    task.cancel()
 
         if self.update_api_response_table:
             await db.bulk_create_api_responses(api_responses)
 
         return master
 
+    async def _page_request(self, session: aiohttp.ClientSession, url: str, api_version: str, brand_name: str, page: int, params: dict[str, Any]) -> tuple[str, str, int, HttpResponse]:
+        headers = {**self._HEADERS, "x-v": api_version}
+        prepend_to_log = f"{self.api_name} v{api_version} | {brand_name} | "
+        response = await self._bounded_get_request(session, url, params=params, headers=headers, prepend_to_log=prepend_to_log)
+        return api_version, url, page, response
+
+    def _next_pages(self, api_version: str, brand_name: str, url: str, page: int, response: HttpResponse, planned_jobs: set[tuple[str, str]]) -> list[tuple[int, dict[str, Any]]]:
+        """
+        Follow-up pages to request after this page: all of pages 2..totalPages once the first page
+        arrives, or, for holders that omit meta.totalPages there, the page at links.next one at a
+        time until it is absent (a totalPages on a later page does not stop it).
+        """
+        prepend_to_log = f"{self.api_name} v{api_version} | {brand_name} | "
+        body = response["body"]
+
+        try:
+            total_pages = int(body["meta"]["totalPages"])
+        except Exception as e:
+            total_pages = None
+            if page == 1:
+                self.logger.warning(f"{prepend_to_log}{url} | Failed to extract totalPages, following links.next: {e}")
+
+        if (api_version, url) in planned_jobs:
+            return []
+        if page == 1 and total_pages is not None:
+            planned_jobs.add((api_version, url))
+            return [(p, {**self._PARAMS, "page": p}) for p in range(2, total_pages + 1)]
+
+        try:
+            next_link = body["links"]["next"]
+        except Exception:
+            next_link = None
+
+        if not next_link or page >= self._MAX_LINKED_PAGES:
+            return []
+
+        # Keep our query defaults (e.g. effective=ALL) unless the link overrides them.
+        next_url, next_params = split_url_query_params(next_link)
+        if next_url.rstrip("/") != url.rstrip("/"):
+            self.logger.error(f"{prepend_to_log}{url} | links.next points elsewhere, not following: {next_link}")
+            return []
+        return [(page + 1, {**self._PARAMS, "page": page + 1, **next_params})]
+
     async def _bounded_get_request(self, session: aiohttp.ClientSession, url: str, params: dict[str, Any], headers: dict[str, str], prepend_to_log: str) -> HttpResponse:
-        async with self.semaphore:
-            return await self.requester.get_request(session, url, params=params, headers=headers, prepend_to_log=prepend_to_log)
+        # Bounded per host by self.scheduler, on every attempt the requester makes.
+        return await self.requester.get_request(session, url, params=params, headers=headers, prepend_to_log=prepend_to_log)
 
     def _update_summary_registry(self, brand_id: str, entry: JsonHttpResponse) -> None:
         status_code = entry["statusCode"]
@@ -187,6 +236,10 @@ class SummaryDownloader(MasterSaverMixin, SlackUpdateMixin):
 
         summary_data = self.registry.get_summary_data(brand_id)
 
+        # Already removed by another version's response
+        if summary_data is None:
+            return
+
         if status_code == 200:
             summary_data.last200Response = requested_at
             return
@@ -0,0 +1,41 @@
+from .response_cache import HttpResponseCache
+
+URL = "https://api.bank.example/cds-au/v1/banking/products"
+HEADERS = {"x-v": "4"}
+BODY = {"data": {"products": [{"productId": "P1"}]}, "meta": {"totalPages": 1}}
+
+
+def _stored(tmp_path) -> tuple[HttpResponseCache, str]:
+    cache = HttpResponseCache(tmp_path)
+    key = cache.key(URL, {"page": 1}, HEADERS)
+    cache.store(key, {"ETag": '"v1"', "Content-Type": "application/json"}, BODY, 128)
+    return cache, key
+
+
+def test_not_modified_is_answered_from_disk(tmp_path):
+    cache, key = _stored(tmp_path)
+
+    assert HttpResponseCache.conditional_headers(cache.lookup(key)) == {"If-None-Match": '"v1"'}
+    headers, body = cache.revalidate(key, {"ETag": '"v1"'})
+
+    assert body == BODY
+    assert headers["Content-Type"] == "application/json"
+    assert (cache.revalidated, cache.bytes_saved) == (1, 128)
+
+
+def test_missing_entry_is_treated_as_a_miss(tmp_path):
+    cache, key = _stored(tmp_path)
+    cache._file(key).unlink()
+
+    assert cache.revalidate(key, {"ETag": '"v1"'}) is None
+    assert cache.lookup(key) is None
+    assert cache.revalidated == 0
+
+
+def test_corrupted_entry_is_treated_as_a_miss(tmp_path):
+    cache, key = _stored(tmp_path)
+    cache._file(key).write_text('{"etag": "\\"v1\\"", "body": {"da', encoding="utf-8")
+
+    assert cache.revalidate(key, {"ETag": '"v1"'}) is None
+    assert cache.lookup(key) is None
+    assert HttpResponseCache(tmp_path).lookup(key) is None
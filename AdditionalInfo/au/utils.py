@@ -26,6 +26,13 @@ def update_url_query_params(url: str, params: Optional[dict[str, Any]]) -> str:
     return urlunparse(url_parts)
 
 
+def split_url_query_params(url: str) -> tuple[str, dict[str, str]]:
+    url_parts = list(urlparse(url))
+    query = dict(parse_qsl(url_parts[4]))
+    url_parts[4] = ""
+    return urlunparse(url_parts), query
+
+
 def serialise_http_response(response: HttpResponse) -> JsonHttpResponse:
     url = response["url"]
     params = response["requestParams"]
@@ -0,0 +1,114 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.utils import timezone
+
+from .registry import Registry
+from .utils import JsonHttpResponse
+
+# CDR error codes for an x-v the data holder does not serve (406) or cannot parse (400)
+UNSUPPORTED_VERSION_ERROR_CODES = {
+    "urn:au-cds:error:cds-all:Header/UnsupportedVersion",
+    "urn:au-cds:error:cds-all:Header/InvalidVersion",
+}
+
+
+class VersionNegotiator:
+    """
+    Remembers which x-v versions of an API each data holder brand does not serve.
+
+    Versions a brand answered with an unsupported-version error are stored in
+    the registry (SummaryData.unsupportedVersions, per API name, with when they
+    were last probed) and left out of routine runs; they are requested again
+    once the last probe is older than reprobe_days. Outcomes are only written
+    back at the end of a run: any 200 at a version marks it served, otherwise
+    an unsupported-version response marks it unsupported.
+    """
+    _DEFAULT_REPROBE_DAYS = 7
+
+    def __init__(self, registry: Registry, api_name: str, api_versions: list[str], logger: logging.Logger, reprobe_days: Optional[int] = None):
+        self.registry = registry
+        self.api_name = api_name
+        self.api_versions = api_versions
+        self.logger = logger
+        self.reprobe_days = reprobe_days or self._DEFAULT_REPROBE_DAYS
+
+        self._served: set[tuple[str, str]] = set()
+        self._unsupported: dict[tuple[str, str], str] = {}
+        self.requests_saved = 0
+        self.reprobes = 0
+
+    def versions_for(self, brand_id: str) -> list[str]:
+        """Versions to request from this brand today: all but those known unsupported and not due a re-probe."""
+        summary_data = self.registry.get_summary_data(brand_id)
+        unsupported = ((summary_data.unsupportedVersions if summary_data else None) or {}).get(self.api_name, {})
+        if not unsupported:
+            return list(self.api_versions)
+
+        reprobe_before = timezone.now() - timedelta(days=self.reprobe_days)
+        versions = []
+        for api_version in self.api_versions:
+            last_probed = unsupported.get(api_version)
+            if last_probed is None:
+                versions.append(api_version)
+            elif datetime.fromisoformat(last_probed) < reprobe_before:
+                self.reprobes += 1
+                versions.append(api_version)
+
+        # Never go silent on a brand: with nothing left to ask for, probe everything.
+        return versions or list(self.api_versions)
+
+    def skip(self, count: int = 1) -> None:
+        """Count requests not made because their version is known unsupported."""
+        self.requests_saved += count
+
+    def observe(self, brand_id: str, api_version: str, entry: JsonHttpResponse) -> None:
+        key = (brand_id, api_version)
+        if self._is_unsupported_version(api_version, entry):
+            self._unsupported.setdefault(key, entry["requestedAt"])
+        elif entry["statusCode"] == 200:
+            self._served.add(key)
+
+    def commit(self) -> None:
+        """Write what this run learned to the registry."""
+        for brand_id, api_version in self._served | set(self._unsupported):
+            summary_data = self.registry.get_summary_data(brand_id)
+            if summary_data is None:
+                continue
+
+            versions = (summary_data.unsupportedVersions or {}).get(self.api_name, {})
+            if (brand_id, api_version) in self._served:
+                if versions.pop(api_version, None) is not None:
+                    self.logger.info(f"{self.api_name} | brandId '{brand_id}' now serves v{api_version}")
+            else:
+                if api_version not in versions:
+                    self.logger.info(f"{self.api_name} | brandId '{brand_id}' does not serve v{api_version}, skipping it for {self.reprobe_days} days")
+                versions[api_version] = self._unsupported[(brand_id, api_version)]
+
+            summary_data.unsupportedVersions = {
+                **{k: v for k, v in (summary_data.unsupportedVersions or {}).items() if k != self.api_name},
+                **({self.api_name: versions} if versions else {}),
+            } or None
+
+        self.logger.info(f"{self.api_name} | Version negotiation: {self.requests_saved} requests skipped, {self.reprobes} unsupported versions re-probed")
+
+    @staticmethod
+    def _is_unsupported_version(api_version: str, entry: JsonHttpResponse) -> bool:
+        status_code = entry["statusCode"]
+
+        if status_code == 406:
+            return True
+
+        if status_code == 200:
+            # We only send x-v, so a holder answering with another version is not serving ours.
+            served_version = {k.lower(): v for k, v in (entry["responseHeaders"] or {}).items()}.get("x-v")
+            return served_version is not None and str(served_version).strip() != api_version
+
+        if status_code == 400:
+            try:
+                return any(error.get("code") in UNSUPPORTED_VERSION_ERROR_CODES for error in entry["body"]["errors"])
+            except Exception:
+                return False
+
+        return False
@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from Agent import Agent, AsyncAgent, PROMPT_VERSION
+from LLMBackend import StubBackend
+from ProductDetailsStore import open_product_details
+from RateLimitScheduler import RateLimitScheduler
+
+# End-to-end benchmark of run_agent on synthetic combined_product_details corpora,
+# against StubBackend so only this pipeline (planning, rules, cache, scheduler,
+# validation, post-processing) is measured. Scale 1 is BASE_BANKS banks of
+# BASE_PRODUCTS products; scale N has N times the products per bank. Each scale
+# runs in a fresh process so peak RSS is its own, and the results are written
+# as JSON to compare between versions (--baseline).
+BASE_BANKS = 4
+BASE_PRODUCTS = 25
+RESULTS_DIR = "benchmarks"
+
+PRODUCT_CATEGORIES = [
+    "TRANS_AND_SAVINGS_ACCOUNTS", "TERM_DEPOSITS", "CRED_AND_CHRG_CARDS", "PERS_LOANS",
+    "RESIDENTIAL_MORTGAGES", "BUSINESS_LOANS", "TRAVEL_CARDS", "OVERDRAFTS",
+]
+CDR_FEE_TYPES = ["PERIODIC", "TRANSACTION", "WITHDRAWAL", "DEPOSIT", "PAYMENT", "EXIT", "UPFRONT", "EVENT", "OTHER"]
+
+# (fee name, additionalInfo templates); "" means the CDR fee has no additionalInfo.
+FEE_TEMPLATES = [
+    ("Monthly Account Fee", ["", "A monthly fee of ${amount} applies unless you deposit ${threshold} or more each month.", "${amount} per month, waived for customers under 25."]),
+    ("Overseas ATM Withdrawal Fee", ["", "${amount} for each withdrawal from an ATM outside Australia.", "{rate}% of the withdrawal amount, minimum ${amount}."]),
+    ("International Transaction Fee", ["{rate}% of the transaction value for purchases made in a foreign currency or with an overseas merchant.", ""]),
+    ("Cheque Dishonour Fee", ["", "${amount} when a cheque you deposited is dishonoured."]),
+    ("Late Payment Fee", ["${amount} if the minimum payment is not received by the due date.", ""]),
+    ("Establishment Fee", ["", "A one-off establishment fee of ${amount} is charged when the loan is drawn down.", "Nil for online applications; ${amount} otherwise."]),
+    ("Early Termination Fee", ["Break costs may apply if you pay out the fixed rate loan early. Contact us for details.", ""]),
+    ("Card Replacement Fee", ["", "${amount} per replacement card, no charge if the card was stolen."]),
+    ("Special Service Fee", ["Fees for special services such as archive searches are charged at cost. See our Banking Services Fees booklet.", ""]),
+    ("Annual Fee", ["", "${amount} per year, charged on the first statement after each anniversary.", "Annual fee of ${amount}; ${discount} off in the first year."]),
+    ("Balance Enquiry Fee", ["", "${amount} for balance enquiries at non-network ATMs."]),
+    ("Cash Advance Fee", ["{rate}% of the cash advance amount or ${amount}, whichever is greater."]),
+]
+
+
+def _fill(template: str, rng: random.Random) -> str:
+    return template.format(
+        amount=rng.choice(["2.50", "5", "10", "15.00", "30", "395", "600"]),
+        threshold=rng.choice(["1,000", "2,000", "2000"]),
+        rate=rng.choice(["2", "3", "3.4", "0.5"]),
+        discount=rng.choice(["50%", "$100"]),
+    )
+
+
+def synthetic_fee(rng: random.Random, fee_name: str, templates: list) -> dict:
+    """One CDR fee object, with the optional pricing fields real data holders fill in unevenly."""
+    fee = {"name": fee_name, "feeType": rng.choice(CDR_FEE_TYPES)}
+    if rng.random() < 0.5:
+        fee["amount"] = rng.choice(["0.00", "2.50", "5.00", "10.00", "395.00"])
+    elif rng.random() < 0.2:
+        fee["transactionRate"] = rng.choice(["0.03", "0.02", "0.034"])
+    if rng.random() < 0.8:
+        fee["currency"] = "AUD"
+    additional_info = _fill(rng.choice(templates), rng)
+    if additional_info:
+        fee["additionalInfo"] = additional_info
+    if rng.random() < 0.3:
+        fee["additionalInfoUri"] = "https://www.example.com.au/fees"
+    if rng.random() < 0.15:
+        fee["discounts"] = [{
+            "description": "Waived when you deposit $2,000 a month",
+            "discountType": "DEPOSITS",
+            "amount": fee.get("amount", "5.00"),
+        }]
+    return fee
+
+
+def synthetic_product(rng: random.Random, brand_name: str, index: int, fees_per_product: int) -> dict:
+    """A product-detail response record as it appears in combined_product_details.json."""
+    product_id = f"{brand_name[:3].upper()}-{index:06d}"
+    category = rng.choice(PRODUCT_CATEGORIES)
+    fee_count = max(0, int(rng.gauss(fees_per_product, fees_per_product / 2)))
+    templates = rng.sample(FEE_TEMPLATES, min(fee_count, len(FEE_TEMPLATES)))
+    data = {
+        "productId": product_id,
+        "effectiveFrom": "2025-07-01T00:00:00Z",
+        "lastUpdated": "2026-02-01T00:00:00Z",
+        "productCategory": category,
+        "name": f"{brand_name} {category.replace('_', ' ').title()} {index}",
+        "description": "A synthetic product for benchmarking. " * rng.randint(1, 4),
+        "brand": brand_name,
+        "brandName": brand_name,
+        "applicationUri": "https://www.example.com.au/apply",
+        "isTailored": rng.random() < 0.3,
+        "additionalInformation": {"overviewUri": "https://www.example.com.au/overview"},
+        "eligibility": [{"eligibilityType": "MIN_AGE", "additionalValue": "18"}],
+        "features": [{"featureType": rng.choice(["CARD_ACCESS", "DIGITAL_WALLET", "NPP_PAYID"])} for _ in range(rng.randint(1, 5))],
+        "constraints": [{"constraintType": "MIN_BALANCE", "additionalValue": "1000.00"}] if rng.random() < 0.3 else [],
+        "fees": [synthetic_fee(rng, fee_name, fee_templates) for fee_name, fee_templates in templates],
+    }
+    if category in ("TRANS_AND_SAVINGS_ACCOUNTS", "TERM_DEPOSITS"):
+        data["depositRates"] = [{"depositRateType": "VARIABLE", "rate": "0.0450"}]
+    else:
+        data["lendingRates"] = [{"lendingRateType": "VARIABLE", "rate": "0.0699", "comparisonRate": "0.0712"}]
+    return {
+        "statusCode": 200,
+        "body": {"data": data, "links": {"self": f"https://api.example.com.au/cds-au/v1/banking/products/{product_id}"}, "meta": {}},
+    }
+
+
+def synthetic_corpus(banks: int, products_per_bank: int, fees_per_product: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        f"Synthetic Bank {b:03d}": {
+            f"SB{b:03d}-{p:06d}": synthetic_product(rng, f"Synthetic Bank {b:03d}", p, fees_per_product)
+            for p in range(products_per_bank)
+        }
+        for b in range(banks)
+    }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _make_agent(config: dict, work_dir: Path) -> Agent:
+    backend = StubBackend(
+        latency=config["latency"],
+        latency_jitter=config["latency_jitter"],
+        error_rate=config["error_rate"],
+        malformed_rate=config["malformed_rate"],
+        seed=config["seed"],
+    )
+    options = {
+        "temperature": 0,
+        "backend": backend,
+        "cache_path": str(work_dir / "cache.sqlite3") if config["cache"] else None,
+        "usage_log_path": None,
+        "batch_size": config["batch_size"],
+    }
+    if config["engine"] == "sync":
+        return Agent(**options)
+    # Budgets high enough that the scheduler admits at the concurrency limit, not the rate limits.
+    scheduler = RateLimitScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12, max_concurrency=config["concurrency"])
+    return AsyncAgent(scheduler=scheduler, max_concurrency=config["concurrency"], **options)
+
+
+def run_scale(config: dict, scale: int) -> dict:
+    """Generate the corpus for one scale, run every bank through the agent and measure it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        corpus_path = work_dir / "combined_product_details.json"
+        corpus = synthetic_corpus(config["banks"], config["products"] * scale, config["fees_per_product"], config["seed"])
+        with open(corpus_path, "w", encoding="utf-8") as f:
+            json.dump(corpus, f, indent=2, ensure_ascii=False)
+        del corpus
+
+        agent = _make_agent(config, work_dir)
+        postprocess_seconds = 0.0
+
+        def timed(method):
+            def wrapper(*args, **kwargs):
+                nonlocal postprocess_seconds
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    postprocess_seconds += time.perf_counter() - started
+            return wrapper
+
+        agent._postprocess_extraction = timed(agent._postprocess_extraction)
+        agent._flatten_extracted = timed(agent._flatten_extracted)
+
+        load_seconds = 0.0
+        run_seconds = 0.0
+        totals = {"products": 0, "fees": 0, "fees_resolved_by_rules": 0, "extraction_cache_hits": 0, "llm_calls": 0, "errors": 0}
+
+        started = time.perf_counter()
+        details = open_product_details(str(corpus_path))
+        load_seconds += time.perf_counter() - started
+
+        for bank_name in details.bank_names():
+            started = time.perf_counter()
+            bank_data = details.load(bank_name)
+            load_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            if config["engine"] == "sync":
+                results = agent._run_bank(bank_name, bank_data)
+            else:
+                results = asyncio.run(agent._run_bank_async(bank_name, bank_data))
+            run_seconds += time.perf_counter() - started
+
+            summary = results["summary"]
+            totals["products"] += summary["total_products"]
+            totals["fees"] += summary["total_fees_processed"]
+            totals["fees_resolved_by_rules"] += summary.get("fees_resolved_by_rules", 0)
+            totals["extraction_cache_hits"] += summary.get("extraction_cache_hits", 0)
+            totals["llm_calls"] += summary.get("llm_calls", 0)
+            totals["errors"] += sum(1 for product in results["products"] for fee in product["extracted_fees"] if "error" in fee)
+            del bank_data, results
+
+        return {
+            "scale": scale,
+            "corpus_mb": round(corpus_path.stat().st_size / (1024 * 1024), 1),
+            **totals,
+            "json_load_seconds": round(load_seconds, 3),
+            "run_seconds": round(run_seconds, 3),
+            "postprocess_seconds": round(postprocess_seconds, 3),
+            "products_per_second": round(totals["products"] / run_seconds, 1) if run_seconds else None,
+            "fees_per_second": round(totals["fees"] / run_seconds, 1) if run_seconds else None,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Print the change in throughput and memory against an earlier report, per scale."""
+    previous = {result["scale"]: result for result in baseline["results"]}
+    print(f"vs {baseline.get('revision')} ({baseline.get('created_at')}):")
+    for result in report["results"]:
+        old = previous.get(result["scale"])
+        if old is None:
+            continue
+        changes = []
+        for key in ("fees_per_second", "postprocess_seconds", "json_load_seconds", "peak_rss_mb"):
+            if old.get(key) and result.get(key) is not None:
+                changes.append(f"{key} {100 * (result[key] - old[key]) / old[key]:+.1f}%")
+        print(f"  {result['scale']}x: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end extraction benchmark on synthetic CDR corpora.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Multiples of BASE_PRODUCTS products per bank")
+    parser.add_argument("--banks", type=int, default=BASE_BANKS)
+    parser.add_argument("--products", type=int, default=BASE_PRODUCTS, help="Products per bank at scale 1")
+    parser.add_argument("--fees-per-product", type=int, default=4)
+    parser.add_argument("--engine", choices=["sync", "async"], default="async")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--no-cache", dest="cache", action="store_false")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub LLM latency per call, in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/extraction_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("scales", "output", "baseline")}
+    report = {
+        "benchmark": "extraction",
+        "revision": _git_revision(),
+        "prompt_version": PROMPT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": [],
+    }
+
+    # A fresh process per scale, so each peak RSS and warm-up is its own.
+    context = multiprocessing.get_context("spawn")
+    for scale in args.scales:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scale, (config, scale))
+        report["results"].append(result)
+        print(
+            f"{scale}x: {result['products']} products / {result['fees']} fees in {result['run_seconds']}s "
+            f"({result['products_per_second']} products/s, {result['fees_per_second']} fees/s), "
+            f"load {result['json_load_seconds']}s, post-processing {result['postprocess_seconds']}s, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+
+    output_path = Path(args.output) if args.output else Path(RESULTS_DIR) / f"extraction_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import copy
+import random
+import time
+
+from Agent import Agent, NOT_FOUND, SCHEMA
+
+# Benchmark of fee post-processing (Agent._postprocess_extraction + _flatten_extracted)
+# against the previous multi-pass pipeline, on synthetic model responses. Both
+# pipelines must produce identical records before anything is timed.
+FEE_TYPES = SCHEMA["schema"]["properties"]["extracted_fees"]["items"]["properties"]["feeType"]["enum"]
+FEE_NAMES = ["Monthly Account Fee", "Cheque Fee", "Overseas ATM Withdrawal", "Dishonour Fee", "Special Service Fee", "Loan Account Fee"]
+
+
+class LegacyPipeline:
+    """The post-processing passes as they were before the single-pass normalizer."""
+
+    @staticmethod
+    def strip_null_values(obj):
+        if isinstance(obj, dict):
+            return {k: LegacyPipeline.strip_null_values(v) for k, v in obj.items() if v is not None}
+        elif isinstance(obj, list):
+            return [LegacyPipeline.strip_null_values(item) for item in obj]
+        return obj
+
+    @staticmethod
+    def reorder_fee_fields(fee_dict):
+        ordered_fee = {}
+        for field in Agent._FEE_FIELD_ORDER:
+            if field in fee_dict:
+                ordered_fee[field] = fee_dict[field]
+        for key, value in fee_dict.items():
+            if key not in ordered_fee:
+                ordered_fee[key] = value
+        return ordered_fee
+
+    @staticmethod
+    def ensure_fee_method_shape(fee: dict) -> None:
+        fee_method = fee.get("feeMethodUType")
+        if not fee_method:
+            if "fixedAmount" in fee:
+                fee_method = "fixedAmount"
+            elif "rateBased" in fee:
+                fee_method = "rateBased"
+            elif "variable" in fee:
+                fee_method = "variable"
+            else:
+                fee_method = NOT_FOUND
+            fee["feeMethodUType"] = fee_method
+
+        if fee_method == NOT_FOUND:
+            for method in Agent._FEE_METHODS:
+                fee.pop(method, None)
+            return
+
+        if fee_method == "fixedAmount":
+            fee.pop("rateBased", None)
+            fee.pop("variable", None)
+            fixed = fee.get("fixedAmount")
+            if not isinstance(fixed, dict):
+                fixed = {}
+                fee["fixedAmount"] = fixed
+            amount = fixed.get("amount")
+            if amount is None or (isinstance(amount, str) and not amount.strip()):
+                fixed["amount"] = NOT_FOUND
+            elif isinstance(amount, (int, float)):
+                fixed["amount"] = f"{amount:.2f}"
+        elif fee_method in ("rateBased", "variable"):
+            for method in Agent._FEE_METHODS:
+                if method != fee_method:
+                    fee.pop(method, None)
+            if not isinstance(fee.get(fee_method), dict):
+                fee["feeMethodUType"] = NOT_FOUND
+                fee.pop(fee_method, None)
+        else:
+            fee["feeMethodUType"] = NOT_FOUND
+            for method in Agent._FEE_METHODS:
+                fee.pop(method, None)
+
+    @staticmethod
+    def normalize_fee(fee: dict, fee_name: str, source_text: str) -> None:
+        if not isinstance(fee.get("explanation"), str) or not fee["explanation"].strip():
+            fee["explanation"] = Agent._MISSING_EXPLANATION
+        fee.pop("explanationDetail", None)
+        override_fee_type = Agent._stabilize_fee_type(fee_name=fee_name, source_text=source_text)
+        if override_fee_type is not None:
+            fee["feeType"] = override_fee_type
+        if fee.get("feeType") not in Agent._FEE_TYPES:
+            fee["feeType"] = "OTHER"
+        LegacyPipeline.ensure_fee_method_shape(fee)
+
+    @staticmethod
+    def run(obj: dict, fee_name: str, source_text: str) -> list:
+        # Agent.extract() post-processing
+        obj = LegacyPipeline.strip_null_values(obj)
+        if not isinstance(obj.get("explanation"), str) or not obj["explanation"].strip():
+            obj["explanation"] = Agent._MISSING_EXPLANATION
+        obj.pop("explanationDetail", None)
+        for fee in obj["extracted_fees"]:
+            LegacyPipeline.normalize_fee(fee, fee.get("name", ""), source_text)
+            if "rateBased" in fee and "rate" in fee["rateBased"]:
+                fee["rateBased"]["rate"] = Agent.normalize_rate_string(fee["rateBased"]["rate"])
+            reordered = LegacyPipeline.reorder_fee_fields(fee)
+            fee.clear()
+            fee.update(reordered)
+
+        # run_agent flattening
+        records = []
+        for fee in obj["extracted_fees"]:
+            fee["name"] = fee_name
+            LegacyPipeline.normalize_fee(fee, fee_name, source_text)
+            records.append(LegacyPipeline.reorder_fee_fields(fee))
+        return records
+
+
+def synthetic_fee(rng: random.Random) -> dict:
+    """A model fee with the kinds of noise post-processing has to clean up."""
+    fee = {
+        "name": rng.choice(FEE_NAMES + [None]),
+        "feeType": rng.choice(FEE_TYPES + ["MONTHLY", None]),
+        "feeMethodUType": rng.choice(["fixedAmount", "rateBased", "variable", NOT_FOUND, "", "perUnit", None]),
+    }
+    if rng.random() < 0.6:
+        fee["fixedAmount"] = rng.choice([{"amount": "5.00"}, {"amount": 2.5}, {"amount": None}, {"amount": " "}, "5.00"])
+    if rng.random() < 0.4:
+        fee["rateBased"] = rng.choice([
+            {"rateType": "TRANSACTION", "rate": "3%", "accrualFrequency": None},
+            {"rateType": "BALANCE", "rate": "0.025"},
+            {"rateType": "TRANSACTION", "rate": "n/a"},
+            None,
+        ])
+    if rng.random() < 0.2:
+        fee["variable"] = {"min": "1.00", "max": "10.00"}
+    if rng.random() < 0.3:
+        fee["feeCap"] = rng.choice(["50.00", None])
+        fee["feeCapPeriod"] = "P1M"
+    fee["currency"] = rng.choice(["AUD", None])
+    fee["explanation"] = rng.choice(["Quoted \"$5 per month\".", "", None])
+    if rng.random() < 0.2:
+        fee["explanationDetail"] = {"amount": "from text", "note": None}
+    if rng.random() < 0.1:
+        fee["waiverConditions"] = {"detail": "waived with $2000 deposits", "extra": None}
+    return fee
+
+
+def synthetic_responses(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(count):
+        fee_name = rng.choice(FEE_NAMES)
+        obj = {
+            "bank": "Synthetic Bank",
+            "product": "Everyday Account",
+            "explanation": rng.choice(["Fees quoted from text.", None, ""]),
+            "extracted_fees": [synthetic_fee(rng) for _ in range(rng.randint(1, 3))],
+        }
+        if rng.random() < 0.2:
+            obj["explanationDetail"] = "verbose"
+        responses.append((obj, fee_name, rng.choice(["Monthly fee of $5", "Charged per overseas withdrawal", fee_name])))
+    return responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fee post-processing benchmark against the previous multi-pass pipeline.")
+    parser.add_argument("--responses", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    agent = Agent.__new__(Agent)  # Post-processing needs no client or API key.
+
+    for count in args.responses:
+        responses = synthetic_responses(count)
+        legacy_inputs = copy.deepcopy(responses)
+        new_inputs = copy.deepcopy(responses)
+        fees = sum(len(obj["extracted_fees"]) for obj, _, _ in responses)
+
+        started = time.perf_counter()
+        legacy_records = [LegacyPipeline.run(obj, fee_name, text) for obj, fee_name, text in legacy_inputs]
+        legacy_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        new_records = [
+            agent._flatten_extracted(fee_name, text, agent._postprocess_extraction(obj, text, fee_name))
+            for obj, fee_name, text in new_inputs
+        ]
+        new_seconds = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for old, new in zip(legacy_records, new_records)
+            if [list(record.items()) for record in old] != [list(record.items()) for record in new]
+        )
+        if mismatches:
+            raise SystemExit(f"Single-pass output differs from the legacy pipeline on {mismatches}/{count} responses")
+
+        print(
+            f"{count} responses / {fees} fees: legacy {legacy_seconds * 1e6 / fees:.2f} us/fee, "
+            f"single-pass {new_seconds * 1e6 / fees:.2f} us/fee ({legacy_seconds / new_seconds:.1f}x), output identical"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+import time
+from pathlib import Path
+
+from FeeRuleEngine import match_fee_type
+from ProductDetailsStore import open_product_details
+
+# Micro-benchmark of the precompiled feeType keyword matcher against the original
+# sequential keyword scans, on Westpac's (fee name, source text) pairs.
+BANK_NAME = "Westpac"
+PRODUCT_DETAILS_PATH = "product_details/store"
+FALLBACK_OUTPUT_PATH = "output_Westpac_full.json"
+REPEATS = 200
+
+
+def legacy_stabilize_fee_type(fee_name: str, source_text: str):
+    """Agent._stabilize_fee_type before the rules were compiled."""
+    haystack = f"{fee_name} {source_text}".lower()
+    if any(k in haystack for k in ["prepayment", "pay out", "payout", "paid out", "refinanc", "discharge", "termination", "close", "closure", "exit"]):
+        return "EXIT"
+    if any(k in haystack for k in ["establishment", "application", "set up", "setup", "joining"]):
+        return "UPFRONT"
+    if any(k in haystack for k in ["missed payment", "late payment", "overdue", "default notice", "arrears"]):
+        return "LATE_PAYMENT"
+    if any(k in haystack for k in ["dishonour", "dishonor", "overdrawn", "nsf", "bounced"]):
+        return "DISHONOR"
+    if "cash advance" in haystack:
+        return "CASH_ADVANCE"
+    if any(k in haystack for k in ["withdrawal", "atm"]):
+        return "WITHDRAWAL"
+    if "deposit" in haystack:
+        return "DEPOSIT"
+    if any(k in haystack for k in ["enquiry", "inquiry", "balance"]):
+        return "ENQUIRY"
+    if "replacement" in haystack:
+        return "REPLACEMENT"
+    if any(k in haystack for k in ["monthly", "per month", "annual", "per year", "yearly", "quarterly"]):
+        return "PERIODIC"
+    return None
+
+
+def load_pairs() -> list:
+    """(fee name, source text) per Westpac fee, as run_agent would classify them."""
+    if Path(PRODUCT_DETAILS_PATH).exists():
+        pairs = []
+        for product in open_product_details(PRODUCT_DETAILS_PATH).load(BANK_NAME).values():
+            if not isinstance(product, dict):
+                continue
+            for fee in product.get("body", {}).get("data", {}).get("fees", []):
+                if isinstance(fee, dict):
+                    name = fee.get("name", "")
+                    pairs.append((name, fee.get("additionalInfo", "").strip() or name))
+        return pairs
+
+    # No product details downloaded: use the fee names and explanations of the last output.
+    output = json.loads(Path(FALLBACK_OUTPUT_PATH).read_text(encoding="utf-8"))
+    return [
+        (fee.get("name", ""), fee.get("explanation", ""))
+        for product in output["products"]
+        for fee in product["extracted_fees"]
+    ]
+
+
+def timed(classify, pairs: list) -> float:
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        for fee_name, source_text in pairs:
+            classify(fee_name, source_text)
+    return time.perf_counter() - started
+
+
+def main():
+    pairs = load_pairs()
+
+    mismatches = [
+        pair for pair in pairs
+        if legacy_stabilize_fee_type(*pair) != ((match_fee_type(*pair) or (None,))[0])
+    ]
+    if mismatches:
+        raise SystemExit(f"Rule table disagrees with the original on {len(mismatches)} fees, e.g. {mismatches[0]}")
+
+    table = match_fee_type.__wrapped__
+    legacy_seconds = timed(legacy_stabilize_fee_type, pairs)
+    table_seconds = timed(table, pairs)
+    match_fee_type.cache_clear()
+    memoized_seconds = timed(match_fee_type, pairs)
+
+    calls = REPEATS * len(pairs)
+    print(f"{len(pairs)} fees x {REPEATS} repeats, results identical")
+    for label, seconds in (("original", legacy_seconds), ("table", table_seconds), ("memoized", memoized_seconds)):
+        print(f"  {label:<9} {seconds * 1e6 / calls:8.2f} us/fee  ({legacy_seconds / seconds:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import copy
+import json
+import pathlib
+import re
+
+from Agent import Agent
+from LLMBackend import StubBackend
+
+# Golden check of FeeRuleEngine (Agent.check_rules, MODE 6) against a recorded model run:
+# a slice of output_Westpac_full.json is turned back into CDR product details, and every fee
+# the rules resolve must match the model's recorded feeType and fee method.
+RECORDED_OUTPUT = pathlib.Path(__file__).with_name("output_Westpac_full.json")
+BANK = "Westpac"
+SLICE = ("PLUnsecured", "UnsecuredBusinessLoan", "HLFixed", "TrChoice", "PLFlexi", "HLPremiumOptionHomeloan")
+
+# Fees the model extracted from their name alone (no additionalInfo) are recorded like this.
+NAME_ONLY = re.compile(r'Fee name (?:is )?explicitly stated as:? "(?P<name>.*)"\.')
+
+
+def _agent() -> Agent:
+    return Agent(temperature=0, backend=StubBackend(), cache_path=None, usage_log_path=None)
+
+
+def _recorded() -> dict:
+    recorded = json.loads(RECORDED_OUTPUT.read_text(encoding="utf-8"))
+    return {**recorded, "products": [product for product in recorded["products"] if product["product_id"] in SLICE]}
+
+
+def _cdr_fee(record: dict) -> dict:
+    """The CDR fee the recorded extraction came from: name only, or name plus additionalInfo."""
+    name_only = NAME_ONLY.match(record["explanation"])
+    if name_only and name_only.group("name") == record["name"]:
+        return {"name": record["name"]}
+    return {"name": record["name"], "additionalInfo": record["explanation"]}
+
+
+def _write_bank(tmp_path, recorded: dict, overrides: dict = None) -> str:
+    products = {}
+    for product in recorded["products"]:
+        fees = {}
+        for record in product["extracted_fees"]:
+            fees.setdefault(record["name"], _cdr_fee(record))
+        for fee in fees.values():
+            fee.update((overrides or {}).get((product["product_id"], fee["name"]), {}))
+        data = {"name": product["product_name"], "brandName": BANK, "fees": list(fees.values())}
+        products[product["product_id"]] = {"body": {"data": data}}
+
+    path = tmp_path / "product_details.json"
+    path.write_text(json.dumps({BANK: products}), encoding="utf-8")
+    return str(path)
+
+
+def _write_previous(tmp_path, recorded: dict) -> str:
+    path = tmp_path / "previous.json"
+    path.write_text(json.dumps(recorded), encoding="utf-8")
+    return str(path)
+
+
+def test_rules_match_recorded_model_output(tmp_path):
+    recorded = _recorded()
+    report = _agent().check_rules(BANK, _write_previous(tmp_path, recorded), _write_bank(tmp_path, recorded))
+
+    assert report["fees_resolved_by_rules"] == 14
+    assert report["compared"] == report["fees_resolved_by_rules"]
+    assert report["mismatches"] == []
+    assert report["match_pct"] == 100.0
+
+
+def test_malformed_cdr_values_fall_back_to_the_model(tmp_path):
+    # "$5" and "395" are not AmountStrings, so these rule results fail validation.
+    recorded = _recorded()
+    overrides = {
+        ("PLUnsecured", "Lending Establishment Fee"): {"amount": "$5"},
+        ("HLFixed", "Loan Discharge Fee"): {"amount": "395"},
+    }
+    report = _agent().check_rules(BANK, _write_previous(tmp_path, recorded), _write_bank(tmp_path, recorded, overrides))
+
+    assert report["rules_invalid_fees"] == 2
+    assert report["fees_resolved_by_rules"] == 12
+    assert report["mismatches"] == []
+
+
+def test_rule_disagreement_is_reported(tmp_path):
+    recorded = _recorded()
+    previous = copy.deepcopy(recorded)
+    for product in previous["products"]:
+        for record in product["extracted_fees"]:
+            if (product["product_id"], record["name"]) == ("HLFixed", "Loan Discharge Fee"):
+                record["feeType"] = "OTHER"
+
+    report = _agent().check_rules(BANK, _write_previous(tmp_path, previous), _write_bank(tmp_path, recorded))
+
+    assert report["matched"] == 13
+    assert [mismatch["name"] for mismatch in report["mismatches"]] == ["Loan Discharge Fee"]